@@ -0,0 +1,319 @@
+import os
+import re
+import shutil
+import zipfile
+
+# File extensions tried, in order, when a reference omits one
+GRAPHICS_EXTENSIONS = ['', '.pdf', '.png', '.jpg', '.jpeg', '.eps']
+TEX_EXTENSIONS = ['.tex', '']
+BIB_EXTENSIONS = ['.bib', '']
+
+# Already-compressed formats are stored as-is in ZIP bundles
+STORED_EXTENSIONS = {'.png', '.jpg', '.jpeg', '.pdf', '.gz', '.zip'}
+
+COMMENT_PATTERN = re.compile(r'(?<!\\)%.*')
+GRAPHICS_PATTERN = re.compile(r'\\includegraphics\*?\s*(?:\[[^\]]*\])?\s*{([^}]*)}')
+INPUT_PATTERN = re.compile(r'\\(?:input|include|subfile)\s*{([^}]*)}')
+LISTING_PATTERN = re.compile(r'\\lstinputlisting\s*(?:\[[^\]]*\])?\s*{([^}]*)}')
+BIBLIOGRAPHY_PATTERN = re.compile(r'\\(?:bibliography|addbibresource)\s*(?:\[[^\]]*\])?\s*{([^}]*)}')
+BIBSTYLE_PATTERN = re.compile(r'\\bibliographystyle\s*{([^}]*)}')
+CITE_PATTERN = re.compile(r'\\(?:no)?cite[a-zA-Z]*\*?\s*(?:\[[^\]]*\]\s*){0,2}{([^}]*)}')
+PACKAGE_PATTERN = re.compile(r'\\(?:usepackage|RequirePackage|documentclass)\s*(?:\[[^\]]*\])?\s*{([^}]*)}')
+GRAPHICSPATH_PATTERN = re.compile(r'\\graphicspath\s*{((?:{[^}]*})+)}')
+BRACE_PATTERN = re.compile(r'[{}]')
+
+# FICLONE ioctl request number (Linux), used for copy-on-write reflinks
+FICLONE = 0x40049409
+
+
+def strip_comments(content):
+    """Remove LaTeX comments so commented-out references are ignored"""
+    return COMMENT_PATTERN.sub('', content)
+
+
+def _split_names(group):
+    return [name.strip() for name in group.split(',') if name.strip()]
+
+
+def scan_references(content):
+    """Return the files and citation keys referenced by a piece of LaTeX source"""
+    content = strip_comments(content)
+
+    graphics_paths = []
+    for match in GRAPHICSPATH_PATTERN.finditer(content):
+        graphics_paths.extend(re.findall(r'{([^}]*)}', match.group(1)))
+
+    citations = set()
+    for match in CITE_PATTERN.finditer(content):
+        citations.update(_split_names(match.group(1)))
+
+    bibliographies = []
+    for match in BIBLIOGRAPHY_PATTERN.finditer(content):
+        bibliographies.extend(_split_names(match.group(1)))
+
+    packages = []
+    for match in PACKAGE_PATTERN.finditer(content):
+        packages.extend(_split_names(match.group(1)))
+
+    return {
+        'graphics': [m.group(1).strip() for m in GRAPHICS_PATTERN.finditer(content)],
+        'graphics_paths': graphics_paths,
+        'inputs': [m.group(1).strip() for m in INPUT_PATTERN.finditer(content)],
+        'listings': [m.group(1).strip() for m in LISTING_PATTERN.finditer(content)],
+        'bibliographies': bibliographies,
+        'bibstyles': [m.group(1).strip() for m in BIBSTYLE_PATTERN.finditer(content)],
+        'packages': packages,
+        'citations': citations,
+    }
+
+
+def resolve_reference(source_dir, name, extensions, search_dirs=('',)):
+    """Resolve a referenced name to a path relative to source_dir, or None"""
+    for search_dir in search_dirs:
+        for extension in extensions:
+            relative = os.path.normpath(os.path.join(search_dir, name + extension))
+            # Only files inside the source tree can be bundled or staged
+            if os.path.isabs(relative) or relative.startswith(os.pardir):
+                continue
+            if os.path.isfile(os.path.join(source_dir, relative)):
+                return relative
+    return None
+
+
+class AssetSet:
+    """The files a document depends on, relative to its source directory"""
+
+    def __init__(self):
+        self.files = []
+        self.bibliographies = []
+        self.citations = set()
+        self.missing = []
+
+    def add(self, relative):
+        if relative not in self.files:
+            self.files.append(relative)
+
+
+def collect_assets(content, source_dir):
+    """Resolve every asset referenced by content, following \\input files"""
+    assets = AssetSet()
+    pending = [content]
+    visited = set()
+    graphics_dirs = ['']
+
+    while pending:
+        refs = scan_references(pending.pop())
+        assets.citations.update(refs['citations'])
+
+        for path in refs['graphics_paths']:
+            if path not in graphics_dirs:
+                graphics_dirs.append(path)
+
+        for name in refs['graphics']:
+            relative = resolve_reference(source_dir, name, GRAPHICS_EXTENSIONS, graphics_dirs)
+            if relative:
+                assets.add(relative)
+            else:
+                assets.missing.append(name)
+
+        for name in refs['listings']:
+            relative = resolve_reference(source_dir, name, [''])
+            if relative:
+                assets.add(relative)
+            else:
+                assets.missing.append(name)
+
+        for name in refs['bibliographies']:
+            relative = resolve_reference(source_dir, name, BIB_EXTENSIONS)
+            if relative is None:
+                assets.missing.append(name)
+            elif relative not in assets.bibliographies:
+                assets.bibliographies.append(relative)
+
+        # Local class, package and bibliography style files travel with the document
+        for name in refs['packages']:
+            for extension in ('.cls', '.sty'):
+                relative = resolve_reference(source_dir, name, [extension])
+                if relative:
+                    assets.add(relative)
+        for name in refs['bibstyles']:
+            relative = resolve_reference(source_dir, name, ['.bst'])
+            if relative:
+                assets.add(relative)
+
+        # Included files are scanned in turn for their own references
+        for name in refs['inputs']:
+            relative = resolve_reference(source_dir, name, TEX_EXTENSIONS)
+            if relative is None:
+                assets.missing.append(name)
+                continue
+            assets.add(relative)
+            if relative not in visited:
+                visited.add(relative)
+                with open(os.path.join(source_dir, relative), 'r', encoding='utf-8', errors='replace') as f:
+                    pending.append(f.read())
+
+    return assets
+
+
+def iter_bib_entries(bib_text):
+    """Yield (entry_type, key, text) for each @entry in a .bib file"""
+    pos = 0
+    while True:
+        start = bib_text.find('@', pos)
+        if start == -1:
+            return
+        brace = bib_text.find('{', start)
+        if brace == -1:
+            return
+        entry_type = bib_text[start + 1:brace].strip().lower()
+
+        # Walk to the matching closing brace of the entry
+        depth = 0
+        end = len(bib_text) - 1
+        for match in BRACE_PATTERN.finditer(bib_text, brace):
+            depth += 1 if match.group() == '{' else -1
+            if depth == 0:
+                end = match.start()
+                break
+
+        text = bib_text[start:end + 1]
+        key = bib_text[brace + 1:end].split(',', 1)[0].strip()
+        yield entry_type, key, text
+        pos = end + 1
+
+
+def prune_bibliography(bib_text, citations):
+    """Return a .bib text containing only the cited entries"""
+    if '*' in citations:
+        return bib_text
+
+    kept = []
+    for entry_type, key, text in iter_bib_entries(bib_text):
+        # @string and @preamble definitions may be used by any kept entry
+        if entry_type in ('string', 'preamble', 'comment') or key in citations:
+            kept.append(text)
+    return '\n\n'.join(kept) + '\n'
+
+
+def link_file(src, dst):
+    """Place src at dst without copying data where the filesystem allows it"""
+    os.makedirs(os.path.dirname(dst) or '.', exist_ok=True)
+    if os.path.exists(dst):
+        os.remove(dst)
+
+    try:
+        os.link(src, dst)
+        return 'hardlink'
+    except OSError:
+        pass
+
+    try:
+        import fcntl
+        with open(src, 'rb') as s, open(dst, 'wb') as d:
+            fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+        return 'reflink'
+    except (ImportError, OSError):
+        pass
+
+    # Plain streamed copy (sendfile on Linux)
+    shutil.copyfile(src, dst)
+    return 'copy'
+
+
+def symlink_file(src, dst):
+    """Symlink src at dst, falling back to link_file where symlinks are unavailable"""
+    os.makedirs(os.path.dirname(dst) or '.', exist_ok=True)
+    try:
+        os.symlink(os.path.abspath(src), dst)
+        return 'symlink'
+    except (OSError, NotImplementedError):
+        return link_file(src, dst)
+
+
+def stage_assets(content, source_dir, work_dir):
+    """Expose the files content references inside work_dir without copying them"""
+    assets = collect_assets(content, source_dir)
+    for relative in assets.files + assets.bibliographies:
+        target = os.path.join(work_dir, relative)
+        if not os.path.lexists(target):
+            symlink_file(os.path.join(source_dir, relative), target)
+    return assets
+
+
+def shadow_job_files(source_dir, work_dir, jobname='document'):
+    """Create empty stand-ins in work_dir for source_dir's own files named like the job
+
+    TeX looks in source_dir for what the build directory lacks, so a first
+    pass would otherwise read a stale document.aux, .toc or .bbl left there.
+    """
+    prefix = jobname + '.'
+    try:
+        names = os.listdir(source_dir)
+    except OSError:
+        return
+    for name in names:
+        target = os.path.join(work_dir, name)
+        if name.startswith(prefix) and not os.path.lexists(target):
+            open(target, 'w').close()
+
+
+def texinputs_environment(source_dir, env=None):
+    """Return an environment whose TeX search paths also cover source_dir
+
+    The build directory (".") comes first, so the filtered document.tex and
+    the build's own .aux, .toc and .bbl win over same-named files in
+    source_dir. A trailing path separator keeps the distribution's default
+    search path.
+    """
+    env = dict(os.environ if env is None else env)
+    for variable in ('TEXINPUTS', 'BIBINPUTS', 'BSTINPUTS'):
+        env[variable] = '.' + os.pathsep + source_dir + os.pathsep + env.get(variable, '')
+    return env
+
+
+def _bundle_entries(content, source_dir, tex_name, assets):
+    """Yield (archive_path, source_path or None, text or None) for a bundle"""
+    yield tex_name, None, content
+
+    for relative in assets.files:
+        yield relative, os.path.join(source_dir, relative), None
+
+    for relative in assets.bibliographies:
+        with open(os.path.join(source_dir, relative), 'r', encoding='utf-8', errors='replace') as f:
+            yield relative, None, prune_bibliography(f.read(), assets.citations)
+
+
+def write_bundle(content, source_dir, output_path, tex_name='document.tex'):
+    """Write content and only the assets it references to a directory or .zip
+
+    Returns the list of references that could not be resolved.
+    """
+    if os.path.abspath(output_path) == os.path.abspath(source_dir):
+        raise ValueError("Cannot bundle into the source directory")
+
+    assets = collect_assets(content, source_dir)
+    entries = _bundle_entries(content, source_dir, tex_name, assets)
+
+    if output_path.lower().endswith('.zip'):
+        with zipfile.ZipFile(output_path, 'w') as archive:
+            for name, source, text in entries:
+                name = name.replace(os.sep, '/')
+                if text is not None:
+                    archive.writestr(name, text, compress_type=zipfile.ZIP_DEFLATED)
+                else:
+                    extension = os.path.splitext(name)[1].lower()
+                    compression = zipfile.ZIP_STORED if extension in STORED_EXTENSIONS else zipfile.ZIP_DEFLATED
+                    archive.write(source, name, compress_type=compression)
+    else:
+        os.makedirs(output_path, exist_ok=True)
+        for name, source, text in entries:
+            target = os.path.join(output_path, name)
+            if text is not None:
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                with open(target, 'w', encoding='utf-8') as f:
+                    f.write(text)
+            elif os.path.abspath(source) != os.path.abspath(target):
+                link_file(source, target)
+
+    return assets.missing
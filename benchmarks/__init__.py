@@ -0,0 +1,4 @@
+"""Benchmarks for the indexing, filtering, TEX export and build pipeline
+
+Run with ``python -m benchmarks.run``; see ``--help`` for the options.
+"""
@@ -0,0 +1,88 @@
+"""Stand-in for pdflatex that writes a small PDF without needing TeX
+
+It looks up the .tex file and the previous pass's .aux along TEXINPUTS, as
+kpathsea does, touches every \\includegraphics target so staging is
+exercised, and writes .aux/.log/.pdf files the way a real pass would. The
+PDF records which .tex and .aux files were read.
+LRC_FAKE_ENGINE_SECONDS makes each pass take that long, like a real compile.
+"""
+import os
+import re
+import sys
+import time
+
+GRAPHICS_PATTERN = re.compile(r'\\includegraphics(?:\[[^\]]*\])?{([^}]*)}')
+
+PDF_TEMPLATE = (b'%PDF-1.4\n1 0 obj<</Type/Catalog/Pages 2 0 R>>endobj\n'
+                b'2 0 obj<</Type/Pages/Kids[]/Count 0>>endobj\n'
+                b'trailer<</Root 1 0 R>>\n%%EOF\n')
+
+
+def find_input(name):
+    """Return the first name found along TEXINPUTS (an empty entry: the current directory)"""
+    if os.path.isabs(name):
+        return name if os.path.isfile(name) else None
+    for directory in os.environ.get('TEXINPUTS', '').split(os.pathsep):
+        path = os.path.join(directory or '.', name)
+        if os.path.isfile(path):
+            return os.path.abspath(path)
+    return None
+
+
+def main(argv):
+    if '--version' in argv:
+        print("pdfTeX (fake benchmark engine)")
+        return 0
+
+    names = [arg for arg in argv if not arg.startswith('-')]
+    tex_file = names[-1] if names else 'document.tex'
+    jobname = os.path.splitext(os.path.basename(tex_file))[0]
+
+    tex_path = find_input(tex_file)
+    with open(tex_path, 'r', encoding='utf-8') as f:
+        content = f.read()
+    aux_path = find_input(jobname + '.aux')
+
+    # Reading each figure approximates the I/O a real engine does
+    for name in GRAPHICS_PATTERN.findall(content):
+        for extension in ('', '.png', '.pdf', '.jpg'):
+            if os.path.isfile(name + extension):
+                with open(name + extension, 'rb') as f:
+                    f.read()
+                break
+
+    time.sleep(float(os.environ.get('LRC_FAKE_ENGINE_SECONDS', 0)))
+
+    with open(jobname + '.aux', 'w', encoding='utf-8') as f:
+        f.write('\\relax\n')
+    if '-draftmode' not in argv:
+        with open(jobname + '.pdf', 'wb') as f:
+            f.write(PDF_TEMPLATE)
+            f.write(f"% input {tex_path}\n% aux {aux_path}\n".encode('utf-8'))
+    with open(jobname + '.log', 'w', encoding='utf-8') as f:
+        f.write(f"fake pdflatex: {len(content)} characters\n")
+        if '-draftmode' not in argv:
+            size = os.path.getsize(jobname + '.pdf')
+            f.write(f"Output written on {jobname}.pdf (1 page, {size} bytes).\n")
+    return 0
+
+
+def install(directory):
+    """Write an executable launcher for this engine into directory and return its path"""
+    os.makedirs(directory, exist_ok=True)
+    script = os.path.abspath(__file__)
+
+    if sys.platform == 'win32':
+        path = os.path.join(directory, 'pdflatex.bat')
+        with open(path, 'w') as f:
+            f.write(f'@"{sys.executable}" "{script}" %*\n')
+    else:
+        path = os.path.join(directory, 'pdflatex')
+        with open(path, 'w') as f:
+            f.write(f'#!/bin/sh\nexec "{sys.executable}" "{script}" "$@"\n')
+        os.chmod(path, 0o755)
+    return path
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
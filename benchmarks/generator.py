@@ -0,0 +1,88 @@
+import os
+import random
+import struct
+import zlib
+
+WORDS = ("report analysis revenue pricing market customer growth forecast quarter "
+         "strategy segment product region margin risk summary review outlook").split()
+
+LEVELS = ['section', 'subsection', 'subsubsection']
+
+
+def placeholder_png(size, seed=0):
+    """Return a size x size grayscale noise PNG (noise keeps it from compressing away)"""
+    rng = random.Random(seed)
+    rows = b''.join(b'\x00' + rng.getrandbits(8 * size).to_bytes(size, 'little') for _ in range(size))
+
+    def chunk(kind, data):
+        return (struct.pack('>I', len(data)) + kind + data +
+                struct.pack('>I', zlib.crc32(kind + data) & 0xffffffff))
+
+    header = struct.pack('>IIBBBBB', size, size, 8, 0, 0, 0, 0)
+    return (b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', header) +
+            chunk(b'IDAT', zlib.compress(rows)) + chunk(b'IEND', b''))
+
+
+def _paragraph(rng, size):
+    """Return roughly size characters of filler text"""
+    words = []
+    length = 0
+    while length < size:
+        word = rng.choice(WORDS)
+        words.append(word)
+        length += len(word) + 1
+    return ' '.join(words)
+
+
+def generate_document(directory, sections=50, depth=2, body_size=2000,
+                      includes=0, figures=0, figure_size=64, seed=0):
+    """Write a synthetic LaTeX project into directory and return the main .tex path
+
+    sections is the number of top-level sections, each with depth levels of
+    nested subsections below it; body_size is the filler text per header.
+    Figures (figure_size pixels square) and \\input files are spread evenly
+    over the sections.
+    """
+    rng = random.Random(seed)
+    os.makedirs(directory, exist_ok=True)
+
+    if figures:
+        os.makedirs(os.path.join(directory, 'figures'), exist_ok=True)
+        image = placeholder_png(figure_size, seed)
+        for i in range(figures):
+            with open(os.path.join(directory, 'figures', f'figure{i}.png'), 'wb') as f:
+                f.write(image)
+
+    if includes:
+        os.makedirs(os.path.join(directory, 'chapters'), exist_ok=True)
+        for i in range(includes):
+            with open(os.path.join(directory, 'chapters', f'part{i}.tex'), 'w', encoding='utf-8') as f:
+                f.write(_paragraph(rng, body_size) + '\n')
+
+    parts = [
+        '\\documentclass{article}\n',
+        '\\usepackage{graphicx}\n',
+        '\\begin{document}\n',
+        '\\title{Synthetic Report}\n\\maketitle\n',
+    ]
+
+    for s in range(sections):
+        parts.append(f'\\section{{Section {s}}}\n{_paragraph(rng, body_size)}\n')
+        if figures:
+            for i in range(s * figures // sections, (s + 1) * figures // sections):
+                parts.append(f'\\includegraphics[width=0.5\\textwidth]{{figures/figure{i}}}\n')
+        if includes:
+            for i in range(s * includes // sections, (s + 1) * includes // sections):
+                parts.append(f'\\input{{chapters/part{i}}}\n')
+
+        # One header per nesting level, e.g. subsection then subsubsection
+        for level in range(1, min(depth, len(LEVELS) - 1) + 1):
+            for n in range(2):
+                parts.append(f'\\{LEVELS[level]}{{Part {s}.{level}.{n}}}\n{_paragraph(rng, body_size)}\n')
+
+    parts.append('\\end{document}\n')
+
+    path = os.path.join(directory, 'main.tex')
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(''.join(parts))
+    return path
@@ -0,0 +1,181 @@
+"""Run the pipeline benchmarks on a synthetic document
+
+    python -m benchmarks.run --sections 500 --json results.json
+    python -m benchmarks.run --json new.json --compare results.json
+
+Builds use a fake pdflatex unless --engine points at a real one.
+"""
+import io
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import statistics
+import tracemalloc
+import contextlib
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks import fake_pdflatex
+from benchmarks.generator import generate_document
+from latex_processor import LaTeXProcessingThread, TexExportThread
+from section_index import SectionIndex
+
+
+def measure(function, repeats):
+    """Time function repeats times, then run it once more under tracemalloc"""
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    try:
+        function()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'repeats': repeats,
+        'min': min(timings),
+        'median': statistics.median(timings),
+        'mean': statistics.mean(timings),
+        'peak_bytes': peak,
+    }
+
+
+def run_thread(thread):
+    """Run a processing thread's work synchronously and fail loudly on errors"""
+    results = []
+    thread.finished_signal.connect(lambda success, message: results.append((success, message)))
+    thread.run()
+    if not results or not results[0][0]:
+        raise RuntimeError(results[0][1] if results else "thread did not report completion")
+
+
+def run_benchmarks(args, work_dir):
+    """Generate the document and return the benchmark results keyed by stage"""
+    tex_file = generate_document(
+        os.path.join(work_dir, 'source'), sections=args.sections, depth=args.depth,
+        body_size=args.body_size, includes=args.includes, figures=args.figures,
+        figure_size=args.figure_size, seed=args.seed
+    )
+    with open(tex_file, 'r', encoding='utf-8') as f:
+        content = f.read()
+
+    index = SectionIndex(content)
+    # Every other top-level section, with all of its subsections
+    selected = []
+    top_level = -1
+    for span in index.spans:
+        if span.parent is None:
+            top_level += 1
+        if top_level % 2 == 0:
+            selected.append(span.key)
+
+    engine = args.engine or fake_pdflatex.install(os.path.join(work_dir, 'bin'))
+    output_dir = os.path.join(work_dir, 'output')
+    os.makedirs(output_dir)
+
+    processor = LaTeXProcessingThread(tex_file, os.path.join(output_dir, 'out.pdf'), selected, engine)
+
+    stages = {
+        'index': lambda: SectionIndex(content),
+        'filter': lambda: processor.process_latex_content(content),
+        'tex_export': lambda: run_thread(
+            TexExportThread(tex_file, os.path.join(output_dir, 'out.tex'), selected)),
+        'build': lambda: run_thread(
+            LaTeXProcessingThread(tex_file, os.path.join(output_dir, 'out.pdf'), selected, engine)),
+    }
+
+    results = {}
+    for name, function in stages.items():
+        if args.only and name not in args.only:
+            continue
+        repeats = args.build_repeats if name == 'build' else args.repeats
+        # The pipeline logs to stdout; keep it out of the measurements' output
+        with contextlib.redirect_stdout(io.StringIO()):
+            results[name] = measure(function, repeats)
+        results[name]['document_bytes'] = len(content.encode('utf-8'))
+        results[name]['components'] = len(index.spans)
+    return results
+
+
+def compare(results, baseline, threshold):
+    """Print median timings against a baseline run; return True if any regressed"""
+    regressed = False
+    print(f"{'stage':<12}{'baseline':>12}{'current':>12}{'ratio':>8}")
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        old = baseline[name]['median']
+        ratio = result['median'] / old if old else float('inf')
+        flag = ''
+        if ratio > threshold:
+            flag = '  SLOWER'
+            regressed = True
+        print(f"{name:<12}{old * 1000:>10.2f}ms{result['median'] * 1000:>10.2f}ms{ratio:>8.2f}{flag}")
+    return regressed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the LaTeX Report Customizer pipeline")
+    parser.add_argument('--sections', type=int, default=200, help="top-level sections")
+    parser.add_argument('--depth', type=int, default=2, help="subsection nesting depth (0-2)")
+    parser.add_argument('--body-size', type=int, default=2000, help="filler characters per header")
+    parser.add_argument('--includes', type=int, default=20, help="\\input files")
+    parser.add_argument('--figures', type=int, default=50, help="\\includegraphics figures")
+    parser.add_argument('--figure-size', type=int, default=64, help="figure width/height in pixels")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeats', type=int, default=10, help="repeats for in-memory stages")
+    parser.add_argument('--build-repeats', type=int, default=3, help="repeats for end-to-end builds")
+    parser.add_argument('--only', nargs='+', help="run only these stages")
+    parser.add_argument('--engine', help="real pdflatex to use instead of the fake engine")
+    parser.add_argument('--json', help="write results to this file")
+    parser.add_argument('--compare', help="baseline JSON results to compare against")
+    parser.add_argument('--threshold', type=float, default=1.10,
+                        help="ratio above which a stage counts as regressed")
+    args = parser.parse_args(argv)
+
+    work_dir = tempfile.mkdtemp(prefix="latex_bench_")
+    try:
+        results = run_benchmarks(args, work_dir)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    print(f"{'stage':<12}{'min':>10}{'median':>10}{'peak MiB':>10}")
+    for name, result in results.items():
+        print(f"{name:<12}{result['min'] * 1000:>8.2f}ms{result['median'] * 1000:>8.2f}ms"
+              f"{result['peak_bytes'] / 2 ** 20:>10.2f}")
+
+    if args.json:
+        report = {
+            'meta': {
+                'timestamp': time.time(),
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'parameters': {k: v for k, v in vars(args).items()
+                               if k not in ('json', 'compare', 'threshold')},
+            },
+            'results': results,
+        }
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)['results']
+        print()
+        if compare(results, baseline, args.threshold):
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,90 @@
+"""Measure the application's time to first paint against a budget
+
+    python -m benchmarks.startup --runs 5 --budget-ms 300
+
+Each run starts a fresh interpreter, so the time includes Python startup and
+all imports. The command exits with status 1 when the median exceeds the budget.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def child():
+    """Start the application, report timings on stdout and quit"""
+    spawned = float(os.environ['LRC_STARTUP_SPAWNED'])
+    sys.path.insert(0, ROOT)
+
+    import main
+
+    app, window = main.create_application(sys.argv[:1])
+    timings = {}
+
+    def first_painted(_):
+        timings['first_paint'] = time.time() - spawned
+
+    def startup_finished(_):
+        timings['ready'] = time.time() - spawned
+        print(json.dumps(timings))
+        app.quit()
+
+    window.first_painted.connect(first_painted)
+    window.startup_finished.connect(startup_finished)
+    app.exec_()
+
+
+def measure_once(env):
+    env = dict(env, LRC_STARTUP_SPAWNED=repr(time.time()))
+    result = subprocess.run(
+        [sys.executable, '-m', 'benchmarks.startup', '--child'],
+        cwd=ROOT, env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=60
+    )
+    for line in result.stdout.decode('utf-8', errors='replace').splitlines():
+        if line.startswith('{'):
+            return json.loads(line)
+    raise RuntimeError(f"startup run failed:\n{result.stderr.decode('utf-8', errors='replace')}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark time to first paint")
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--budget-ms', type=float, default=300.0,
+                        help="maximum median time to first paint")
+    parser.add_argument('--json', help="write results to this file")
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        child()
+        return 0
+
+    env = dict(os.environ)
+    # Headless machines (CI) have no display to paint on
+    if sys.platform.startswith('linux') and not (env.get('DISPLAY') or env.get('WAYLAND_DISPLAY')):
+        env.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+    runs = [measure_once(env) for _ in range(args.runs)]
+    first_paint = statistics.median(run['first_paint'] for run in runs) * 1000
+    ready = statistics.median(run['ready'] for run in runs) * 1000
+
+    print(f"first paint: {first_paint:.0f} ms (budget {args.budget_ms:.0f} ms)")
+    print(f"ready:       {ready:.0f} ms")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'budget_ms': args.budget_ms, 'runs': runs}, f, indent=2)
+
+    if first_paint > args.budget_ms:
+        print("Startup budget exceeded")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,172 @@
+"""Run builds on several local build worker processes
+
+    python -m benchmarks.workers --workers 3 --slots 2 --builds 12
+
+Starts the workers on free ports, each with its own blob store as if it ran on
+another machine, and builds a synthetic report's variants through a
+WorkerPool in three rounds: cold (every file is shipped), warm (the workers
+already hold every file) and lost (the blob stores were wiped, so the client
+must notice and upload again). The command exits with status 1 if any build
+fails. Builds use a fake pdflatex unless --engine points at a real one.
+"""
+import io
+import os
+import re
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+import contextlib
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks import fake_pdflatex
+from benchmarks.generator import generate_document
+from build_workers import RemoteWorker, WorkerPool, WorkerSession
+from section_index import SectionIndex
+
+LISTENING_PATTERN = re.compile(r'listening on (\S+):(\d+)')
+START_TIMEOUT = 30
+
+
+def start_worker(engine, slots, blob_dir, env):
+    """Start a worker on a free port; returns (process, (host, port))"""
+    process = subprocess.Popen(
+        [sys.executable, os.path.join(ROOT, 'build_workers.py'), 'serve', '--port', '0',
+         '--slots', str(slots), '--engine', engine, '--blobs', blob_dir],
+        cwd=ROOT, env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT
+    )
+    deadline = time.monotonic() + START_TIMEOUT
+    output = []
+    while time.monotonic() < deadline:
+        line = process.stdout.readline().decode('utf-8', errors='replace')
+        if not line:
+            break
+        output.append(line)
+        match = LISTENING_PATTERN.search(line)
+        if match:
+            return process, (match.group(1), int(match.group(2)))
+    process.kill()
+    process.wait()
+    raise RuntimeError("Build worker did not start:\n" + ''.join(output))
+
+
+def variants(content, count):
+    """Return count filtered documents, each keeping a different share of the sections"""
+    index = SectionIndex(content)
+    documents = []
+    for number in range(count):
+        # Two top-level sections in three, with all of their subsections
+        selected = []
+        top_level = -1
+        for span in index.spans:
+            if span.parent is None:
+                top_level += 1
+            if (top_level + number) % 3 != 0:
+                selected.append(span.key)
+        documents.append(index.render(selected))
+    return documents
+
+
+def received(pool):
+    """Total files the pool's workers have been sent so far"""
+    total = 0
+    for worker in pool.workers:
+        session = WorkerSession(RemoteWorker(worker.address), pool.token)
+        try:
+            reply, _ = session.call({'op': 'status'})
+        finally:
+            session.close()
+        total += reply.get('blobs_received', 0)
+    return total
+
+
+def run_round(pool, documents, source_dir, output_dir):
+    """Build every document through the pool; returns (seconds, files shipped, failures)"""
+    before = received(pool)
+    start = time.perf_counter()
+
+    def build(item):
+        number, content = item
+        output = os.path.join(output_dir, f'variant-{number}.pdf')
+        try:
+            pool.build(content, source_dir, output)
+        except Exception as e:
+            return f"variant {number}: {str(e)}"
+        return None if os.path.exists(output) else f"variant {number}: no PDF"
+
+    with ThreadPoolExecutor(max_workers=max(1, pool.total_slots())) as executor:
+        failures = [failure for failure in executor.map(build, enumerate(documents)) if failure]
+    return time.perf_counter() - start, received(pool) - before, failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark builds on local build workers")
+    parser.add_argument('--workers', type=int, default=3, help="worker processes to start")
+    parser.add_argument('--slots', type=int, default=2, help="builds each worker runs at a time")
+    parser.add_argument('--builds', type=int, default=12, help="variants built per round")
+    parser.add_argument('--sections', type=int, default=60, help="top-level sections")
+    parser.add_argument('--figures', type=int, default=30, help="\\includegraphics figures")
+    parser.add_argument('--compile-seconds', type=float, default=0.2,
+                        help="time each pass of the fake engine takes")
+    parser.add_argument('--engine', help="real pdflatex to use instead of the fake engine")
+    args = parser.parse_args(argv)
+
+    work_dir = tempfile.mkdtemp(prefix="latex_workers_bench_")
+    processes = []
+    try:
+        tex_file = generate_document(os.path.join(work_dir, 'source'), sections=args.sections,
+                                     figures=args.figures)
+        with open(tex_file, 'r', encoding='utf-8') as f:
+            documents = variants(f.read(), args.builds)
+        source_dir = os.path.dirname(tex_file)
+        output_dir = os.path.join(work_dir, 'output')
+        os.makedirs(output_dir)
+
+        engine = args.engine or fake_pdflatex.install(os.path.join(work_dir, 'bin'))
+        env = dict(os.environ, PYTHONUNBUFFERED='1', LRC_FAKE_ENGINE_SECONDS=str(args.compile_seconds))
+        env.pop('LRC_WORKER_TOKEN', None)
+        blob_dirs = [os.path.join(work_dir, f'worker-{number}') for number in range(args.workers)]
+        addresses = []
+        for blob_dir in blob_dirs:
+            process, address = start_worker(engine, args.slots, blob_dir, env)
+            processes.append(process)
+            addresses.append(address)
+        print(f"{args.workers} workers with {args.slots} slots: "
+              + ", ".join(f"{host}:{port}" for host, port in addresses))
+
+        pool = WorkerPool(addresses)
+        pool.probe()
+        failed = False
+        print(f"{'round':<8}{'builds':>8}{'seconds':>10}{'builds/s':>10}{'shipped':>9}")
+        for name in ('cold', 'warm', 'lost'):
+            if name == 'lost':
+                for blob_dir in blob_dirs:
+                    shutil.rmtree(blob_dir, ignore_errors=True)
+            # The pool logs retries and fallbacks to stdout; keep the table readable
+            with contextlib.redirect_stdout(io.StringIO()):
+                seconds, shipped, failures = run_round(pool, documents, source_dir, output_dir)
+            print(f"{name:<8}{len(documents):>8}{seconds:>10.2f}{len(documents) / seconds:>10.2f}{shipped:>9}")
+            for failure in failures:
+                print(f"  failed: {failure}")
+            failed = failed or bool(failures)
+        return 1 if failed else 0
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.wait()
+            process.stdout.close()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,142 @@
+import os
+import re
+import shutil
+import hashlib
+
+from build_cache import cache_dir, hash_file, store_file, touch, trim_cache
+from engine_runner import run_engine
+
+AUX_INPUT_PATTERN = re.compile(r'\\@input{([^}]*)}')
+BIBDATA_PATTERN = re.compile(r'\\bibdata{([^}]*)}')
+BIBSTYLE_AUX_PATTERN = re.compile(r'\\bibstyle{([^}]*)}')
+BCF_DATASOURCE_PATTERN = re.compile(r'<bcf:datasource[^>]*>([^<]*)</bcf:datasource>')
+
+# Lines of the .aux file that bibtex actually reads
+AUX_BIBTEX_PREFIXES = ('\\citation{', '\\bibdata{', '\\bibstyle{')
+
+# Size the cache of .bbl files is trimmed to, least recently used first
+BIBLIOGRAPHY_CACHE_BYTES = 64 << 20
+
+
+def find_tool(name, pdflatex_path=None):
+    """Locate bibtex/biber, preferring the distribution that provides pdflatex"""
+    if pdflatex_path and os.path.isabs(pdflatex_path):
+        for candidate in (name, name + '.exe'):
+            path = os.path.join(os.path.dirname(pdflatex_path), candidate)
+            if os.path.isfile(path):
+                return path
+    return shutil.which(name)
+
+
+def _read(path):
+    with open(path, 'r', encoding='utf-8', errors='replace') as f:
+        return f.read()
+
+
+def _aux_citation_lines(work_dir, aux_name, seen):
+    """Collect bibtex-relevant lines from an .aux file and the .aux files it inputs"""
+    if aux_name in seen:
+        return []
+    seen.add(aux_name)
+
+    path = os.path.join(work_dir, aux_name)
+    if not os.path.exists(path):
+        return []
+
+    lines = []
+    for line in _read(path).splitlines():
+        if line.startswith(AUX_BIBTEX_PREFIXES):
+            lines.append(line)
+        else:
+            match = AUX_INPUT_PATTERN.search(line)
+            if match:
+                lines.extend(_aux_citation_lines(work_dir, match.group(1), seen))
+    return lines
+
+
+def _hash_input_file(digest, name, search_dirs, extension='.bib'):
+    """Hash a .bib (or .bst) file by content when it can be found, otherwise by name"""
+    digest.update(name.encode('utf-8'))
+    for directory in search_dirs:
+        for candidate in (name, name + extension):
+            path = os.path.join(directory, candidate)
+            if os.path.isfile(path):
+                hash_file(path, digest)
+                return
+
+
+def bibliography_job(work_dir, jobname='document', source_dir=None):
+    """Return (tool, digest) for the citation data left by a pass, or (None, None)
+
+    The digest covers everything the tool reads: the citation data written by
+    LaTeX and the contents of the .bib files and local .bst style it names.
+    """
+    search_dirs = [work_dir] + ([source_dir] if source_dir else [])
+    digest = hashlib.sha256()
+
+    bcf = os.path.join(work_dir, jobname + '.bcf')
+    if os.path.exists(bcf):
+        bcf_text = _read(bcf)
+        digest.update(b'biber\0' + bcf_text.encode('utf-8'))
+        for name in BCF_DATASOURCE_PATTERN.findall(bcf_text):
+            _hash_input_file(digest, name.strip(), search_dirs)
+        return 'biber', digest.hexdigest()
+
+    lines = _aux_citation_lines(work_dir, jobname + '.aux', set())
+    if not any(line.startswith('\\bibdata{') for line in lines):
+        return None, None
+
+    digest.update(b'bibtex\0' + '\n'.join(lines).encode('utf-8'))
+    for line in lines:
+        match = BIBDATA_PATTERN.match(line)
+        if match:
+            for name in match.group(1).split(','):
+                _hash_input_file(digest, name.strip(), search_dirs)
+        match = BIBSTYLE_AUX_PATTERN.match(line)
+        if match:
+            # Styles from the distribution are not found here and count by name
+            _hash_input_file(digest, match.group(1).strip(), search_dirs, '.bst')
+    return 'bibtex', digest.hexdigest()
+
+
+def process_bibliography(work_dir, env=None, pdflatex_path=None, jobname='document', source_dir=None,
+                         limits=None, cancelled=None):
+    """Bring the job's .bbl up to date, running bibtex/biber only if its inputs changed
+
+    Returns None when the document has no bibliography, 'cached' when a .bbl
+    for identical inputs was reused, and 'ran' when the tool was run. The
+    tool runs under the engine watchdog with the given limits.
+    """
+    tool, digest = bibliography_job(work_dir, jobname, source_dir)
+    if tool is None:
+        return None
+
+    bbl = os.path.join(work_dir, jobname + '.bbl')
+    cache = cache_dir('bibliography')
+    cached_bbl = os.path.join(cache, digest + '.bbl')
+
+    if os.path.exists(cached_bbl):
+        shutil.copyfile(cached_bbl, bbl)
+        touch(cached_bbl)
+        print(f"Bibliography unchanged, reusing cached {tool} output")
+        return 'cached'
+
+    tool_path = find_tool(tool, pdflatex_path)
+    if tool_path is None:
+        print(f"{tool} not found, citations will be unresolved")
+        return None
+
+    print(f"Running {tool}...")
+    # An empty stand-in (see shadow_job_files) must not pass for the tool's output
+    if os.path.exists(bbl):
+        os.remove(bbl)
+    result = run_engine([tool_path, jobname], work_dir, env, limits, cancelled, name=tool)
+
+    # bibtex exits with 1 for warnings (e.g. a missing entry); only errors are fatal
+    if result.returncode > 1 or not os.path.exists(bbl):
+        output = result.stdout.decode('utf-8', errors='replace')
+        raise RuntimeError(f"{tool} failed:\n{output[-2000:]}")
+
+    store_file(bbl, cached_bbl)
+    trim_cache(cache, BIBLIOGRAPHY_CACHE_BYTES)
+    return 'ran'
@@ -0,0 +1,95 @@
+import os
+import sys
+import hashlib
+
+APP_NAME = "latex-report-customizer"
+
+
+def cache_dir(*parts):
+    """Return (and create) a per-user cache directory for build artefacts"""
+    if sys.platform == 'win32':
+        base = os.environ.get('LOCALAPPDATA', os.path.expanduser('~'))
+    elif sys.platform == 'darwin':
+        base = os.path.expanduser('~/Library/Caches')
+    else:
+        base = os.environ.get('XDG_CACHE_HOME', os.path.expanduser('~/.cache'))
+
+    path = os.path.join(base, APP_NAME, *parts)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def touch(path):
+    """Mark a cached file as used, so trim_cache() keeps it longer"""
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+
+
+def trim_cache(directory, max_bytes, keep=()):
+    """Delete the least recently used files in directory until it holds at most max_bytes
+
+    Paths in keep (files a build is using right now) are never deleted.
+    """
+    entries = []
+    for entry in os.scandir(directory):
+        try:
+            if entry.is_file(follow_symlinks=False) and not entry.name.endswith('.part'):
+                stat = entry.stat(follow_symlinks=False)
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        except OSError:
+            continue
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        if path in keep:
+            continue
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total -= size
+
+
+def hash_file(path, digest=None, chunk_size=1 << 20):
+    """Feed a file's contents into digest (a new sha256 if None) and return it"""
+    digest = digest if digest is not None else hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest
+
+
+def store_file(src, path):
+    """Copy src into the cache at path without exposing a partial file"""
+    partial = f"{path}.{os.getpid()}.part"
+    with open(src, 'rb') as s, open(partial, 'wb') as d:
+        while True:
+            chunk = s.read(1 << 20)
+            if not chunk:
+                break
+            d.write(chunk)
+    os.replace(partial, path)
+
+
+class InputDigests:
+    """Content digests of a document's files, re-read only when their size or mtime changed"""
+
+    def __init__(self, source_dir, known=None):
+        self.source_dir = source_dir
+        # relative path -> [mtime_ns, size, sha256]
+        self.known = known or {}
+
+    def digest(self, relative):
+        path = os.path.join(self.source_dir, relative)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return 'missing'
+        entry = self.known.get(relative)
+        if entry is None or entry[:2] != [stat.st_mtime_ns, stat.st_size]:
+            entry = [stat.st_mtime_ns, stat.st_size, hash_file(path).hexdigest()]
+            self.known[relative] = entry
+        return entry[2]
@@ -0,0 +1,269 @@
+"""Build history: what every PDF build took, kept in a local SQLite database
+
+    python build_history.py report [--document report.tex] [--limit 20]
+
+Each finished build records its stage durations, pdflatex pass count, cache
+hits, page count and output size under its document and selection. The
+history predicts how long the next build of a selection will take (the
+progress bars follow that estimate) and flags builds that were markedly
+slower than the ones before them. The latest MAX_BUILDS builds are kept.
+LRC_HISTORY_DB moves the database.
+"""
+import os
+import sys
+import json
+import time
+import sqlite3
+import hashlib
+import argparse
+import datetime
+import threading
+from statistics import median
+
+from build_cache import cache_dir
+
+# Builds of the same selection that predictions and regression checks look back on
+HISTORY_WINDOW = 10
+# A build is a regression when it took this much longer than the median of
+# at least MIN_HISTORY earlier builds, and more than MIN_SLOWDOWN seconds longer
+REGRESSION_RATIO = 1.5
+MIN_HISTORY = 3
+MIN_SLOWDOWN = 1.0
+# Predicted duration of a document's first build
+DEFAULT_SECONDS = 15.0
+# Builds kept in the database; older ones (and their stages) are deleted
+MAX_BUILDS = 10000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS builds (
+    id INTEGER PRIMARY KEY,
+    document TEXT NOT NULL,
+    selection TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    finished REAL NOT NULL,
+    success INTEGER NOT NULL,
+    seconds REAL NOT NULL,
+    components INTEGER,
+    passes INTEGER,
+    cache_hits INTEGER,
+    pages INTEGER,
+    size INTEGER,
+    regression TEXT
+);
+CREATE INDEX IF NOT EXISTS builds_by_key ON builds (document, selection, kind, finished);
+CREATE TABLE IF NOT EXISTS stages (
+    build INTEGER NOT NULL REFERENCES builds (id),
+    name TEXT NOT NULL,
+    seconds REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS stages_by_build ON stages (build);
+"""
+
+
+def database_path():
+    return os.environ.get('LRC_HISTORY_DB') or os.path.join(cache_dir(), 'history.sqlite3')
+
+
+def connect():
+    connection = sqlite3.connect(database_path(), timeout=10)
+    # Builds in other threads and processes (daemon, variants.py) write concurrently
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.executescript(SCHEMA)
+    return connection
+
+
+def selection_key(selected_components, order=None):
+    """Short stable name for a selection (and section order)"""
+    text = json.dumps([list(selected_components), order])
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()[:16]
+
+
+def _recent(connection, document, selection, kind, limit=HISTORY_WINDOW):
+    return connection.execute(
+        "SELECT id, seconds FROM builds WHERE document = ? AND selection = ? AND kind = ? AND success = 1 "
+        "ORDER BY finished DESC LIMIT ?", (document, selection, kind, limit)).fetchall()
+
+
+def predict_seconds(document, selection, kind):
+    """Expected duration of a build, from earlier builds of the closest kind"""
+    try:
+        connection = connect()
+    except sqlite3.Error:
+        return DEFAULT_SECONDS
+    try:
+        rows = _recent(connection, document, selection, kind, 5)
+        if not rows:
+            # Another selection of the same document, then any build of it
+            rows = connection.execute(
+                "SELECT id, seconds FROM builds WHERE document = ? AND success = 1 "
+                "ORDER BY kind != ?, finished DESC LIMIT 5", (document, kind)).fetchall()
+        return median(seconds for _, seconds in rows) if rows else DEFAULT_SECONDS
+    except sqlite3.Error:
+        return DEFAULT_SECONDS
+    finally:
+        connection.close()
+
+
+def record_build(document, selection, kind, success, seconds, tracer, components=None, pages=None, size=None):
+    """Store a finished build; returns a description if it was a regression, else None"""
+    stages = tracer.totals()
+    passes = sum(1 for span in tracer.spans if span.name.startswith("pdflatex pass"))
+    cache_hits = sum(tracer.counters.values())
+
+    connection = connect()
+    try:
+        regression = None
+        if success:
+            regression = _regression(connection, document, selection, kind, seconds, stages)
+        with connection:
+            cursor = connection.execute(
+                "INSERT INTO builds (document, selection, kind, finished, success, seconds, components, passes, "
+                "cache_hits, pages, size, regression) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (document, selection, kind, time.time(), int(success), seconds, components, passes,
+                 cache_hits, pages, size, regression))
+            connection.executemany("INSERT INTO stages (build, name, seconds) VALUES (?, ?, ?)",
+                                   [(cursor.lastrowid, name, total) for name, total, _ in stages])
+            _trim(connection, cursor.lastrowid)
+        return regression
+    finally:
+        connection.close()
+
+
+def _trim(connection, newest):
+    """Delete all but the latest MAX_BUILDS builds (ids grow with every insert)"""
+    oldest_kept = newest - MAX_BUILDS + 1
+    if connection.execute("SELECT 1 FROM builds WHERE id < ? LIMIT 1", (oldest_kept,)).fetchone():
+        connection.execute("DELETE FROM stages WHERE build < ?", (oldest_kept,))
+        connection.execute("DELETE FROM builds WHERE id < ?", (oldest_kept,))
+
+
+def _regression(connection, document, selection, kind, seconds, stages):
+    rows = _recent(connection, document, selection, kind)
+    if len(rows) < MIN_HISTORY:
+        return None
+    usual = median(previous for _, previous in rows)
+    if seconds < usual * REGRESSION_RATIO or seconds - usual < MIN_SLOWDOWN:
+        return None
+
+    # Name the stage that grew the most against its own median
+    ids = [build for build, _ in rows]
+    history = {}
+    query = f"SELECT name, seconds FROM stages WHERE build IN ({','.join('?' * len(ids))})"
+    for name, previous in connection.execute(query, ids):
+        history.setdefault(name, []).append(previous)
+    growth = [(total - median(history.get(name, [0.0])), name) for name, total, _ in stages]
+    note = f"{seconds:.1f} s, usually {usual:.1f} s"
+    if growth:
+        delta, name = max(growth)
+        if delta > 0:
+            note += f"; {name} +{delta:.1f} s"
+    return note
+
+
+def recent_builds(document=None, limit=50):
+    """Return the latest builds as dicts, newest first"""
+    connection = connect()
+    connection.row_factory = sqlite3.Row
+    try:
+        if document is None:
+            rows = connection.execute("SELECT * FROM builds ORDER BY finished DESC LIMIT ?", (limit,))
+        else:
+            rows = connection.execute("SELECT * FROM builds WHERE document = ? ORDER BY finished DESC LIMIT ?",
+                                      (document, limit))
+        return [dict(row) for row in rows]
+    finally:
+        connection.close()
+
+
+def trends(document=None):
+    """Per document, selection and kind: (key, builds, median s, latest s, regressions)"""
+    result = []
+    groups = {}
+    for build in reversed(recent_builds(document, limit=100000)):
+        key = (build['document'], build['selection'], build['kind'])
+        groups.setdefault(key, []).append(build)
+    for key, builds in groups.items():
+        successful = [build for build in builds if build['success']]
+        if not successful:
+            continue
+        result.append((key, successful, median(build['seconds'] for build in successful[-HISTORY_WINDOW:]),
+                       successful[-1]['seconds'], [build for build in successful if build['regression']]))
+    result.sort(key=lambda group: group[1][-1]['finished'], reverse=True)
+    return result
+
+
+class ProgressTicker(threading.Thread):
+    """Reports a build's progress from its elapsed time and predicted duration
+
+    Progress reaches 95% at the predicted time and then creeps towards 99%
+    until the build reports completion itself.
+    """
+
+    def __init__(self, emit, expected, interval=0.25):
+        super().__init__(daemon=True)
+        self.emit = emit
+        self.expected = max(expected, 0.1)
+        self.interval = interval
+        self.stopped = threading.Event()
+        self.started_at = time.perf_counter()
+
+    def progress(self):
+        elapsed = time.perf_counter() - self.started_at
+        if elapsed < self.expected:
+            return int(95 * elapsed / self.expected)
+        return int(95 + 4 * (1 - self.expected / elapsed))
+
+    def run(self):
+        last = None
+        while True:
+            value = self.progress()
+            if value != last:
+                self.emit(value)
+                last = value
+            if self.stopped.wait(self.interval):
+                return
+
+    def stop(self):
+        """Stop ticking; returns once the last progress value has been emitted"""
+        self.stopped.set()
+        if self.is_alive() and self is not threading.current_thread():
+            self.join()
+
+
+def format_size(size):
+    if size is None:
+        return '-'
+    return f"{size / 2 ** 20:.1f} MiB" if size >= 2 ** 20 else f"{size / 1024:.0f} KiB"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="LaTeX Report Customizer build history")
+    commands = parser.add_subparsers(dest='command', required=True)
+    report_parser = commands.add_parser('report', help="show build time trends and regressions")
+    report_parser.add_argument('--document', help="only builds of this LaTeX file")
+    report_parser.add_argument('--limit', type=int, default=20, help="selections to show (default: 20)")
+    args = parser.parse_args(argv)
+
+    document = os.path.abspath(args.document) if args.document else None
+    groups = trends(document)
+    if not groups:
+        print(f"No builds recorded in {database_path()}")
+        return 0
+
+    flagged = 0
+    for (path, selection, kind), builds, usual, latest, regressions in groups[:args.limit]:
+        last = builds[-1]
+        change = (latest - usual) / usual * 100 if usual else 0.0
+        print(f"{os.path.basename(path)} [{kind}] selection {selection} ({last['components']} selected)")
+        print(f"  {len(builds)} builds, median {usual:.1f} s, latest {latest:.1f} s ({change:+.0f}%), "
+              f"{last['passes']} passes, {last['pages'] or '-'} pages, {format_size(last['size'])}")
+        for build in regressions[-3:]:
+            when = datetime.datetime.fromtimestamp(build['finished']).strftime('%Y-%m-%d %H:%M')
+            print(f"  slower than usual on {when}: {build['regression']}")
+        flagged += len(regressions)
+    print(f"{flagged} regressions flagged")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,567 @@
+"""Remote build workers reached over a small TCP/JSON protocol
+
+    python build_workers.py serve [--host 0.0.0.0] [--port 7070] [--slots N] [--engine pdflatex] [--blobs DIR]
+    python build_workers.py status host:port [host:port ...]
+
+Clients list their workers in LRC_BUILD_WORKERS ("host:port,host:port");
+when LRC_WORKER_TOKEN is set, workers only accept clients sending the same
+token. Every message is one JSON line, followed by "size" bytes of payload
+when it carries a file. A build ships the filtered .tex and the files it
+references as blobs named by their SHA-256; a worker keeps the blobs it has
+received, and is only sent the ones it reports missing, so shared figures
+and bibliographies cross the network once per worker.
+
+A session (one connection) is:
+    hello {token}                      -> {ok, slots}
+    have {hashes}                      -> {ok, missing}
+    put {hash} + bytes                 -> {ok}          (repeated)
+    build {document, assets, preview}  -> {ok, message, trace} + PDF bytes
+
+A build whose blobs the worker no longer holds is answered with
+{ok: false, missing}; the client then uploads them again and retries once.
+"""
+import os
+import re
+import sys
+import hmac
+import json
+import time
+import random
+import select
+import socket
+import hashlib
+import argparse
+import threading
+import socketserver
+
+from assets import collect_assets, link_file
+from build_cache import InputDigests, cache_dir
+from engine_runner import EngineTerminated
+from latex_processor import BuildCancelled, LaTeXProcessingThread, place_file
+from tracing import Tracer
+from workspace import get_workspace
+
+DEFAULT_PORT = 7070
+# Largest file a worker accepts, and longest header line
+MAX_BLOB = 1 << 30
+MAX_HEADER = 1 << 20
+# Seconds before a worker that failed is tried again
+RETRY_DELAY = 30
+CONNECT_TIMEOUT = 10
+
+HASH_PATTERN = re.compile(r'^[0-9a-f]{64}$')
+
+
+class WorkersUnavailable(RuntimeError):
+    """No configured worker could take the build"""
+
+
+def send_message(writer, message, payload=b''):
+    header = dict(message, size=len(payload))
+    writer.write(json.dumps(header).encode('utf-8') + b'\n')
+    if payload:
+        writer.write(payload)
+    writer.flush()
+
+
+def read_message(reader, max_payload=MAX_BLOB):
+    """Return (message, payload), or (None, b'') at the end of the stream"""
+    line = reader.readline(MAX_HEADER)
+    if not line:
+        return None, b''
+    if not line.endswith(b'\n'):
+        raise ValueError("Message header too long")
+    message = json.loads(line)
+    if not isinstance(message, dict):
+        raise ValueError("Message header is not a JSON object")
+    try:
+        size = int(message.get('size', 0))
+    except (TypeError, ValueError):
+        raise ValueError("Invalid payload size")
+    if size < 0 or size > max_payload:
+        raise ValueError(f"Payload of {size} bytes refused")
+    payload = reader.read(size) if size else b''
+    if len(payload) != size:
+        raise ConnectionError("Connection closed in the middle of a message")
+    return message, payload
+
+
+def safe_relative(path):
+    """True if path stays inside the directory it is relative to"""
+    if not path or os.path.isabs(path) or path.startswith(('/', '\\')):
+        return False
+    parts = re.split(r'[\\/]', path)
+    return '..' not in parts and ':' not in parts[0]
+
+
+def parse_address(text):
+    host, _, port = text.strip().rpartition(':')
+    return (host or 'localhost', int(port or DEFAULT_PORT))
+
+
+# ---------------------------------------------------------------- worker side
+
+
+class BlobStore:
+    """Files received from clients, stored under their SHA-256"""
+
+    def __init__(self, directory=None):
+        self.directory = directory or cache_dir('worker-blobs')
+        self.received = 0
+
+    def path(self, digest):
+        return os.path.join(self.directory, digest[:2], digest)
+
+    def has(self, digest):
+        return os.path.exists(self.path(digest))
+
+    def put(self, digest, data):
+        if hashlib.sha256(data).hexdigest() != digest:
+            raise ValueError("Blob does not match its hash")
+        path = self.path(digest)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        partial = f"{path}.{os.getpid()}.{threading.get_ident()}.part"
+        with open(partial, 'wb') as f:
+            f.write(data)
+        os.replace(partial, path)
+        self.received += 1
+
+
+class BuildWorker:
+    """Compiles shipped documents, at most slots at a time"""
+
+    def __init__(self, slots=None, pdflatex_path=None, token=None, store=None):
+        if slots is None:
+            slots = max(1, (os.cpu_count() or 2) // 2)
+        if pdflatex_path is None:
+            from utils import check_latex_installation
+            _, pdflatex_path = check_latex_installation()
+        self.slots = slots
+        self.pdflatex_path = pdflatex_path
+        self.token = token
+        self.store = store or BlobStore()
+        self.semaphore = threading.BoundedSemaphore(slots)
+        self.lock = threading.Lock()
+        self.running = 0
+        self.completed = 0
+        self.workspace = get_workspace()
+        self.workspace.cleanup_stale()
+
+    def authorized(self, message):
+        if not self.token:
+            return True
+        return hmac.compare_digest(str(message.get('token', '')), self.token)
+
+    def status(self):
+        with self.lock:
+            return {'ok': True, 'pid': os.getpid(), 'slots': self.slots, 'running': self.running,
+                    'completed': self.completed, 'blobs_received': self.store.received}
+
+    def build(self, request):
+        """Compile a shipped document; returns (reply, pdf bytes)"""
+        document = request.get('document', '')
+        assets = request.get('assets', {})
+        if not isinstance(assets, dict):
+            return {'ok': False, 'message': "Assets must map paths to hashes"}, b''
+        files = [('document.tex', document)] + list(assets.items())
+        for relative, digest in files:
+            if not isinstance(relative, str) or not safe_relative(relative) \
+                    or not HASH_PATTERN.match(str(digest)):
+                return {'ok': False, 'message': f"Refused asset path {relative!r}"}, b''
+        missing = sorted({digest for _, digest in files if not self.store.has(digest)})
+        if missing:
+            # Blobs can vanish (cache cleared, worker reinstalled); the client re-sends them
+            return {'ok': False, 'message': f"Missing {len(missing)} input files", 'missing': missing}, b''
+
+        with self.semaphore:
+            with self.lock:
+                self.running += 1
+            source_dir = self.workspace.make_dir("remote_")
+            try:
+                for relative, digest in assets.items():
+                    link_file(self.store.path(digest), os.path.join(source_dir, relative))
+                with open(self.store.path(document), 'r', encoding='utf-8') as f:
+                    content = f.read()
+                output_pdf = os.path.join(source_dir, 'output.pdf')
+                job = LaTeXProcessingThread(os.path.join(source_dir, 'document.tex'), output_pdf, [],
+                                            self.pdflatex_path, preview=bool(request.get('preview')))
+                try:
+                    job.compile_latex(content, output_pdf=output_pdf)
+                except (BuildCancelled, EngineTerminated, RuntimeError) as e:
+                    reply = {'ok': False, 'message': str(e), 'trace': job.tracer.records()}
+                    if isinstance(e, EngineTerminated):
+                        reply['terminated'] = e.reason
+                    return reply, b''
+                with open(output_pdf, 'rb') as f:
+                    pdf = f.read()
+                return {'ok': True, 'message': "PDF generated successfully!", 'pages': job.pages,
+                        'trace': job.tracer.records()}, pdf
+            finally:
+                self.workspace.release(source_dir)
+                with self.lock:
+                    self.running -= 1
+                    self.completed += 1
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        worker = self.server.worker
+        authenticated = False
+        while True:
+            try:
+                message, payload = read_message(self.rfile)
+            except (ValueError, ConnectionError) as e:
+                send_message(self.wfile, {'ok': False, 'message': f"Malformed request: {str(e)}"})
+                return
+            if message is None:
+                return
+
+            op = message.get('op')
+            reply, data = {'ok': True}, b''
+            if op == 'hello':
+                authenticated = worker.authorized(message)
+                reply = {'ok': authenticated, 'slots': worker.slots}
+                if not authenticated:
+                    reply['message'] = "Wrong worker token"
+            elif not authenticated:
+                reply = {'ok': False, 'message': "Send hello first"}
+            elif op == 'status':
+                reply = worker.status()
+            elif op == 'have':
+                hashes = message.get('hashes', [])
+                if not isinstance(hashes, list):
+                    hashes = []
+                hashes = [h for h in hashes if HASH_PATTERN.match(str(h))]
+                reply = {'ok': True, 'missing': [h for h in hashes if not worker.store.has(h)]}
+            elif op == 'put':
+                digest = str(message.get('hash', ''))
+                try:
+                    if not HASH_PATTERN.match(digest):
+                        raise ValueError("Invalid hash")
+                    worker.store.put(digest, payload)
+                except (OSError, ValueError) as e:
+                    reply = {'ok': False, 'message': str(e)}
+            elif op == 'build':
+                reply, data = worker.build(message)
+            else:
+                reply = {'ok': False, 'message': f"Unknown request: {op}"}
+
+            send_message(self.wfile, reply, data)
+            if op == 'hello' and not authenticated:
+                return
+
+
+class _Server(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+def serve(host='127.0.0.1', port=DEFAULT_PORT, slots=None, pdflatex_path=None, blob_dir=None):
+    """Run a worker until interrupted"""
+    worker = BuildWorker(slots, pdflatex_path, token=os.environ.get('LRC_WORKER_TOKEN') or None,
+                         store=BlobStore(blob_dir) if blob_dir else None)
+    server = _Server((host, port), _RequestHandler)
+    server.worker = worker
+    print(f"Build worker listening on {host}:{server.server_address[1]} with {worker.slots} slots")
+    if host not in ('127.0.0.1', 'localhost', '::1') and not worker.token:
+        print("Warning: no LRC_WORKER_TOKEN set; anyone who can reach this port can run builds")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        worker.workspace.close()
+    return 0
+
+
+# ---------------------------------------------------------------- client side
+
+
+class RemoteWorker:
+    """A worker as seen by the client: its load and the blobs it is known to hold"""
+
+    def __init__(self, address):
+        self.address = address
+        self.slots = 1
+        self.active = 0
+        self.known = set()
+        self.down_until = 0
+
+    def __str__(self):
+        return f"{self.address[0]}:{self.address[1]}"
+
+
+class WorkerSession:
+    """One connection to a worker"""
+
+    def __init__(self, worker, token, timeout=None):
+        self.sock = socket.create_connection(worker.address, timeout=CONNECT_TIMEOUT)
+        self.sock.settimeout(timeout)
+        self.reader = self.sock.makefile('rb')
+        self.writer = self.sock.makefile('wb')
+        reply, _ = self.call({'op': 'hello', 'token': token or ''})
+        if not reply.get('ok'):
+            self.close()
+            raise ConnectionRefusedError(reply.get('message', "Worker refused the connection"))
+        worker.slots = max(1, int(reply.get('slots', 1)))
+
+    def call(self, message, payload=b'', cancelled=None):
+        send_message(self.writer, message, payload)
+        if cancelled is not None:
+            # The worker keeps compiling; the client just stops waiting for it
+            while not select.select([self.sock], [], [], 0.5)[0]:
+                if cancelled():
+                    raise BuildCancelled("Build cancelled")
+        reply, data = read_message(self.reader)
+        if reply is None:
+            raise ConnectionError("Worker closed the connection")
+        return reply, data
+
+    def close(self):
+        for stream in (self.reader, self.writer, self.sock):
+            try:
+                stream.close()
+            except OSError:
+                pass
+
+
+class WorkerPool:
+    """Dispatches builds to the least busy reachable worker"""
+
+    def __init__(self, addresses, token=None):
+        self.workers = [RemoteWorker(address) for address in addresses]
+        self.token = token
+        self.lock = threading.Lock()
+        # Per source directory, so unchanged files are hashed once per batch
+        self.digests = {}
+
+    @classmethod
+    def from_environment(cls):
+        """The pool named by LRC_BUILD_WORKERS, or None"""
+        spec = os.environ.get('LRC_BUILD_WORKERS', '').strip()
+        if not spec:
+            return None
+        return cls([parse_address(item) for item in spec.split(',') if item.strip()],
+                   os.environ.get('LRC_WORKER_TOKEN') or None)
+
+    def probe(self):
+        """Connect to every worker to learn its slots; returns the reachable ones"""
+        reachable = []
+        for worker in self.workers:
+            try:
+                WorkerSession(worker, self.token, timeout=CONNECT_TIMEOUT).close()
+            except OSError as e:
+                print(f"Build worker {worker} unreachable ({str(e)})")
+                worker.down_until = time.monotonic() + RETRY_DELAY
+                continue
+            reachable.append(worker)
+        return reachable
+
+    def total_slots(self):
+        return sum(worker.slots for worker in self.workers if worker.down_until <= time.monotonic())
+
+    def _acquire(self, tried):
+        with self.lock:
+            now = time.monotonic()
+            candidates = [w for w in self.workers if w not in tried and w.down_until <= now]
+            if not candidates:
+                return None
+            random.shuffle(candidates)
+            worker = min(candidates, key=lambda w: w.active / w.slots)
+            worker.active += 1
+            return worker
+
+    def _release(self, worker, failed=False):
+        with self.lock:
+            worker.active -= 1
+            if failed:
+                worker.down_until = time.monotonic() + RETRY_DELAY
+                worker.known.clear()
+
+    def build(self, content, source_dir, output_pdf, tracer=None, cancelled=None, preview=False):
+        """Compile content on a worker and write the PDF to output_pdf
+
+        Returns the worker used and the page count its log reported (None if it did not).
+        """
+        tracer = tracer or Tracer()
+        with tracer.span("hash inputs"):
+            files = self._files(content, source_dir)
+
+        tried = []
+        while True:
+            if cancelled is not None and cancelled():
+                raise BuildCancelled("Build cancelled")
+            worker = self._acquire(tried)
+            if worker is None:
+                raise WorkersUnavailable(
+                    "No build worker reachable (" + ", ".join(str(w) for w in self.workers) + ")")
+            tried.append(worker)
+            try:
+                reply, pdf = self._build_on(worker, content, files, tracer, cancelled, preview)
+            except BuildCancelled:
+                self._release(worker)
+                raise
+            except (OSError, ValueError) as e:
+                print(f"Build worker {worker} failed ({str(e)}), trying another")
+                self._release(worker, failed=True)
+                continue
+            self._release(worker)
+            break
+
+        if not reply.get('ok'):
+            if reply.get('terminated'):
+                raise EngineTerminated(reply.get('message', ''), reply['terminated'])
+            raise RuntimeError(f"{reply.get('message', 'Build failed')} (on {worker})")
+
+        workspace = get_workspace()
+        scratch = workspace.make_dir("fetched_")
+        try:
+            received = os.path.join(scratch, 'document.pdf')
+            with open(received, 'wb') as f:
+                f.write(pdf)
+            place_file(received, output_pdf)
+        finally:
+            workspace.release(scratch)
+        return worker, reply.get('pages')
+
+    def _files(self, content, source_dir):
+        """Return {relative path: (absolute path, sha256)} of the files content uses"""
+        digests = self.digests.setdefault(source_dir, InputDigests(source_dir))
+        assets = collect_assets(content, source_dir)
+        files = {}
+        for relative in assets.files + assets.bibliographies:
+            if not safe_relative(relative):
+                raise WorkersUnavailable(f"{relative} lies outside the document's directory")
+            digest = digests.digest(relative)
+            if digest != 'missing':
+                files[relative] = (os.path.join(source_dir, relative), digest)
+        return files
+
+    def _build_on(self, worker, content, files, tracer, cancelled=None, preview=False):
+        document = content.encode('utf-8')
+        document_hash = hashlib.sha256(document).hexdigest()
+        assets = {relative: digest for relative, (_, digest) in files.items()}
+        session = WorkerSession(worker, self.token)
+        try:
+            for attempt in range(2):
+                with tracer.span("ship inputs"):
+                    self._ship(session, worker, document, document_hash, files)
+                with tracer.span(f"remote build ({worker})"):
+                    sent = time.perf_counter_ns()
+                    reply, pdf = session.call({'op': 'build', 'document': document_hash, 'preview': preview,
+                                               'assets': assets}, cancelled=cancelled)
+                if reply.get('ok') or not reply.get('missing') or attempt:
+                    break
+                # The worker lost files it was known to hold; ask it again what it lacks
+                print(f"Build worker {worker} lost {len(reply['missing'])} input files, sending them again")
+                worker.known.clear()
+            # The worker's stages, placed on this build's timeline
+            for span in Tracer.from_records(reply.get('trace', [])).spans:
+                span.start += sent
+                span.end += sent
+                span.tracer = tracer
+                tracer.spans.append(span)
+            return reply, pdf
+        finally:
+            session.close()
+
+    def _ship(self, session, worker, document, document_hash, files):
+        """Upload the inputs the worker does not hold yet"""
+        wanted = {document_hash} | {digest for _, digest in files.values()}
+        unknown = sorted(wanted - worker.known)
+        if not unknown:
+            return
+        reply, _ = session.call({'op': 'have', 'hashes': unknown})
+        for digest in reply.get('missing', []):
+            if not isinstance(digest, str) or digest not in wanted:
+                raise ValueError("Worker asked for a file it was not offered")
+            if digest == document_hash:
+                data = document
+            else:
+                path = next(path for path, d in files.values() if d == digest)
+                with open(path, 'rb') as f:
+                    data = f.read()
+            put_reply, _ = session.call({'op': 'put', 'hash': digest}, data)
+            if not put_reply.get('ok'):
+                raise ValueError(put_reply.get('message', "Upload refused"))
+        worker.known.update(unknown)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_worker_pool():
+    """The shared pool configured by LRC_BUILD_WORKERS, or None"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = WorkerPool.from_environment()
+        return _pool
+
+
+class RemoteBuildThread(LaTeXProcessingThread):
+    """PDF build whose compile runs on a remote worker (locally if none is reachable)"""
+
+    def __init__(self, *args, pool=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.pool = pool or get_worker_pool()
+
+    def compile_latex(self, content, output_pdf=None, aux_file=None):
+        # Callers that need the .aux (fast-variant masters) compile here
+        if self.pool is None or aux_file is not None:
+            return super().compile_latex(content, output_pdf, aux_file)
+        if output_pdf is None:
+            output_pdf = os.path.splitext(self.output_file)[0] + '.pdf'
+        try:
+            _, pages = self.pool.build(content, self.source_dir, output_pdf, self.tracer,
+                                       self.isInterruptionRequested, self.preview)
+        except WorkersUnavailable as e:
+            print(f"{str(e)}; compiling locally")
+            super().compile_latex(content, output_pdf)
+            return
+        if pages is not None:
+            self.learn_page_count(content, pages, os.path.getsize(output_pdf))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="LaTeX Report Customizer build worker")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    serve_parser = commands.add_parser('serve', help="run a worker")
+    serve_parser.add_argument('--host', default='127.0.0.1',
+                              help="address to listen on (default: 127.0.0.1; use 0.0.0.0 for other hosts)")
+    serve_parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    serve_parser.add_argument('--slots', type=int, help="builds run at the same time")
+    serve_parser.add_argument('--engine', help="pdflatex executable")
+    serve_parser.add_argument('--blobs', help="directory for received files (default: the user cache)")
+
+    status_parser = commands.add_parser('status', help="show the load of workers")
+    status_parser.add_argument('workers', nargs='+', help="host:port")
+    args = parser.parse_args(argv)
+
+    if args.command == 'serve':
+        return serve(args.host, args.port, args.slots, args.engine, args.blobs)
+
+    failures = 0
+    token = os.environ.get('LRC_WORKER_TOKEN')
+    for address in args.workers:
+        worker = RemoteWorker(parse_address(address))
+        try:
+            session = WorkerSession(worker, token, timeout=CONNECT_TIMEOUT)
+            try:
+                reply, _ = session.call({'op': 'status'})
+            finally:
+                session.close()
+        except (OSError, ValueError) as e:
+            print(f"{worker}: unreachable ({str(e)})")
+            failures += 1
+            continue
+        print(f"{worker}: {reply.get('running')}/{reply.get('slots')} running, "
+              f"{reply.get('completed')} completed, {reply.get('blobs_received')} files received")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
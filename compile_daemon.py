@@ -0,0 +1,681 @@
+"""Local compile daemon shared by GUI sessions and headless clients
+
+    python compile_daemon.py serve [--workers N] [--shared [--group builders]]
+    python compile_daemon.py build report.tex -o report.pdf [--select "Intro" ...]
+    python compile_daemon.py status
+    python compile_daemon.py stop
+
+The daemon listens on a Unix socket and runs builds on one bounded pool of
+workers, so its clients share the resolved engine, parsed section indexes,
+the scratch workspace and the bibliography cache instead of each starting
+cold. Requests and replies are single JSON lines.
+
+By default the daemon serves only the user running it. With --shared it
+serves every member of a group on the build host: the socket is placed in
+a directory only that group can reach, each request is attributed to its
+caller's uid (SO_PEERCRED, Linux), and outputs are written through a file
+the client opened itself, so they belong to the caller and are created with
+the caller's permissions. Another user's build runs on a private copy of the
+input and the files it references; each must be readable by the caller and,
+symbolic links resolved, lie inside the input's directory.
+"""
+import os
+import sys
+import json
+import uuid
+import select
+import shutil
+import socket
+import struct
+import time
+import argparse
+import tempfile
+import threading
+import socketserver
+from stat import S_ISREG
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from PyQt5.QtCore import QThread, pyqtSignal
+
+from assets import collect_assets
+from build_history import ProgressTicker, predict_seconds, selection_key
+from engine_runner import EngineTerminated
+from latex_processor import LaTeXProcessingThread, TexExportThread
+from section_index import SectionIndex
+from tracing import Tracer
+from workspace import get_workspace
+
+# Parsed documents kept warm between builds
+INDEX_CACHE_SIZE = 32
+# Directory of the socket of a daemon shared by a group (serve --shared)
+SHARED_SOCKET_DIR = 'latex-report-customizer-shared'
+# Largest request line the daemon reads
+MAX_REQUEST = 1 << 20
+# Seconds the GUI trusts its last check for a running daemon
+PROBE_INTERVAL = 10
+# How often a waiting client checks whether its build was cancelled
+CANCEL_POLL_INTERVAL = 0.1
+
+
+def user_socket_path():
+    """Socket of the daemon serving only the current user"""
+    runtime_dir = os.environ.get('XDG_RUNTIME_DIR')
+    if runtime_dir and os.path.isdir(runtime_dir):
+        return os.path.join(runtime_dir, 'latex-report-customizer.sock')
+    return os.path.join(tempfile.gettempdir(), f'latex-report-customizer-{os.getuid()}.sock')
+
+
+def shared_socket_path():
+    """Socket of a daemon shared by the users of a group"""
+    return os.path.join(tempfile.gettempdir(), SHARED_SOCKET_DIR, 'daemon.sock')
+
+
+def default_socket_path():
+    """LRC_DAEMON_SOCKET, else the user's own daemon, else a shared one if it is running"""
+    if os.environ.get('LRC_DAEMON_SOCKET'):
+        return os.environ['LRC_DAEMON_SOCKET']
+    path = user_socket_path()
+    if not os.path.exists(path) and os.path.exists(shared_socket_path()):
+        return shared_socket_path()
+    return path
+
+
+def send_request(request, path=None, timeout=None, fds=(), cancelled=None):
+    """Send one request (and file descriptors for the daemon to use) and return the reply
+
+    While a build request waits for its reply, cancelled is polled; once it
+    returns True the daemon is asked to cancel the build, which then replies.
+    """
+    data = json.dumps(request).encode('utf-8') + b'\n'
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        sock.connect(path or default_socket_path())
+        if fds:
+            sent = socket.send_fds(sock, [data], list(fds))
+            if sent < len(data):
+                sock.sendall(data[sent:])
+        else:
+            sock.sendall(data)
+        if cancelled is not None:
+            cancel_sent = False
+            while not select.select([sock], [], [], CANCEL_POLL_INTERVAL)[0]:
+                if not cancel_sent and cancelled():
+                    send_request({'op': 'cancel', 'job': request.get('job')}, path, timeout=5)
+                    cancel_sent = True
+        with sock.makefile('rb') as reader:
+            line = reader.readline()
+    if not line:
+        raise ConnectionError("Compile daemon closed the connection")
+    return json.loads(line)
+
+
+def submit_build(request, path=None, cancelled=None):
+    """Send a build request; the output is written through a file this process creates
+
+    The daemon may run as another user (serve --shared), so the output is
+    opened here, with this user's permissions, and renamed over the
+    requested path once the build succeeded. Folder bundles cannot be
+    passed as a file and are written by the daemon itself.
+    """
+    output = request['output']
+    # Names the build in cancel requests
+    request.setdefault('job', uuid.uuid4().hex)
+    if not hasattr(socket, 'send_fds') or (request.get('type') == 'bundle'
+                                           and not output.lower().endswith('.zip')):
+        return send_request(request, path, cancelled=cancelled)
+    partial = f"{output}.{os.getpid()}.{threading.get_ident()}.part"
+    fd = os.open(partial, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o666)
+    try:
+        try:
+            reply = send_request(request, path, fds=[fd], cancelled=cancelled)
+        finally:
+            os.close(fd)
+        if reply.get('ok'):
+            os.replace(partial, output)
+        return reply
+    finally:
+        if os.path.exists(partial):
+            os.remove(partial)
+
+
+def daemon_available(path=None):
+    """True if a daemon is listening on the socket"""
+    if not hasattr(socket, 'AF_UNIX'):
+        return False
+    path = path or default_socket_path()
+    if not os.path.exists(path):
+        return False
+    try:
+        return send_request({'op': 'ping'}, path, timeout=1).get('ok', False)
+    except (OSError, ValueError):
+        return False
+
+
+class DaemonProbe:
+    """Remembers whether a daemon is running, rechecking in the background
+
+    available() never blocks: it answers from the last check and starts a
+    new one once that is older than PROBE_INTERVAL.
+    """
+
+    def __init__(self, interval=PROBE_INTERVAL):
+        self.interval = interval
+        self.result = False
+        self.checked = None
+        self.lock = threading.Lock()
+        self.probing = False
+
+    def available(self):
+        with self.lock:
+            due = not self.probing and (self.checked is None
+                                        or time.monotonic() - self.checked > self.interval)
+            if due:
+                self.probing = True
+        if due:
+            threading.Thread(target=self._probe, daemon=True).start()
+        return self.result
+
+    def _probe(self):
+        result = daemon_available()
+        with self.lock:
+            self.result = result
+            self.checked = time.monotonic()
+            self.probing = False
+
+
+def peer_uid(sock):
+    """uid of the process at the other end of a Unix socket, or None where unknown"""
+    if not hasattr(socket, 'SO_PEERCRED'):
+        return None
+    credentials = sock.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize('3i'))
+    return struct.unpack('3i', credentials)[1]
+
+
+def _user_groups(uid):
+    import pwd
+    user = pwd.getpwuid(uid)
+    return set(os.getgrouplist(user.pw_name, user.pw_gid))
+
+
+def _permits(stat, uid, groups, bit):
+    """Whether a file's permission bits grant uid the access bit (4 read, 1 search)"""
+    if stat.st_uid == uid:
+        mode = stat.st_mode >> 6
+    elif stat.st_gid in groups:
+        mode = stat.st_mode >> 3
+    else:
+        mode = stat.st_mode
+    return bool(mode & bit)
+
+
+def user_can_read(path, uid):
+    """Whether uid may read path by its permission bits and search every directory above it
+
+    ACLs are not considered, so this can only be stricter than the system.
+    """
+    if uid == 0:
+        return True
+    try:
+        groups = _user_groups(uid)
+    except KeyError:
+        return False
+    path = os.path.realpath(path)
+    checks = [(path, 4)]
+    directory = os.path.dirname(path)
+    while True:
+        checks.append((directory, 1))
+        parent = os.path.dirname(directory)
+        if parent == directory:
+            break
+        directory = parent
+    for checked, bit in checks:
+        try:
+            stat = os.stat(checked)
+        except OSError:
+            return False
+        if not _permits(stat, uid, groups, bit):
+            return False
+    return True
+
+
+def _open_confined(path, root, uid):
+    """Open path for reading if the file it leads to lies under root and uid may read it
+
+    Symbolic links are followed and then judged by where they lead; the
+    file actually opened is checked, so swapping a link afterwards gains
+    nothing.
+    """
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        stat = os.fstat(fd)
+        try:
+            actual = os.readlink(f'/proc/self/fd/{fd}')
+        except OSError:
+            actual = os.path.realpath(path)
+        inside = root is None or actual.startswith(root.rstrip(os.sep) + os.sep)
+        readable = uid == 0 or (_permits(stat, uid, _user_groups(uid), 4) and user_can_read(actual, uid))
+        if not (inside and readable and S_ISREG(stat.st_mode)):
+            raise PermissionError(f"{path} leads outside the document's directory "
+                                  "or is not readable by the requesting user")
+    except BaseException:
+        os.close(fd)
+        raise
+    return fd
+
+
+def snapshot_source(input_file, uid, directory):
+    """Copy input_file and the files it references into directory, as uid may read them
+
+    Builds for another user run on the copy, so TeX never reads the
+    caller's directory with the daemon's rights. Raises PermissionError if
+    any of the files leads outside the input's directory or is not
+    readable by uid. Returns the path of the copied input file.
+    """
+    source_dir = os.path.dirname(os.path.abspath(input_file))
+    root = os.path.realpath(source_dir)
+    with open(_open_confined(input_file, None, uid), 'rb') as f:
+        data = f.read()
+    copy = os.path.join(directory, os.path.basename(input_file))
+    with open(copy, 'wb') as f:
+        f.write(data)
+
+    assets = collect_assets(data.decode('utf-8', errors='replace'), source_dir)
+    for relative in assets.files + assets.bibliographies:
+        target = os.path.join(directory, relative)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with open(_open_confined(os.path.join(source_dir, relative), root, uid), 'rb') as source, \
+                open(target, 'wb') as f:
+            shutil.copyfileobj(source, f)
+    return copy
+
+
+class IndexCache:
+    """Small LRU of parsed section indexes, keyed by file path"""
+
+    def __init__(self, size=INDEX_CACHE_SIZE):
+        self.size = size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, path, content):
+        with self.lock:
+            index = self.entries.get(path)
+            if index is not None and index.content == content:
+                self.entries.move_to_end(path)
+                return index
+        index = SectionIndex(content)
+        with self.lock:
+            self.entries[path] = index
+            self.entries.move_to_end(path)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+        return index
+
+
+class WarmBuild(LaTeXProcessingThread):
+    """PDF build that reuses the daemon's parsed index of the document"""
+
+    def __init__(self, index_cache, *args, cancel_event=None, document=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.index_cache = index_cache
+        # Builds of a snapshot (see snapshot_source) keep the original's history
+        if document is not None:
+            self.document = document
+        # Set by a cancel request; the build runs on a pool thread, not as a QThread
+        self.cancel_event = cancel_event or threading.Event()
+
+    def isInterruptionRequested(self):
+        return self.cancel_event.is_set()
+
+    def process_latex_content(self, content):
+        with self.tracer.span("parse"):
+            index = self.index_cache.get(self.document, content)
+        with self.tracer.span("filter"):
+            return index.render(self.selected_components, self.order)
+
+
+class CompileDaemon:
+    """Runs build requests on a bounded worker pool with shared warm state"""
+
+    def __init__(self, workers=None, pdflatex_path=None, shared=False):
+        if workers is None:
+            workers = int(os.environ.get('LRC_DAEMON_WORKERS', 0)) or max(1, (os.cpu_count() or 2) // 2)
+        if pdflatex_path is None:
+            from utils import check_latex_installation
+            _, pdflatex_path = check_latex_installation()
+        self.workers = workers
+        self.pdflatex_path = pdflatex_path
+        # Serves other users too (serve --shared)
+        self.shared = shared
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='build')
+        self.index_cache = IndexCache()
+        self.workspace = get_workspace()
+        self.workspace.cleanup_stale()
+        self.lock = threading.Lock()
+        # Build id -> (uid of the caller, cancel event) while the build is queued or running
+        self.jobs = {}
+        self.queued = 0
+        self.running = 0
+        self.completed = 0
+
+    def handle(self, request, uid=None, fds=()):
+        """Process one request from the user uid (None: unknown) and return the reply
+
+        fds are the file descriptors sent with the request; the caller closes them.
+        """
+        op = request.get('op')
+        if op == 'ping':
+            return {'ok': True}
+        if op == 'status':
+            with self.lock:
+                return {'ok': True, 'pid': os.getpid(), 'workers': self.workers,
+                        'queued': self.queued, 'running': self.running,
+                        'completed': self.completed, 'pdflatex': self.pdflatex_path}
+        if op == 'build':
+            refusal = self.refusal(request, uid, fds)
+            if refusal:
+                return {'ok': False, 'message': refusal}
+            job_id = request.get('job') or uuid.uuid4().hex
+            cancel_event = threading.Event()
+            with self.lock:
+                self.queued += 1
+                self.jobs[job_id] = (uid, cancel_event)
+            try:
+                return self.pool.submit(self.build, request, uid, fds, cancel_event).result()
+            finally:
+                with self.lock:
+                    self.jobs.pop(job_id, None)
+        if op == 'cancel':
+            with self.lock:
+                owner, cancel_event = self.jobs.get(request.get('job'), (None, None))
+            if cancel_event is None:
+                return {'ok': False, 'message': "No such build"}
+            if uid not in (None, 0, os.getuid(), owner):
+                return {'ok': False, 'message': "Only the user who submitted a build can cancel it"}
+            cancel_event.set()
+            return {'ok': True}
+        return {'ok': False, 'message': f"Unknown request: {op}"}
+
+    def refusal(self, request, uid, fds):
+        """Why a build request from uid is not run, or None"""
+        if uid is None or uid == os.getuid():
+            return None
+        if not self.shared:
+            return "This compile daemon serves only its own user"
+        if not user_can_read(str(request.get('input', '')), uid):
+            return f"{request.get('input')} is not readable by the requesting user"
+        if not fds:
+            return "A shared compile daemon writes outputs only through a file passed by the client"
+        return None
+
+    def build(self, request, uid=None, fds=(), cancel_event=None):
+        with self.lock:
+            self.queued -= 1
+            self.running += 1
+        scratch = snapshot = None
+        try:
+            if cancel_event is not None and cancel_event.is_set():
+                return {'ok': False, 'message': "Build cancelled"}
+            input_file = document = os.path.abspath(request['input'])
+            # Only the daemon's own user may choose the engine it runs
+            own = uid is None or uid == os.getuid()
+            if not own:
+                # Another user's build only sees copies of files that user may read
+                snapshot = self.workspace.make_dir("snapshot_")
+                try:
+                    input_file = snapshot_source(input_file, uid, snapshot)
+                except PermissionError as e:
+                    return {'ok': False, 'message': str(e)}
+            output_file = requested_output = os.path.abspath(request['output'])
+            output_fd = fds[0] if fds else None
+            if output_fd is not None:
+                # Build into scratch space, then copy through the caller's file
+                scratch = self.workspace.make_dir("daemon_")
+                output_file = os.path.join(scratch, 'output' + os.path.splitext(output_file)[1])
+            pdflatex_path = (request.get('pdflatex_path') if own else None) or self.pdflatex_path
+            selected = request.get('selected')
+            if selected is None:
+                with open(input_file, 'r', encoding='utf-8') as f:
+                    content = f.read()
+                selected = [span.key for span in self.index_cache.get(document, content).spans]
+
+            if request.get('type', 'pdf') == 'pdf':
+                job = WarmBuild(self.index_cache, input_file, output_file, selected, pdflatex_path,
+                                cancel_event=cancel_event, document=document,
+                                order=request.get('order'), prune_preamble=request.get('prune_preamble'),
+                                preview=request.get('preview', False),
+                                draft_figures=request.get('draft_figures', False))
+            else:
+                job = TexExportThread(input_file, output_file, selected,
+                                      bundle=request.get('type') == 'bundle', order=request.get('order'))
+
+            # Run the job synchronously on this pool thread
+            result = {}
+            job.finished_signal.connect(lambda success, message: result.update(ok=success, message=message))
+            job.run()
+            if result.get('ok') and output_fd is not None:
+                with open(output_fd, 'wb', closefd=False) as target, open(output_file, 'rb') as source:
+                    shutil.copyfileobj(source, target)
+            termination = getattr(job, 'termination', None)
+            # TEX exports report the file they wrote
+            message = result.get('message', '').replace(output_file, requested_output)
+            return {'ok': result.get('ok', False), 'message': message,
+                    'terminated': termination.reason if termination else None,
+                    'regression': getattr(job, 'regression', None), 'trace': job.tracer.records()}
+        except Exception as e:
+            return {'ok': False, 'message': f"Error: {str(e)}"}
+        finally:
+            for directory in (scratch, snapshot):
+                if directory is not None:
+                    self.workspace.release(directory)
+            with self.lock:
+                self.running -= 1
+                self.completed += 1
+
+
+def _receive_request(sock):
+    """Read one request line and the file descriptors sent along with it"""
+    data, fds = b'', []
+    while not data.endswith(b'\n') and len(data) < MAX_REQUEST:
+        if hasattr(socket, 'recv_fds'):
+            chunk, received, _, _ = socket.recv_fds(sock, 65536, 4)
+            fds.extend(received)
+        else:
+            chunk = sock.recv(65536)
+        if not chunk:
+            break
+        data += chunk
+    return data, fds
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        line, fds = _receive_request(self.request)
+        try:
+            if not line:
+                return
+            try:
+                request = json.loads(line)
+                if not isinstance(request, dict):
+                    raise ValueError(line)
+            except ValueError:
+                reply = {'ok': False, 'message': "Malformed request"}
+            else:
+                uid = peer_uid(self.request)
+                if request.get('op') == 'stop':
+                    if uid in (None, 0, os.getuid()):
+                        reply = {'ok': True}
+                        threading.Thread(target=self.server.shutdown, daemon=True).start()
+                    else:
+                        reply = {'ok': False, 'message': "Only the daemon's own user can stop it"}
+                else:
+                    reply = self.server.daemon.handle(request, uid, fds)
+        finally:
+            for fd in fds:
+                os.close(fd)
+        self.wfile.write(json.dumps(reply).encode('utf-8') + b'\n')
+
+
+class _Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def _prepare_shared_directory(directory, group):
+    """Create the socket directory so that only the daemon's user and group can reach it"""
+    import grp
+    gid = grp.getgrnam(group).gr_gid if group else os.getgid()
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    if os.stat(directory).st_uid != os.getuid():
+        raise PermissionError(f"{directory} belongs to another user")
+    os.chown(directory, -1, gid)
+    os.chmod(directory, 0o710)
+    return gid
+
+
+def serve(path=None, workers=None, shared=False, group=None):
+    """Run the daemon until a stop request arrives"""
+    path = path or os.environ.get('LRC_DAEMON_SOCKET') or (shared_socket_path() if shared else user_socket_path())
+    gid = None
+    if shared:
+        if not hasattr(socket, 'SO_PEERCRED'):
+            print("A shared daemon needs SO_PEERCRED (Linux) to tell its users apart")
+            return 1
+        if os.getuid() == 0:
+            print("Run a shared daemon as a dedicated unprivileged user, not as root")
+            return 1
+        try:
+            gid = _prepare_shared_directory(os.path.dirname(os.path.abspath(path)), group)
+        except (KeyError, OSError) as e:
+            print(f"Cannot prepare the shared socket directory: {str(e)}")
+            return 1
+        # Engines may only open files named relative to their working
+        # directory or found on their search paths; otherwise a caller could
+        # \input any file the daemon's account can read
+        os.environ['openin_any'] = 'p'
+    if os.path.exists(path):
+        if daemon_available(path):
+            print(f"Compile daemon already running on {path}")
+            return 1
+        # Left behind by a daemon that did not shut down cleanly
+        os.remove(path)
+
+    daemon = CompileDaemon(workers, shared=shared)
+    # Owner only, or owner and group for a shared daemon
+    old_umask = os.umask(0o117 if shared else 0o177)
+    try:
+        server = _Server(path, _RequestHandler)
+    finally:
+        os.umask(old_umask)
+    if gid is not None:
+        os.chown(path, -1, gid)
+    server.daemon = daemon
+    print(f"Compile daemon listening on {path} with {daemon.workers} workers"
+          + (" (shared)" if shared else ""))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        daemon.pool.shutdown(wait=True)
+        daemon.workspace.close()
+        if os.path.exists(path):
+            os.remove(path)
+    return 0
+
+
+class DaemonBuildThread(QThread):
+    """Submits a build to the compile daemon; same signals as LaTeXProcessingThread"""
+    progress_update = pyqtSignal(int)
+    finished_signal = pyqtSignal(bool, str)
+    trace_ready = pyqtSignal(object)
+
+    def __init__(self, input_file, output_file, selected_components, pdflatex_path=None, order=None,
+                 prune_preamble=None, preview=False, draft_figures=False):
+        super().__init__()
+        self.termination = None
+        # The daemon records the build in its history; this is its verdict
+        self.regression = None
+        self.history_key = (os.path.abspath(input_file), selection_key(selected_components, order),
+                            'preview' if preview else LaTeXProcessingThread.HISTORY_KIND)
+        self.request = {'op': 'build', 'type': 'pdf', 'input': os.path.abspath(input_file),
+                        'output': os.path.abspath(output_file), 'selected': selected_components,
+                        'pdflatex_path': pdflatex_path, 'order': order, 'prune_preamble': prune_preamble,
+                        'preview': preview, 'draft_figures': draft_figures}
+
+    def run(self):
+        ticker = ProgressTicker(self.progress_update.emit, predict_seconds(*self.history_key))
+        ticker.start()
+        try:
+            try:
+                reply = submit_build(self.request, cancelled=self.isInterruptionRequested)
+            finally:
+                ticker.stop()
+            self.regression = reply.get('regression')
+            self.trace_ready.emit(Tracer.from_records(reply.get('trace', [])))
+            if reply.get('ok'):
+                self.progress_update.emit(100)
+                self.finished_signal.emit(True, "PDF generated successfully!")
+            else:
+                if reply.get('terminated'):
+                    self.termination = EngineTerminated(reply.get('message', ''), reply['terminated'])
+                self.finished_signal.emit(False, reply.get('message', "Build failed"))
+        except (OSError, ValueError) as e:
+            self.finished_signal.emit(False, f"Error: compile daemon unavailable ({str(e)})")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="LaTeX Report Customizer compile daemon")
+    parser.add_argument('--socket', help="socket path (default: per-user runtime directory, "
+                                         "or the shared daemon's if only that is running)")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    serve_parser = commands.add_parser('serve', help="run the daemon")
+    serve_parser.add_argument('--workers', type=int, help="maximum concurrent builds")
+    serve_parser.add_argument('--shared', action='store_true',
+                              help="serve all users of --group on this host (Linux)")
+    serve_parser.add_argument('--group', help="group allowed to use a shared daemon (default: your primary group)")
+
+    build_parser = commands.add_parser('build', help="submit a build and wait for it")
+    build_parser.add_argument('input')
+    build_parser.add_argument('-o', '--output', required=True)
+    build_parser.add_argument('--select', action='append',
+                              help="component to include (repeatable; default: all)")
+    build_parser.add_argument('--type', choices=('pdf', 'tex', 'bundle'), default='pdf')
+    build_parser.add_argument('--trace', action='store_true', help="print the stage timings")
+
+    commands.add_parser('status', help="show the daemon's workers and queue")
+    commands.add_parser('stop', help="stop the daemon")
+    args = parser.parse_args(argv)
+
+    if not hasattr(socket, 'AF_UNIX'):
+        print("The compile daemon needs Unix domain sockets, which this platform lacks")
+        return 1
+
+    if args.command == 'serve':
+        return serve(args.socket, args.workers, args.shared, args.group)
+
+    try:
+        if args.command == 'build':
+            reply = submit_build({'op': 'build', 'type': args.type, 'input': os.path.abspath(args.input),
+                                  'output': os.path.abspath(args.output), 'selected': args.select},
+                                 args.socket)
+            print(reply.get('message', ''))
+            if args.trace:
+                print(Tracer.from_records(reply.get('trace', [])).table())
+        else:
+            reply = send_request({'op': args.command}, args.socket)
+            if not reply.get('ok'):
+                print(reply.get('message', "Request failed"))
+            elif args.command == 'status':
+                for key in ('pid', 'workers', 'queued', 'running', 'completed', 'pdflatex'):
+                    print(f"{key + ':':<11}{reply.get(key)}")
+    except OSError as e:
+        print(f"Could not reach the compile daemon: {str(e)}")
+        return 1
+    return 0 if reply.get('ok') else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,209 @@
+import os
+import sys
+import time
+import signal
+import threading
+import subprocess
+
+try:
+    import resource
+except ImportError:  # Windows has no rlimits
+    resource = None
+
+from tracing import MAXRSS_SCALE, record_child_usage
+
+# Defaults, overridable with LRC_ENGINE_TIMEOUT / LRC_ENGINE_CPU / LRC_ENGINE_MEMORY
+DEFAULT_TIMEOUT = 300
+DEFAULT_MEMORY = 4 * 1024 ** 3
+
+# How often the watchdog checks for cancellation and the deadline
+POLL_INTERVAL = 0.1
+# Time a process group gets to exit after SIGTERM before it is killed
+KILL_GRACE = 2.0
+
+
+class EngineTerminated(RuntimeError):
+    """An engine process was stopped by the watchdog rather than failing by itself
+
+    reason is one of 'timeout', 'cpu', 'memory', 'killed' or 'cancelled'.
+    """
+
+    def __init__(self, message, reason):
+        super().__init__(message)
+        self.reason = reason
+
+
+class Limits:
+    """Wall-clock, CPU, memory and file size limits for one engine process"""
+
+    def __init__(self, timeout=DEFAULT_TIMEOUT, cpu=None, memory=DEFAULT_MEMORY, file_size=None):
+        self.timeout = timeout
+        self.cpu = cpu
+        self.memory = memory
+        # Largest file the process may write (set from the scratch quota by builds)
+        self.file_size = file_size
+
+    @classmethod
+    def from_environment(cls):
+        """Limits from the environment; 0 disables a limit, invalid values keep the default"""
+        from workspace import parse_size
+        timeout = _limit_from_environment('LRC_ENGINE_TIMEOUT', float, DEFAULT_TIMEOUT)
+        cpu = _limit_from_environment('LRC_ENGINE_CPU', float, 0)
+        memory = _limit_from_environment('LRC_ENGINE_MEMORY', parse_size, DEFAULT_MEMORY)
+        return cls(timeout or None, cpu or None, memory or None)
+
+
+def _limit_from_environment(name, parse, default):
+    text = os.environ.get(name)
+    if not text:
+        return default
+    try:
+        value = parse(text)
+    except ValueError:
+        value = -1
+    # NaN and infinity are not limits either
+    if not 0 <= value < float('inf'):
+        print(f"Ignoring invalid {name}={text!r}, using the default")
+        return default
+    return value
+
+
+def _apply_rlimits(pid, limits):
+    """Limit CPU seconds and address space of a freshly started process (Linux)"""
+    if limits.cpu:
+        # SIGXCPU at the soft limit, SIGKILL shortly after
+        resource.prlimit(pid, resource.RLIMIT_CPU, (int(limits.cpu), int(limits.cpu) + 5))
+    if limits.memory:
+        resource.prlimit(pid, resource.RLIMIT_AS, (limits.memory, limits.memory))
+    if limits.file_size:
+        resource.prlimit(pid, resource.RLIMIT_FSIZE, (limits.file_size, limits.file_size))
+
+
+def _rlimit_preexec(limits):
+    """Same limits set in the child before exec, where prlimit() is unavailable"""
+    def preexec():
+        if limits.cpu:
+            resource.setrlimit(resource.RLIMIT_CPU, (int(limits.cpu), int(limits.cpu) + 5))
+        if limits.memory:
+            try:
+                resource.setrlimit(resource.RLIMIT_AS, (limits.memory, limits.memory))
+            except (ValueError, OSError):
+                pass  # macOS does not support RLIMIT_AS
+        if limits.file_size:
+            resource.setrlimit(resource.RLIMIT_FSIZE, (limits.file_size, limits.file_size))
+    return preexec
+
+
+def _kill_group(process):
+    """Terminate the engine and everything it started, then make sure they are gone"""
+    if sys.platform == 'win32':
+        process.kill()
+        return
+    for sig, grace in ((signal.SIGTERM, KILL_GRACE), (signal.SIGKILL, None)):
+        try:
+            os.killpg(process.pid, sig)
+        except ProcessLookupError:
+            return
+        try:
+            process.wait(grace)
+            return
+        except subprocess.TimeoutExpired:
+            pass
+
+
+def run_engine(args, cwd, env=None, limits=None, cancelled=None, name=None):
+    """Run an engine process under the watchdog
+
+    The process gets its own session (so it and its children can be killed
+    together), no terminal input, and the given limits. cancelled is polled
+    while it runs. Returns a CompletedProcess with stdout and stderr merged;
+    raises EngineTerminated when the watchdog stopped the process.
+    """
+    limits = limits or Limits.from_environment()
+    name = name or os.path.basename(args[0])
+    posix = sys.platform != 'win32'
+    use_prlimit = posix and hasattr(resource, 'prlimit')
+
+    process = subprocess.Popen(
+        args,
+        cwd=cwd,
+        env=env,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        start_new_session=posix,
+        preexec_fn=_rlimit_preexec(limits) if posix and resource and not use_prlimit else None
+    )
+    if use_prlimit:
+        try:
+            _apply_rlimits(process.pid, limits)
+        except (ValueError, OSError):
+            pass  # already exited, or the limits cannot be lowered further
+
+    deadline = time.monotonic() + limits.timeout if limits.timeout else None
+    chunks = []
+    # Reaping the process with wait4() gives its own CPU time and peak memory;
+    # the output is drained on a thread meanwhile
+    measure = posix and hasattr(os, 'wait4') and hasattr(os, 'waitstatus_to_exitcode')
+    if measure:
+        reader = threading.Thread(target=lambda: chunks.append(process.stdout.read()), daemon=True)
+        reader.start()
+    stopped = None
+    while True:
+        if measure:
+            reader.join(POLL_INTERVAL)
+            if not reader.is_alive():
+                pid, status, usage = os.wait4(process.pid, os.WNOHANG)
+                if pid:
+                    process.returncode = os.waitstatus_to_exitcode(status)
+                    process.stdout.close()
+                    record_child_usage(usage.ru_utime + usage.ru_stime, usage.ru_maxrss * MAXRSS_SCALE)
+                    break
+                # Output closed but the process is still exiting
+                time.sleep(0.005)
+        else:
+            try:
+                output, _ = process.communicate(timeout=POLL_INTERVAL)
+                chunks.append(output or b'')
+                break
+            except subprocess.TimeoutExpired:
+                pass
+        if cancelled is not None and cancelled():
+            stopped = EngineTerminated(f"{name} cancelled", 'cancelled')
+        elif deadline is not None and time.monotonic() > deadline:
+            stopped = EngineTerminated(f"{name} timed out after {limits.timeout:g} s", 'timeout')
+        if stopped:
+            _kill_group(process)
+            if measure:
+                reader.join()
+                process.stdout.close()
+            else:
+                output, _ = process.communicate()
+                chunks.append(output or b'')
+            raise stopped
+
+    output = b''.join(chunks)
+    returncode = process.returncode
+    if posix and returncode < 0:
+        sig = -returncode
+        if sig == signal.SIGXCPU:
+            raise EngineTerminated(f"{name} exceeded the CPU limit of {limits.cpu:g} s", 'cpu')
+        if sig == signal.SIGXFSZ:
+            raise EngineTerminated(
+                f"{name} wrote a file larger than {limits.file_size // 2 ** 20} MiB", 'file_size')
+        if sig == signal.SIGKILL:
+            # Not sent by us: the hard CPU limit or the kernel's out-of-memory killer
+            raise EngineTerminated(f"{name} was killed by the system (CPU or memory exhausted)", 'killed')
+        raise EngineTerminated(f"{name} terminated by signal {signal.Signals(sig).name}", 'killed')
+    if returncode != 0 and limits.memory and _out_of_memory(output):
+        raise EngineTerminated(
+            f"{name} exceeded the memory limit of {limits.memory // 2 ** 20} MiB", 'memory'
+        )
+    return subprocess.CompletedProcess(args, returncode, output, b'')
+
+
+def _out_of_memory(output):
+    """Engines report a failed allocation under RLIMIT_AS instead of being killed"""
+    tail = output[-4000:]
+    return any(message in tail for message in
+               (b'memory exhausted', b'memory allocation failed', b'Cannot allocate memory'))
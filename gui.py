@@ -1,51 +1,184 @@
 import os
-import re
-import tempfile
-import subprocess
-import shutil  # For file operations with TEX files
+import time
 from PyQt5.QtWidgets import (QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, 
                             QLabel, QCheckBox, QPushButton, QFileDialog, 
                             QMessageBox, QGroupBox, QScrollArea, QProgressBar, 
                             QStatusBar, QApplication, QAction, QSizePolicy,
-                            QToolButton, QFrame, QSlider, QSpacerItem)
-from PyQt5.QtCore import Qt
-from PyQt5.QtGui import QFont, QIcon, QPixmap
-from PyQt5.QtSvg import QSvgWidget  # Add SVG support
+                            QToolButton, QFrame, QSlider, QSpacerItem,
+                            QMenu, QScrollBar, QTreeWidget, QTreeWidgetItem,
+                            QLineEdit, QDialog, QTableWidget, QTableWidgetItem,
+                            QHeaderView)
+from PyQt5.QtCore import Qt, QTimer, QFileSystemWatcher, QEvent, QMimeData, pyqtSignal
+from PyQt5.QtGui import QFont, QIcon, QImageReader, QPixmap, QDrag, QColor
 
-from latex_processor import LaTeXProcessingThread
-from utils import show_latex_installation_dialog
+from build_workers import RemoteBuildThread, get_worker_pool
+from compile_daemon import DaemonBuildThread, DaemonProbe
+from jobs import BATCH, EXPORT, PREVIEW, JobQueue
+from latex_processor import LaTeXProcessingThread, TexExportThread
+from page_estimate import PageEstimate, load_learned
+from reference_graph import ReferenceGraph
+from search_index import SearchIndexThread
+from section_index import SectionIndex
+from themes import apply_theme, install as install_theme
+from utils import LatexProbeThread, show_latex_installation_dialog
+from variants import FastVariantThread
+from workspace import get_workspace
+
+# Finished jobs stay listed in the jobs panel until there are more than this
+MAX_LISTED_JOBS = 20
+
+# Milliseconds to wait after the last keystroke / file change before acting on it
+SEARCH_DELAY = 150
+RELOAD_DELAY = 300
+
+# Drag-and-drop payload when moving a component within the list
+COMPONENT_MIME = 'application/x-latex-report-component'
 
 class LatexReportCustomizerGUI(QMainWindow):
-    def __init__(self, latex_installed=True, latex_path=None):
+    # Seconds from process start to the first painted frame / to deferred setup done
+    first_painted = pyqtSignal(float)
+    startup_finished = pyqtSignal(float)
+    
+    def __init__(self, latex_installed=None, latex_path=None, started=None):
         super().__init__()
         self.input_file = None
         self.output_file = None
         self.components = []
         self.component_checkboxes = []
+        # Parallel to component_checkboxes, in display order: the span and layout row of each
+        self.component_spans = []
+        self.component_rows = []
+        self.drag_start = None
+        self.dragged_checkbox = None
+        self.section_index = None
+        self.page_estimate = None
+        self.reference_graph = None
+        self.pdf_viewer = None
+        self.search_index = None
+        # The section index search_index was built from; differs while re-indexing
+        self.search_source = None
+        self.search_threads = []
+        self.checkbox_by_key = {}
+        self.matched_checkboxes = []
+        self.file_watcher = None
         self.pdflatex_path = latex_path
+        # Scratch PDF of the latest quick preview, and the job building it
         self.temp_pdf_file = None
+        self.preview_job = None
+        # None until the background LaTeX probe has reported
         self.latex_installed = latex_installed
+        # Whether a compile daemon is running, checked off the GUI thread
+        self.daemon_probe = DaemonProbe()
         self.dark_mode = False
-        
-        # Check if LaTeX is installed
-        if not self.latex_installed:
-            show_latex_installation_dialog()
+        self.last_trace = None
+        self.themed_widgets = []
+        self.started = started if started is not None else time.perf_counter()
+        self.first_paint_time = None
+        self.startup_complete = False
+        
+        # Builds and exports run in the background, so the window stays usable
+        self.job_queue = JobQueue(parent=self)
+        self.job_items = {}
+        self.job_queue.job_added.connect(self.job_added)
+        self.job_queue.job_changed.connect(self.job_changed)
         
         # Set application-wide font size
         self.app_font = QApplication.font()
         self.app_font.setPointSize(10)
         QApplication.setFont(self.app_font)
         
-        # Set application icon if image exists
-        logo_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "image.png")
-        if not os.path.exists(logo_path):
-            # Try PNG as fallback
-            logo_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "image.png")
-            
-        if os.path.exists(logo_path):
-            self.setWindowIcon(QIcon(logo_path))
-            
+        # Only what the first frame needs is built here; the logo, menus, theme
+        # and LaTeX probe are set up in finish_startup once the window has painted
         self.init_ui()
+    
+    def paintEvent(self, event):
+        super().paintEvent(event)
+        if self.first_paint_time is None:
+            self.first_paint_time = time.perf_counter() - self.started
+            self.first_painted.emit(self.first_paint_time)
+            QTimer.singleShot(0, self.finish_startup)
+    
+    def finish_startup(self):
+        """Deferred initialization, run right after the first frame is shown"""
+        self.load_logo()
+        
+        # Create menu bar
+        self.create_menu_bar()
+        
+        # Shared stylesheet for both themes, set once for the whole application
+        install_theme(QApplication.instance())
+        
+        # Widgets with theme-specific rules; everything else follows the palette
+        self.themed_widgets = (self.findChildren(QGroupBox) + self.findChildren(QPushButton) +
+                               self.findChildren(QScrollBar) + self.findChildren(QMenu) +
+                               [self.progress_bar, self.statusBar, self.menuBar()])
+        self.startup_complete = True
+        self.apply_theme()
+        
+        # Start looking for a compile daemon before the first build asks
+        self.daemon_probe.available()
+        
+        # Scratch directories left behind by sessions that crashed or were killed
+        reclaimed = get_workspace().cleanup_stale()
+        if reclaimed:
+            print(f"Removed {reclaimed} bytes of stale scratch files")
+        
+        if self.latex_installed is None:
+            self.start_latex_probe()
+        elif not self.latex_installed:
+            show_latex_installation_dialog()
+        
+        self.startup_finished.emit(time.perf_counter() - self.started)
+    
+    def load_logo(self):
+        """Decode the logo once and use it for both the window icon and the header"""
+        if not os.path.exists(self.logo_path):
+            return
+        
+        # Check if it's SVG or PNG and use appropriate widget
+        if self.logo_path.lower().endswith('.svg'):
+            from PyQt5.QtSvg import QSvgWidget  # Only needed for SVG logos
+            logo_widget = QSvgWidget(self.logo_path)
+            logo_widget.setFixedSize(250, 100)
+            self.logo_layout.replaceWidget(self.logo_label, logo_widget)
+            self.logo_label.deleteLater()
+            self.setWindowIcon(QIcon(self.logo_path))
+            return
+        
+        pixmap = QPixmap(self.logo_path)
+        self.setWindowIcon(QIcon(pixmap))
+        # Resize the logo to a reasonable size if needed
+        if pixmap.width() > 300:
+            pixmap = pixmap.scaledToWidth(250, Qt.SmoothTransformation)
+        self.logo_label.setPixmap(pixmap)
+    
+    def start_latex_probe(self):
+        """Look for pdflatex in the background"""
+        self.probe_thread = LatexProbeThread()
+        self.probe_thread.probe_finished.connect(self.latex_probe_finished)
+        self.probe_thread.start()
+    
+    def latex_probe_finished(self, installed, path):
+        """Record the result of the LaTeX probe"""
+        self.latex_installed = installed
+        self.pdflatex_path = path or None
+        self.update_latex_status()
+        self.update_button_states()
+        
+        if not installed:
+            show_latex_installation_dialog()
+    
+    def update_latex_status(self):
+        """Show whether LaTeX is available in the status panel"""
+        if self.latex_installed is None:
+            status_text, status_color = "Checking LaTeX installation...", "#888888"
+        elif self.latex_installed:
+            status_text, status_color = "LaTeX is installed and ready", "#27ae60"
+        else:
+            status_text, status_color = "LaTeX is not installed", "#e74c3c"
+        
+        self.latex_status_label.setText(status_text)
+        self.latex_status_label.setStyleSheet(f"color: {status_color}; font-weight: bold; padding: 10px;")
         
     def init_ui(self):
         # Set window properties
@@ -70,31 +203,23 @@ class LatexReportCustomizerGUI(QMainWindow):
         right_panel.setSpacing(10)
         right_panel.setContentsMargins(0, 0, 0, 0)
         
-        # Add logo at the top of left panel
-        logo_layout = QHBoxLayout()
-        logo_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "image.png")
-        if not os.path.exists(logo_path):
-            logo_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "image.png")
+        # Add logo at the top of left panel; the image itself is decoded after
+        # the first paint, but its space is reserved from the header size now
+        self.logo_layout = QHBoxLayout()
+        self.logo_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "image.png")
             
-        if os.path.exists(logo_path):
-            # Check if it's SVG or PNG and use appropriate widget
-            if (logo_path.lower().endswith('.svg')):
-                logo_widget = QSvgWidget(logo_path)
-                logo_widget.setFixedSize(250, 100)
-            else:
-                logo_label = QLabel()
-                pixmap = QPixmap(logo_path)
-                # Resize the logo to a reasonable size if needed
-                if pixmap.width() > 300:
-                    pixmap = pixmap.scaledToWidth(250, Qt.SmoothTransformation)
-                logo_label.setPixmap(pixmap)
-                logo_label.setAlignment(Qt.AlignCenter)
-                logo_widget = logo_label
+        if os.path.exists(self.logo_path):
+            self.logo_label = QLabel()
+            self.logo_label.setAlignment(Qt.AlignCenter)
+            size = QImageReader(self.logo_path).size()
+            if size.isValid():
+                height = size.height() * 250 // size.width() if size.width() > 300 else size.height()
+                self.logo_label.setMinimumHeight(height)
                 
-            logo_layout.addStretch()
-            logo_layout.addWidget(logo_widget)
-            logo_layout.addStretch()
-            left_panel.addLayout(logo_layout)
+            self.logo_layout.addStretch()
+            self.logo_layout.addWidget(self.logo_label)
+            self.logo_layout.addStretch()
+            left_panel.addLayout(self.logo_layout)
             left_panel.addSpacing(10)
         
         # File selection group
@@ -126,12 +251,41 @@ class LatexReportCustomizerGUI(QMainWindow):
         scroll_area.setFrameShape(QScrollArea.NoFrame)
         
         scroll_widget = QWidget()
+        # Components are dropped here when dragged to a new position
+        scroll_widget.setAcceptDrops(True)
+        scroll_widget.installEventFilter(self)
+        self.components_widget = scroll_widget
+        self.components_scroll = scroll_area
         self.components_layout = QVBoxLayout(scroll_widget)
         self.components_layout.setAlignment(Qt.AlignTop)
         self.components_layout.setSpacing(6)
         self.components_layout.setContentsMargins(5, 5, 5, 5)
         scroll_area.setWidget(scroll_widget)
         
+        # Full-text search over the section bodies
+        search_layout = QHBoxLayout()
+        search_layout.setSpacing(6)
+        
+        self.search_edit = QLineEdit()
+        self.search_edit.setPlaceholderText("Search sections…")
+        self.search_edit.setClearButtonEnabled(True)
+        self.search_timer = QTimer(self)
+        self.search_timer.setSingleShot(True)
+        self.search_timer.setInterval(SEARCH_DELAY)
+        self.search_timer.timeout.connect(self.run_search)
+        self.search_edit.textChanged.connect(self.search_timer.start)
+        
+        self.match_label = QLabel()
+        self.select_matching_button = QPushButton("Select Matching")
+        self.select_matching_button.setProperty("secondary", True)
+        self.select_matching_button.setEnabled(False)
+        self.select_matching_button.clicked.connect(self.select_matching_components)
+        
+        search_layout.addWidget(self.search_edit, 1)
+        search_layout.addWidget(self.match_label)
+        search_layout.addWidget(self.select_matching_button)
+        components_layout.addLayout(search_layout)
+        
         # Add placeholder message
         self.placeholder_label = QLabel("Load a LaTeX file to see available components")
         self.placeholder_label.setAlignment(Qt.AlignCenter)
@@ -157,8 +311,28 @@ class LatexReportCustomizerGUI(QMainWindow):
         selection_layout.addWidget(self.select_all_button)
         selection_layout.addWidget(self.deselect_all_button)
         selection_layout.addStretch()
+        
+        # Live page/size estimate of the current selection
+        self.estimate_label = QLabel()
+        self.estimate_label.setToolTip(
+            "Estimated from previous builds of this document, or from the source size")
+        selection_layout.addWidget(self.estimate_label)
         left_panel.addLayout(selection_layout)
         
+        # References from the selection into excluded sections, shown before building
+        reference_layout = QHBoxLayout()
+        self.reference_label = QLabel()
+        self.reference_label.setStyleSheet("color: #e67e22;")
+        self.include_referenced_button = QPushButton("Add Referenced")
+        self.include_referenced_button.setProperty("secondary", True)
+        self.include_referenced_button.setToolTip("Select the sections the current selection refers to")
+        self.include_referenced_button.clicked.connect(self.include_referenced_components)
+        reference_layout.addWidget(self.reference_label, 1)
+        reference_layout.addWidget(self.include_referenced_button)
+        self.reference_label.hide()
+        self.include_referenced_button.hide()
+        left_panel.addLayout(reference_layout)
+        
         # =================== RIGHT PANEL ===================
         
         # Add spacer to push content down a bit to align with left panel
@@ -169,12 +343,9 @@ class LatexReportCustomizerGUI(QMainWindow):
         status_layout = QVBoxLayout()
         status_layout.setContentsMargins(10, 15, 10, 10)
         
-        status_text = "LaTeX is installed and ready" if self.latex_installed else "LaTeX is not installed"
-        status_color = "#27ae60" if self.latex_installed else "#e74c3c"
-        
-        self.latex_status_label = QLabel(status_text)
-        self.latex_status_label.setStyleSheet(f"color: {status_color}; font-weight: bold; padding: 10px;")
+        self.latex_status_label = QLabel()
         self.latex_status_label.setAlignment(Qt.AlignCenter)
+        self.update_latex_status()
         
         status_layout.addWidget(self.latex_status_label)
         status_group.setLayout(status_layout)
@@ -243,7 +414,27 @@ class LatexReportCustomizerGUI(QMainWindow):
         self.progress_bar.setMinimumHeight(20)
         self.progress_bar.setTextVisible(True)
         
+        # Opt-in: compile the whole document once and cut variants out of it
+        self.fast_variants_checkbox = QCheckBox("Fast variants")
+        self.fast_variants_checkbox.setToolTip(
+            "Compile the full document once and build each PDF from its pages.\n"
+            "Much faster for repeated selections; page numbers, references and the\n"
+            "table of contents stay those of the full document.")
+        
+        # Opt-in: leave out \usepackage lines the selected sections never use
+        self.prune_packages_checkbox = QCheckBox("Skip unused packages")
+        self.prune_packages_checkbox.setToolTip(
+            "Leave out packages such as TikZ or listings when the selected sections do not use them.\n"
+            "If the build then fails, it is repeated with every package, and those packages\n"
+            "are not left out of this document again.\n"
+            "Not available with fast variants, which always compile the full document.")
+        self.prune_packages_checkbox.setChecked(os.environ.get('LRC_PRUNE_PREAMBLE', '0') not in ('', '0'))
+        self.fast_variants_checkbox.toggled.connect(
+            lambda checked: self.prune_packages_checkbox.setEnabled(not checked))
+        
         generate_layout.addWidget(self.generate_button)
+        generate_layout.addWidget(self.fast_variants_checkbox)
+        generate_layout.addWidget(self.prune_packages_checkbox)
         generate_layout.addSpacing(10)
         generate_layout.addWidget(self.generate_tex_button)
         generate_layout.addSpacing(10)
@@ -251,6 +442,27 @@ class LatexReportCustomizerGUI(QMainWindow):
         generate_group.setLayout(generate_layout)
         right_panel.addWidget(generate_group)
         
+        # Queued and running builds
+        jobs_group = QGroupBox("Jobs")
+        jobs_layout = QVBoxLayout()
+        jobs_layout.setContentsMargins(10, 15, 10, 10)
+        
+        self.jobs_list = QTreeWidget()
+        self.jobs_list.setHeaderLabels(["Job", "Status"])
+        self.jobs_list.setRootIsDecorated(False)
+        self.jobs_list.setMinimumHeight(90)
+        self.jobs_list.itemSelectionChanged.connect(self.update_cancel_button)
+        
+        self.cancel_job_button = QPushButton("Cancel Job")
+        self.cancel_job_button.setProperty("secondary", True)
+        self.cancel_job_button.setEnabled(False)
+        self.cancel_job_button.clicked.connect(self.cancel_selected_jobs)
+        
+        jobs_layout.addWidget(self.jobs_list)
+        jobs_layout.addWidget(self.cancel_job_button)
+        jobs_group.setLayout(jobs_layout)
+        right_panel.addWidget(jobs_group)
+        
         # Add stretching space to push everything up
         right_panel.addStretch(1)
         
@@ -308,12 +520,6 @@ class LatexReportCustomizerGUI(QMainWindow):
         
         # Disable buttons initially
         self.update_button_states()
-        
-        # Create menu bar
-        self.create_menu_bar()
-        
-        # Apply theme after all UI elements have been created
-        self.apply_theme()
     
     def toggle_theme_from_slider(self, value):
         """Toggle theme based on slider value"""
@@ -339,283 +545,13 @@ class LatexReportCustomizerGUI(QMainWindow):
         
     def apply_theme(self):
         """Apply the current theme (light or dark mode)"""
+        # Before startup finishes, finish_startup applies the chosen theme
+        if not self.startup_complete:
+            return
         try:
-            QApplication.processEvents()  # Process any pending events first
-            
-            if self.dark_mode:
-                # Dark mode styles
-                self.setStyleSheet("""
-                    QMainWindow, QWidget {
-                        background-color: #2d2d2d;
-                        color: #e0e0e0;
-                    }
-                    QGroupBox {
-                        font-weight: bold;
-                        font-size: 11pt;
-                        border: 1px solid #444444;
-                        border-radius: 6px;
-                        margin-top: 1.5ex;
-                        background-color: #333333;
-                        padding: 8px;
-                        color: #ffffff; /* Set text color for group box title */
-                    }
-                    QGroupBox::title {
-                        subcontrol-origin: margin;
-                        subcontrol-position: top left;
-                        padding: 0 5px;
-                        color: #ffffff; /* Make title white in dark mode */
-                    }
-                    QPushButton {
-                        background-color: #0c61c9;
-                        color: white;
-                        border: none;
-                        border-radius: 4px;
-                        font-weight: bold;
-                        min-height: 28px;
-                        padding: 4px 16px;
-                    }
-                    QPushButton:hover {
-                        background-color: #1471d9;
-                    }
-                    QPushButton:pressed {
-                        background-color: #0a51a9;
-                    }
-                    QPushButton:disabled {
-                        background-color: #555555;
-                        color: #888888;
-                    }
-                    QPushButton[secondary="true"] {
-                        background-color: #666666;
-                    }
-                    QPushButton[secondary="true"]:hover {
-                        background-color: #777777;
-                    }
-                    QPushButton[secondary="true"]:pressed {
-                        background-color: #555555;
-                    }
-                    QPushButton[primary="true"] {
-                        background-color: #278c54;
-                        color: white;
-                        padding: 8px;
-                        font-weight: bold;
-                        font-size: 16px;
-                        letter-spacing: 1px;
-                    }
-                    QPushButton[primary="true"]:hover {
-                        background-color: #22774a;
-                    }
-                    QPushButton[primary="true"]:pressed {
-                        background-color: #1d6940;
-                    }
-                    QPushButton[primary="true"]:disabled {
-                        background-color: #555555;
-                    }
-                    QCheckBox {
-                        spacing: 8px;
-                        font-size: 10.5pt;
-                        padding: 2px 0;
-                        color: #cccccc;
-                    }
-                    QCheckBox::indicator {
-                        width: 16px;
-                        height: 16px;
-                    }
-                    QScrollArea, QScrollBar {
-                        border: none;
-                        background-color: #333333;
-                    }
-                    QScrollBar:vertical {
-                        border: none;
-                        background: #444444;
-                        width: 10px;
-                        margin: 0;
-                    }
-                    QScrollBar::handle:vertical {
-                        background: #666666;
-                        min-height: 20px;
-                        border-radius: 5px;
-                    }
-                    QProgressBar {
-                        border: 1px solid #555555;
-                        border-radius: 4px;
-                        text-align: center;
-                        background-color: #444444;
-                    }
-                    QProgressBar::chunk {
-                        background-color: #0c61c9;
-                        border-radius: 3px;
-                    }
-                    QStatusBar {
-                        background-color: #333333;
-                        color: #bbbbbb;
-                    }
-                    QLabel {
-                        color: #e0e0e0;
-                    }
-                    QMenuBar {
-                        background-color: #333333;
-                        color: #e0e0e0;
-                    }
-                    QMenuBar::item {
-                        background-color: #333333;
-                        color: #e0e0e0;
-                    }
-                    QMenuBar::item:selected {
-                        background-color: #444444;
-                    }
-                    QMenu {
-                        background-color: #333333;
-                        color: #e0e0e0;
-                        border: 1px solid #444444;
-                    }
-                    QMenu::item:selected {
-                        background-color: #444444;
-                    }
-                    QSlider::groove:horizontal {
-                        border: 1px solid #444444;
-                        height: 10px;
-                        background: #333333;
-                        margin: 2px 0;
-                        border-radius: 5px;
-                    }
-                    QSlider::handle:horizontal {
-                        background: #f39c12;
-                        border: 1px solid #555555;
-                        width: 18px;
-                        margin: -5px 0;
-                        border-radius: 9px;
-                    }
-                    QFrame[frameShape="4"] { /* VLine */
-                        color: #555555;
-                    }
-                    QFileDialog {
-                        background-color: #333333;
-                        color: #e0e0e0;
-                    }
-                """)
-                
-                # Update specific elements that need targeted styling
-                self.file_label.setStyleSheet("color: #e0e0e0;")
-                self.placeholder_label.setStyleSheet("color: #999999; font-style: italic; padding: 20px;")
-                
-            else:
-                # Light mode styles
-                self.setStyleSheet("""
-                    QMainWindow, QWidget {
-                        background-color: #ffffff;
-                        color: #333333;
-                    }
-                    QGroupBox {
-                        font-weight: bold;
-                        font-size: 11pt;
-                        border: 1px solid #e1e1e1;
-                        border-radius: 6px;
-                        margin-top: 1.5ex;
-                        background-color: #fafafa;
-                        padding: 8px;
-                    }
-                    QGroupBox::title {
-                        subcontrol-origin: margin;
-                        subcontrol-position: top left;
-                        padding: 0 5px;
-                        color: #444444;
-                    }
-                    QPushButton {
-                        background-color: #4a86e8;
-                        color: white;
-                        border: none;
-                        border-radius: 4px;
-                        font-weight: bold;
-                        min-height: 28px;
-                        padding: 4px 16px;
-                    }
-                    QPushButton:hover {
-                        background-color: #3a76d8;
-                    }
-                    QPushButton:pressed {
-                        background-color: #2a66c8;
-                    }
-                    QPushButton:disabled {
-                        background-color: #cccccc;
-                        color: #888888;
-                    }
-                    QPushButton[secondary="true"] {
-                        background-color: #3498db;
-                    }
-                    QPushButton[secondary="true"]:hover {
-                        background-color: #2980b9;
-                    }
-                    QPushButton[secondary="true"]:pressed {
-                        background-color: #1c6da3;
-                    }
-                    QPushButton[primary="true"] {
-                        background-color: #27ae60;
-                        color: white;
-                        padding: 8px;
-                        font-weight: bold;
-                        font-size: 16px;
-                        letter-spacing: 1px;
-                    }
-                    QPushButton[primary="true"]:hover {
-                        background-color: #219955;
-                    }
-                    QPushButton[primary="true"]:pressed {
-                        background-color: #1e8449;
-                    }
-                    QPushButton[primary="true"]:disabled {
-                        background-color: #cccccc;
-                    }
-                    QCheckBox {
-                        spacing: 8px;
-                        font-size: 10.5pt;
-                        padding: 2px 0;
-                    }
-                    QCheckBox::indicator {
-                        width: 16px;
-                        height: 16px;
-                    }
-                    QScrollArea {
-                        border: none;
-                        background-color: transparent;
-                    }
-                    QProgressBar {
-                        border: 1px solid #e1e1e1;
-                        border-radius: 4px;
-                        text-align: center;
-                        background-color: #f5f5f5;
-                    }
-                    QProgressBar::chunk {
-                        background-color: #4a86e8;
-                        border-radius: 3px;
-                    }
-                    QStatusBar {
-                        background-color: #f5f5f5;
-                        color: #444444;
-                    }
-                    QSlider::groove:horizontal {
-                        border: 1px solid #cccccc;
-                        height: 10px;
-                        background: #f0f0f0;
-                        margin: 2px 0;
-                        border-radius: 5px;
-                    }
-                    QSlider::handle:horizontal {
-                        background: #4a86e8;
-                        border: 1px solid #5c5c5c;
-                        width: 18px;
-                        margin: -5px 0;
-                        border-radius: 9px;
-                    }
-                    QFrame[frameShape="4"] { /* VLine */
-                        color: #e1e1e1;
-                    }
-                """)
-                
-                # Update placeholder style
-                self.placeholder_label.setStyleSheet("color: #888888; font-style: italic; padding: 20px;")
-            
-            # Use a single processEvents call after applying styles
-            QApplication.processEvents()
+            # Highlighted search matches have a theme-specific background too
+            apply_theme(self, self.themed_widgets + self.matched_checkboxes,
+                        'dark' if self.dark_mode else 'light')
         except Exception as e:
             print(f"Error applying theme: {str(e)}")
 
@@ -638,11 +574,21 @@ class LatexReportCustomizerGUI(QMainWindow):
         generate_pdf_action.triggered.connect(self.generate_pdf)
         file_menu.addAction(generate_pdf_action)
         
+        quick_preview_action = QAction("&Quick Preview", self)
+        quick_preview_action.setShortcut("Ctrl+Shift+P")
+        quick_preview_action.triggered.connect(self.preview_pdf)
+        file_menu.addAction(quick_preview_action)
+        
         generate_tex_action = QAction("Export &TEX File", self)
         generate_tex_action.setShortcut("Ctrl+T")
         generate_tex_action.triggered.connect(self.generate_tex)
         file_menu.addAction(generate_tex_action)
         
+        export_project_action = QAction("Export TEX &Project...", self)
+        export_project_action.setShortcut("Ctrl+Shift+T")
+        export_project_action.triggered.connect(self.export_tex_project)
+        file_menu.addAction(export_project_action)
+        
         file_menu.addSeparator()
         
         exit_action = QAction("E&xit", self)
@@ -658,6 +604,26 @@ class LatexReportCustomizerGUI(QMainWindow):
         theme_action.triggered.connect(self.toggle_theme)
         view_menu.addAction(theme_action)
         
+        view_menu.addSeparator()
+        
+        preview_action = QAction("&Preview Last PDF", self)
+        preview_action.setShortcut("Ctrl+P")
+        preview_action.triggered.connect(lambda: self.show_pdf(self.output_file))
+        view_menu.addAction(preview_action)
+        
+        # Quick previews can draw figures as empty frames (the class's draft option)
+        self.draft_figures_action = QAction("&Figure Placeholders in Quick Preview", self)
+        self.draft_figures_action.setCheckable(True)
+        view_menu.addAction(self.draft_figures_action)
+        
+        trace_action = QAction("Export Build &Trace...", self)
+        trace_action.triggered.connect(self.export_build_trace)
+        view_menu.addAction(trace_action)
+        
+        history_action = QAction("Build &History...", self)
+        history_action.triggered.connect(self.show_build_history)
+        view_menu.addAction(history_action)
+        
         # Help menu
         help_menu = menu_bar.addMenu("&Help")
         
@@ -681,7 +647,8 @@ class LatexReportCustomizerGUI(QMainWindow):
         
         self.select_all_button.setEnabled(has_components)
         self.deselect_all_button.setEnabled(has_components and has_selected)
-        self.generate_button.setEnabled(has_file and has_selected and self.latex_installed)
+        # latex_installed is None while the probe is still running
+        self.generate_button.setEnabled(bool(has_file and has_selected and self.latex_installed))
         self.generate_tex_button.setEnabled(has_file and has_selected)
     
     def select_file(self):
@@ -692,6 +659,7 @@ class LatexReportCustomizerGUI(QMainWindow):
         if file_path:
             self.input_file = file_path
             self.file_label.setText(os.path.basename(file_path))
+            self.watch_input_file()
             
             # Clean up any existing temp files
             self.cleanup_temp_files()
@@ -710,14 +678,22 @@ class LatexReportCustomizerGUI(QMainWindow):
 
     def cleanup_temp_files(self):
         """Clean up temporary files"""
-        if hasattr(self, 'temp_pdf_file') and self.temp_pdf_file and os.path.exists(self.temp_pdf_file):
-            try:
-                os.remove(self.temp_pdf_file)
-            except Exception as e:
-                print(f"Failed to remove temp file: {str(e)}")
+        if self.preview_job is not None and self.preview_job.active:
+            self.job_queue.cancel(self.preview_job)
+        if self.temp_pdf_file:
+            # Remove the whole scratch directory, not just the file inside it
+            workspace = get_workspace()
+            temp_dir = os.path.dirname(self.temp_pdf_file)
+            workspace.release(temp_dir if workspace.owns(temp_dir) else self.temp_pdf_file)
+            self.temp_pdf_file = None
             
-    def parse_components(self):
-        """Parse sections and subsections from the LaTeX file"""
+    def parse_components(self, unchecked=None, order=None):
+        """Parse sections and subsections from the LaTeX file
+
+        Components named in unchecked start deselected and order (a list of
+        keys) rearranges them; both are used when reloading.
+        """
+        unchecked = unchecked or set()
         try:
             # Clear existing components
             for i in reversed(range(self.components_layout.count())):
@@ -727,61 +703,47 @@ class LatexReportCustomizerGUI(QMainWindow):
             
             self.components = []
             self.component_checkboxes = []
+            self.component_spans = []
+            self.component_rows = []
+            self.checkbox_by_key = {}
+            self.matched_checkboxes = []
             
             # Read the LaTeX file
             with open(self.input_file, 'r', encoding='utf-8') as file:
                 content = file.read()
             
-            # Extract document content
-            doc_start = content.find('\\begin{document}')
-            doc_end = content.find('\\end{document}')
-            
-            if doc_start == -1 or doc_end == -1:
-                raise ValueError("Could not find document begin/end tags")
-                
-            doc_content = content[doc_start + len('\\begin{document}'):doc_end]
+            # Index the document body (raises if begin/end tags are missing)
+            self.section_index = SectionIndex(content)
             
             # Show progress
             self.progress_bar.setValue(40)
             QApplication.processEvents()
             
-            # Find section commands
-            pattern = r'\\(chapter|section|subsection|subsubsection){([^}]*)}'
-            matches = list(re.finditer(pattern, doc_content))
-            
-            # Keep track of current section
-            current_section = None
             section_count = 0
             
-            if matches:
-                for match in matches:
-                    section_type = match.group(1)
-                    section_title = match.group(2).strip()
-                    
-                    # Determine indentation level
-                    indent_level = 0
-                    if section_type == 'subsection':
-                        indent_level = 1
-                    elif section_type == 'subsubsection':
-                        indent_level = 2
-                    
-                    # Add component checkbox
-                    if section_type == 'section' or section_type == 'chapter':
-                        current_section = section_title
-                        self.add_component(section_title, indent=False)
-                    else:
-                        # For subsections, store the parent section relationship
-                        if current_section:
-                            title = f"{current_section} - {section_title}"
-                            self.add_component(title, indent=True, indent_level=indent_level)
-                        else:
-                            self.add_component(section_title, indent=True, indent_level=indent_level)
-                    
-                    section_count += 1
+            spans = self.section_index.ordered_spans(order) if order else self.section_index.spans
+            for span in spans:
+                self.component_spans.append(span)
+                # Add component checkbox; subsections carry their parent in the key
+                checked = span.key not in unchecked
+                if span.level == 0:
+                    self.add_component(span.key, indent=False, checked=checked)
+                else:
+                    self.add_component(span.key, indent=True, indent_level=span.level, checked=checked)
+                    # Subsections of a deselected section are disabled, as on_component_toggled does
+                    section = span.key.split(" - ", 1)[0]
+                    if section in unchecked:
+                        self.checkbox_by_key[span.key].setEnabled(False)
+                
+                section_count += 1
             
             self.progress_bar.setValue(80)
             QApplication.processEvents()
             
+            self.update_page_estimate(rebuild=True)
+            self.update_reference_warning(rebuild=True)
+            self.start_search_index()
+            
             if section_count == 0:
                 label = QLabel("No sections found in the document")
                 label.setStyleSheet("color: #e74c3c; font-style: italic; padding: 20px;")
@@ -801,10 +763,10 @@ class LatexReportCustomizerGUI(QMainWindow):
             self.statusBar.showMessage("Error parsing LaTeX file")
             self.progress_bar.setValue(0)
     
-    def add_component(self, title, indent=False, indent_level=0):
+    def add_component(self, title, indent=False, indent_level=0, checked=True):
         """Add a component checkbox to the UI with improved styling"""
         checkbox = QCheckBox(title)
-        checkbox.setChecked(True)
+        checkbox.setChecked(checked)
         
         if indent:
             # Create container for indented subsections
@@ -822,6 +784,7 @@ class LatexReportCustomizerGUI(QMainWindow):
             checkbox.setProperty("component-type", "subsection")
             
             self.components_layout.addWidget(container)
+            self.component_rows.append(container)
         else:
             # Add section with bold font but no color (handled by theme)
             font = checkbox.font()
@@ -830,14 +793,26 @@ class LatexReportCustomizerGUI(QMainWindow):
             # Store section type in a property
             checkbox.setProperty("component-type", "section")
             self.components_layout.addWidget(checkbox)
+            self.component_rows.append(checkbox)
+        
+        # Dragging or Alt+Up/Down moves the component among its siblings
+        checkbox.installEventFilter(self)
+        checkbox.setToolTip("Drag or press Alt+Up/Alt+Down to move")
         
         # Connect checkbox to parent section handling
         checkbox.toggled.connect(self.on_component_toggled)
         self.component_checkboxes.append(checkbox)
+        self.checkbox_by_key.setdefault(title, checkbox)
     
     def on_component_toggled(self):
         """Handle component checkbox state changes"""
         sender = self.sender()
+        if sender and self.page_estimate is not None:
+            self.page_estimate.toggle(sender.text(), sender.isChecked())
+            self.update_page_estimate()
+        if sender and self.reference_graph is not None:
+            self.reference_graph.toggle(sender.text(), sender.isChecked())
+            self.update_reference_warning()
         if sender:
             # If it's a section checkbox, handle subsections
             if " - " not in sender.text():
@@ -850,6 +825,273 @@ class LatexReportCustomizerGUI(QMainWindow):
         
         self.update_button_states()
     
+    def update_page_estimate(self, rebuild=False):
+        """Show the estimated size of the selection; rebuild=True reloads what builds learned"""
+        if self.section_index is None:
+            return
+        if rebuild:
+            source_dir = os.path.dirname(os.path.abspath(self.input_file))
+            self.page_estimate = PageEstimate(self.section_index, source_dir, load_learned(self.input_file))
+            self.page_estimate.set_selection(cb.text() for cb in self.component_checkboxes if cb.isChecked())
+        self.estimate_label.setText(self.page_estimate.describe())
+    
+    def update_reference_warning(self, rebuild=False):
+        """Warn about \\ref and \\cite commands that point into excluded sections"""
+        if self.section_index is None:
+            return
+        if rebuild:
+            self.reference_graph = ReferenceGraph(self.section_index)
+            self.reference_graph.set_selection(cb.text() for cb in self.component_checkboxes if cb.isChecked())
+        count = self.reference_graph.broken_count()
+        if not count:
+            self.reference_label.hide()
+            self.include_referenced_button.hide()
+            return
+        self.reference_label.setText(
+            f"⚠ {count} reference{'s' if count != 1 else ''} to excluded sections will show as ??")
+        self.reference_label.setToolTip('\n'.join(self.reference_graph.describe_broken()))
+        self.reference_label.show()
+        self.include_referenced_button.show()
+    
+    def include_referenced_components(self):
+        """Select the excluded sections the selection refers to, until nothing is missing"""
+        added = 0
+        missing = set(self.reference_graph.missing_components())
+        while missing:
+            wanted = set()
+            for span in self.section_index.spans:
+                if span.key in missing:
+                    while span is not None and span.key not in wanted:
+                        wanted.add(span.key)
+                        span = span.parent
+            # Document order: a section is switched on before its subsections
+            before = added
+            for checkbox in self.component_checkboxes:
+                if checkbox.text() in wanted and not checkbox.isChecked():
+                    checkbox.setEnabled(True)
+                    checkbox.setChecked(True)
+                    added += 1
+            if added == before:
+                break
+            # Newly added sections may refer to further ones
+            missing = set(self.reference_graph.missing_components())
+        
+        self.statusBar.showMessage(f"Added {added} referenced components")
+        self.update_button_states()
+    
+    def watch_input_file(self):
+        """Reload the components when the selected file changes on disk"""
+        if self.file_watcher is None:
+            self.file_watcher = QFileSystemWatcher(self)
+            self.reload_timer = QTimer(self)
+            self.reload_timer.setSingleShot(True)
+            self.reload_timer.setInterval(RELOAD_DELAY)
+            self.reload_timer.timeout.connect(self.reload_input_file)
+            self.file_watcher.fileChanged.connect(self.reload_timer.start)
+        watched = self.file_watcher.files()
+        if watched:
+            self.file_watcher.removePaths(watched)
+        self.file_watcher.addPath(self.input_file)
+    
+    def reload_input_file(self):
+        """Re-read the file after an edit, keeping the current selection"""
+        if not self.input_file or not os.path.exists(self.input_file):
+            # Some editors save by deleting and recreating the file; wait for the new one
+            return
+        # Saving through a replacement file drops it from the watcher
+        if self.input_file not in self.file_watcher.files():
+            self.file_watcher.addPath(self.input_file)
+        
+        unchecked = {cb.text() for cb in self.component_checkboxes if not cb.isChecked()}
+        self.parse_components(unchecked, self.component_order())
+        self.statusBar.showMessage(f"Reloaded: {os.path.basename(self.input_file)}")
+    
+    def start_search_index(self):
+        """Index the section bodies in the background; unchanged sections are reused"""
+        thread = SearchIndexThread(self.section_index, previous=self.search_index)
+        thread.index_ready.connect(lambda search_index: self.search_index_ready(thread, search_index))
+        thread.finished.connect(lambda: self.search_threads.remove(thread))
+        self.search_threads.append(thread)
+        self.match_label.setText("Indexing…" if self.search_edit.text().strip() else "")
+        thread.start()
+    
+    def search_index_ready(self, thread, search_index):
+        # Results for a file that has since been reloaded are dropped
+        if thread.section_index is not self.section_index:
+            return
+        self.search_index = search_index
+        self.search_source = thread.section_index
+        self.run_search()
+    
+    def run_search(self):
+        """Highlight the components whose text matches the search box"""
+        query = self.search_edit.text().strip()
+        if not query or self.section_index is None:
+            self.set_matches([])
+            self.match_label.setText("")
+            return
+        if self.search_index is None:
+            # search_index_ready runs the search once the index is built
+            self.match_label.setText("Indexing…")
+            return
+        # After a reload the previous index answers until the new one is ready
+        keys = [key for key in self.search_index.matching_keys(query) if key in self.checkbox_by_key]
+        self.set_matches([self.checkbox_by_key[key] for key in keys])
+        if self.search_source is self.section_index:
+            self.match_label.setText(f"{len(keys)} matching")
+        else:
+            self.match_label.setText("Indexing…")
+    
+    def set_matches(self, checkboxes):
+        """Mark checkboxes as search matches, re-polishing only those that changed"""
+        old = set(self.matched_checkboxes)
+        new = set(checkboxes)
+        for checkbox in old.symmetric_difference(new):
+            checkbox.setProperty("match", checkbox in new)
+            style = checkbox.style()
+            style.unpolish(checkbox)
+            style.polish(checkbox)
+        self.matched_checkboxes = checkboxes
+        self.select_matching_button.setEnabled(bool(checkboxes))
+    
+    def select_matching_components(self):
+        """Select exactly the matching components and the sections they belong to"""
+        matched = {checkbox.text() for checkbox in self.matched_checkboxes}
+        wanted = set()
+        for span in self.section_index.spans:
+            if span.key in matched:
+                while span is not None and span.key not in wanted:
+                    wanted.add(span.key)
+                    span = span.parent
+        # Document order: a section is switched before its subsections
+        for checkbox in self.component_checkboxes:
+            checkbox.setChecked(checkbox.text() in wanted)
+        
+        self.statusBar.showMessage(f"Selected {len(matched)} matching components")
+        self.update_button_states()
+    
+    def component_order(self):
+        """Component keys in display order, or None while that is the document's order"""
+        if self.section_index is None or all(a is b for a, b in zip(self.component_spans, self.section_index.spans)):
+            return None
+        return [span.key for span in self.component_spans]
+    
+    def component_block_end(self, row):
+        """Index just past the rows of the component at row and its subsections"""
+        level = self.component_spans[row].level
+        end = row + 1
+        while end < len(self.component_spans) and self.component_spans[end].level > level:
+            end += 1
+        return end
+    
+    def move_component(self, row, destination):
+        """Move a component with its subsections so it starts before row destination"""
+        end = self.component_block_end(row)
+        if row <= destination <= end:
+            return
+        anchor = self.component_rows[destination] if destination < len(self.component_rows) else None
+        target = destination if destination < row else destination - (end - row)
+        
+        moved_rows = self.component_rows[row:end]
+        for items in (self.component_spans, self.component_checkboxes, self.component_rows):
+            block = items[row:end]
+            del items[row:end]
+            items[target:target] = block
+        
+        # Only the moved rows are re-inserted; the rest of the layout stays put
+        for widget in moved_rows:
+            self.components_layout.removeWidget(widget)
+        index = self.components_layout.indexOf(anchor) if anchor is not None else self.components_layout.count()
+        for offset, widget in enumerate(moved_rows):
+            self.components_layout.insertWidget(index + offset, widget)
+        
+        checkbox = self.component_checkboxes[target]
+        self.components_scroll.ensureWidgetVisible(checkbox)
+        self.statusBar.showMessage(f"Moved {checkbox.text()}")
+    
+    def move_component_by(self, checkbox, step):
+        """Swap a component with its previous (step -1) or next (step 1) sibling"""
+        row = self.component_checkboxes.index(checkbox)
+        span = self.component_spans[row]
+        if step < 0:
+            previous = row - 1
+            while previous >= 0 and self.component_spans[previous].level > span.level:
+                previous -= 1
+            if previous >= 0 and self.component_spans[previous].parent is span.parent:
+                self.move_component(row, previous)
+        else:
+            following = self.component_block_end(row)
+            if following < len(self.component_spans) and self.component_spans[following].parent is span.parent:
+                self.move_component(row, self.component_block_end(following))
+        checkbox.setFocus()
+    
+    def drop_component(self, checkbox, y):
+        """Move a dragged component to the sibling position nearest to y"""
+        row = self.component_checkboxes.index(checkbox)
+        span = self.component_spans[row]
+        # Rows above the drop point stay above it
+        drop_row = len(self.component_rows)
+        for number, widget in enumerate(self.component_rows):
+            if widget.geometry().center().y() > y:
+                drop_row = number
+                break
+        # Components only move among their siblings, so snap to the nearest sibling boundary
+        destination = None
+        last_end = None
+        for number, other in enumerate(self.component_spans):
+            if other.parent is span.parent:
+                if number >= drop_row:
+                    destination = number
+                    break
+                last_end = self.component_block_end(number)
+        if destination is None:
+            destination = last_end
+        if destination is not None:
+            self.move_component(row, destination)
+    
+    def eventFilter(self, obj, event):
+        """Drag-and-drop and Alt+Up/Down reordering of the components"""
+        event_type = event.type()
+        if obj is self.components_widget:
+            if event_type in (QEvent.DragEnter, QEvent.DragMove):
+                if event.mimeData().hasFormat(COMPONENT_MIME):
+                    event.acceptProposedAction()
+                    return True
+            elif event_type == QEvent.Drop and event.mimeData().hasFormat(COMPONENT_MIME):
+                key = bytes(event.mimeData().data(COMPONENT_MIME)).decode('utf-8')
+                checkbox = self.dragged_checkbox
+                if checkbox is not None and checkbox.text() == key:
+                    self.drop_component(checkbox, event.pos().y())
+                event.acceptProposedAction()
+                return True
+        elif isinstance(obj, QCheckBox):
+            # Only the component checkboxes have this filter installed
+            if event_type == QEvent.MouseButtonPress and event.button() == Qt.LeftButton:
+                self.drag_start = event.pos()
+            elif (event_type == QEvent.MouseMove and event.buttons() & Qt.LeftButton
+                  and self.drag_start is not None
+                  and (event.pos() - self.drag_start).manhattanLength() >= QApplication.startDragDistance()):
+                self.drag_start = None
+                self.start_component_drag(obj)
+                return True
+            elif (event_type == QEvent.KeyPress and event.modifiers() & Qt.AltModifier
+                  and event.key() in (Qt.Key_Up, Qt.Key_Down)):
+                self.move_component_by(obj, -1 if event.key() == Qt.Key_Up else 1)
+                return True
+        return super().eventFilter(obj, event)
+    
+    def start_component_drag(self, checkbox):
+        mime = QMimeData()
+        mime.setData(COMPONENT_MIME, checkbox.text().encode('utf-8'))
+        drag = QDrag(checkbox)
+        drag.setMimeData(mime)
+        drag.setPixmap(checkbox.grab())
+        self.dragged_checkbox = checkbox
+        drag.exec_(Qt.MoveAction)
+        self.dragged_checkbox = None
+        # The press that started the drag never gets its release
+        checkbox.setDown(False)
+    
     def select_all_components(self):
         """Select all components"""
         for checkbox in self.component_checkboxes:
@@ -867,11 +1109,20 @@ class LatexReportCustomizerGUI(QMainWindow):
         self.statusBar.showMessage("All components deselected")
         self.update_button_states()
     
-    def generate_pdf(self):
-        """Generate the final PDF file"""
+    def can_build(self):
+        """Whether a PDF can be built now; tells the user why not otherwise"""
+        if self.input_file and self.latex_installed is None:
+            QMessageBox.information(self, "LaTeX", "Still checking the LaTeX installation, try again in a moment")
+            return False
         if not self.input_file or not self.latex_installed:
             QMessageBox.warning(self, "Warning", 
                                 "Please select a LaTeX file and ensure LaTeX is installed")
+            return False
+        return True
+    
+    def generate_pdf(self):
+        """Generate the final PDF file"""
+        if not self.can_build():
             return
             
         # Get selected components
@@ -894,26 +1145,84 @@ class LatexReportCustomizerGUI(QMainWindow):
             
         self.output_file = output_file
         
-        # Disable UI elements during processing
-        self.setEnabled(False)
-        self.progress_bar.setValue(0)
         self.statusBar.showMessage("Generating PDF...")
         
-        # Start processing thread
-        self.process_thread = LaTeXProcessingThread(
-            self.input_file, self.output_file, selected_components, self.pdflatex_path
-        )
-        self.process_thread.progress_update.connect(self.progress_bar.setValue)
-        self.process_thread.finished_signal.connect(self.process_completed)
-        self.process_thread.start()
+        thread = self.build_thread_class()(
+            self.input_file, output_file, selected_components, self.pdflatex_path,
+            order=self.component_order(), prune_preamble=self.prune_preamble())
+        thread.trace_ready.connect(self.store_trace)
+        # Fast variants compile the whole document; let plain PDF builds go first
+        priority = BATCH if self.fast_variants_checkbox.isChecked() else EXPORT
+        self.job_queue.submit(
+            f"PDF: {os.path.basename(output_file)}", thread, priority,
+            lambda job, success, message: self.process_completed(job, output_file, success, message))
+    
+    def prune_preamble(self):
+        """Whether builds leave out unused packages (never with fast variants)"""
+        return self.prune_packages_checkbox.isEnabled() and self.prune_packages_checkbox.isChecked()
+    
+    def build_thread_class(self):
+        """Return the thread class that runs PDF builds with the current settings"""
+        # A running compile daemon builds with warm state, and configured
+        # build workers (LRC_BUILD_WORKERS) take the build off this machine
+        if self.fast_variants_checkbox.isChecked():
+            return FastVariantThread
+        if self.daemon_probe.available():
+            return DaemonBuildThread
+        if get_worker_pool() is not None:
+            return RemoteBuildThread
+        return LaTeXProcessingThread
+    
+    def preview_pdf(self):
+        """Build the selection with the quick preview profile and show it"""
+        if not self.can_build():
+            return
+        
+        selected_components = [cb.text() for cb in self.component_checkboxes if cb.isChecked()]
+        if not selected_components:
+            QMessageBox.warning(self, "Warning", "Please select at least one component")
+            return
+        
+        # Only the latest selection is worth previewing
+        if self.preview_job is not None and self.preview_job.active:
+            self.job_queue.cancel(self.preview_job)
+        if not self.temp_pdf_file:
+            self.temp_pdf_file = os.path.join(get_workspace().make_dir("preview_"), "preview.pdf")
+        
+        self.statusBar.showMessage("Building preview...")
+        thread = self.build_thread_class()(
+            self.input_file, self.temp_pdf_file, selected_components, self.pdflatex_path,
+            order=self.component_order(), prune_preamble=self.prune_preamble(),
+            preview=True, draft_figures=self.draft_figures_action.isChecked())
+        thread.trace_ready.connect(self.store_trace)
+        self.preview_job = self.job_queue.submit("Quick preview", thread, PREVIEW, self.preview_completed)
     
-    def process_completed(self, success, message):
+    def preview_completed(self, job, success, message):
+        """Show a finished quick preview"""
+        if job.cancel_requested:
+            return
+        if success:
+            self.update_page_estimate(rebuild=True)
+            self.statusBar.showMessage(self.with_regression(job, self.with_trace_summary("Preview ready")))
+            self.show_pdf(self.temp_pdf_file)
+        elif job.state == 'terminated':
+            self.statusBar.showMessage("Preview stopped")
+            QMessageBox.warning(self, "Build Stopped", message)
+        else:
+            self.statusBar.showMessage("Error building preview")
+            QMessageBox.critical(self, "Error", f"Error building preview: {message}")
+    
+    def process_completed(self, job, output_file, success, message):
         """Handle PDF generation completion"""
-        self.setEnabled(True)
+        if job.cancel_requested:
+            self.statusBar.showMessage("PDF generation cancelled")
+            return
         
         if success:
-            self.progress_bar.setValue(100)
-            self.statusBar.showMessage("PDF generated successfully")
+            # The build taught the estimator this document's page size
+            self.update_page_estimate(rebuild=True)
+            self.statusBar.showMessage(self.with_regression(
+                job, self.with_trace_summary("PDF generated successfully")))
             
             response = QMessageBox.question(self, "Success", 
                                   "PDF generated successfully.\nWould you like to open it now?",
@@ -921,20 +1230,161 @@ class LatexReportCustomizerGUI(QMainWindow):
             
             # Open PDF if user clicks Yes
             if response == QMessageBox.Yes:
-                try:
-                    if os.path.exists(self.output_file):
-                        os.startfile(self.output_file)
-                except Exception:
-                    pass
-            
-            self.progress_bar.setValue(0)
+                self.show_pdf(output_file)
+            elif self.pdf_viewer is not None and self.pdf_viewer.isVisible():
+                # Keep an open preview in step with the latest build
+                self.show_pdf(output_file)
+            return
+        
+        # The watchdog stopped the engine (time, CPU or memory limit)
+        if job.state == 'terminated':
+            self.statusBar.showMessage("PDF generation stopped")
+            QMessageBox.warning(self, "Build Stopped", message)
             return
         
         # Handle error
-        self.progress_bar.setValue(0)
         self.statusBar.showMessage("Error generating PDF")
         QMessageBox.critical(self, "Error", f"Error generating PDF: {message}")
     
+    def show_pdf(self, pdf_file):
+        """Open a PDF in the preview window, or the system viewer without poppler"""
+        if not pdf_file or not os.path.exists(pdf_file):
+            self.statusBar.showMessage("No PDF to preview yet")
+            return
+        # Only loaded once a PDF is shown, to keep startup light
+        import pdf_viewer
+        if not pdf_viewer.rasterizer_available():
+            try:
+                os.startfile(pdf_file)
+            except AttributeError:
+                from PyQt5.QtGui import QDesktopServices
+                from PyQt5.QtCore import QUrl
+                QDesktopServices.openUrl(QUrl.fromLocalFile(pdf_file))
+            except Exception:
+                pass
+            return
+        try:
+            if self.pdf_viewer is None:
+                self.pdf_viewer = pdf_viewer.PdfViewer(self)
+            self.pdf_viewer.open_pdf(pdf_file)
+        except (OSError, RuntimeError) as e:
+            QMessageBox.warning(self, "Preview", f"Could not open the PDF preview: {str(e)}")
+            return
+        self.pdf_viewer.show()
+        self.pdf_viewer.raise_()
+    
+    def store_trace(self, tracer):
+        """Keep the stage timings of the last build for the status bar and export"""
+        self.last_trace = tracer
+        self.statusBar.setToolTip(tracer.table())
+    
+    def with_trace_summary(self, message):
+        """Append the slowest stages of the last build to a status message"""
+        if self.last_trace is None or not self.last_trace.spans:
+            return message
+        return f"{message} — {self.last_trace.summary()}"
+    
+    def with_regression(self, job, message):
+        """Append the build history's note to a status message if the build was unusually slow"""
+        regression = getattr(job.thread, 'regression', None)
+        if not regression:
+            return message
+        return f"{message} — slower than usual ({regression})"
+    
+    def show_build_history(self):
+        """Show build time trends per selection and the recorded builds of the current document"""
+        if not self.input_file:
+            QMessageBox.information(self, "Build History", "Open a LaTeX file first")
+            return
+        import sqlite3
+        import datetime
+        from build_history import format_size, recent_builds, selection_key, predict_seconds, trends
+        
+        document = os.path.abspath(self.input_file)
+        try:
+            builds = recent_builds(document)
+            groups = trends(document)
+        except sqlite3.Error as e:
+            QMessageBox.critical(self, "Error", f"Error reading the build history: {str(e)}")
+            return
+        
+        dialog = QDialog(self)
+        dialog.setWindowTitle(f"Build History — {os.path.basename(self.input_file)}")
+        dialog.resize(820, 560)
+        layout = QVBoxLayout(dialog)
+        
+        selected_components = [cb.text() for cb in self.component_checkboxes if cb.isChecked()]
+        current = selection_key(selected_components, self.component_order())
+        expected = predict_seconds(document, current, 'pdf')
+        flagged = sum(1 for build in builds if build['regression'])
+        layout.addWidget(QLabel(f"{len(builds)} builds, {flagged} slower than usual. "
+                                f"Expected time for the current selection: {expected:.1f} s"))
+        
+        # One row per selection and kind: how its build time moved
+        layout.addWidget(QLabel("Trends by selection (median of the last builds against the latest):"))
+        columns = ["Selection", "Kind", "Components", "Builds", "Median", "Latest", "Change", "Slower builds"]
+        trend_table = QTableWidget(len(groups), len(columns))
+        trend_table.setHorizontalHeaderLabels(columns)
+        trend_table.setEditTriggers(QTableWidget.NoEditTriggers)
+        trend_table.verticalHeader().setVisible(False)
+        trend_table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeToContents)
+        trend_table.horizontalHeader().setStretchLastSection(True)
+        for row, ((_, selection, kind), successful, usual, latest, regressions) in enumerate(groups):
+            change = (latest - usual) / usual * 100 if usual else 0.0
+            values = [f"{selection} (current)" if selection == current else selection, kind,
+                      successful[-1]['components'], len(successful), f"{usual:.1f} s", f"{latest:.1f} s",
+                      f"{change:+.0f}%", len(regressions)]
+            for column, value in enumerate(values):
+                item = QTableWidgetItem("-" if value is None else str(value))
+                if successful[-1]['regression']:
+                    item.setForeground(QColor("#e67e22"))
+                trend_table.setItem(row, column, item)
+        layout.addWidget(trend_table)
+        
+        layout.addWidget(QLabel("Builds:"))
+        columns = ["Finished", "Kind", "Result", "Components", "Time", "Passes", "Cache hits",
+                   "Pages", "Size", "Note"]
+        table = QTableWidget(len(builds), len(columns))
+        table.setHorizontalHeaderLabels(columns)
+        table.setEditTriggers(QTableWidget.NoEditTriggers)
+        table.verticalHeader().setVisible(False)
+        table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeToContents)
+        table.horizontalHeader().setStretchLastSection(True)
+        for row, build in enumerate(builds):
+            values = [datetime.datetime.fromtimestamp(build['finished']).strftime('%Y-%m-%d %H:%M:%S'),
+                      build['kind'], "ok" if build['success'] else "failed", build['components'],
+                      f"{build['seconds']:.1f} s", build['passes'], build['cache_hits'],
+                      build['pages'], format_size(build['size']), build['regression'] or ""]
+            for column, value in enumerate(values):
+                item = QTableWidgetItem("-" if value is None else str(value))
+                if build['regression']:
+                    item.setForeground(QColor("#e67e22"))
+                table.setItem(row, column, item)
+        layout.addWidget(table)
+        
+        close_button = QPushButton("Close")
+        close_button.clicked.connect(dialog.accept)
+        layout.addWidget(close_button, alignment=Qt.AlignRight)
+        dialog.exec_()
+    
+    def export_build_trace(self):
+        """Save the last build's stage timings as a Chrome/Perfetto trace"""
+        if self.last_trace is None:
+            QMessageBox.information(self, "Build Trace", "Generate a PDF or TEX file first")
+            return
+        
+        trace_file, _ = QFileDialog.getSaveFileName(
+            self, "Save Build Trace As", "", "Trace Files (*.json)")
+        
+        if not trace_file:
+            return
+        
+        try:
+            self.last_trace.export_chrome_trace(trace_file)
+            self.statusBar.showMessage(f"Trace saved: {os.path.basename(trace_file)}")
+        except Exception as e:
+            QMessageBox.critical(self, "Error", f"Error saving trace: {str(e)}")
+    
     def generate_tex(self):
         """Generate a customized TEX file based on selected components"""
         if not self.input_file:
@@ -959,101 +1409,105 @@ class LatexReportCustomizerGUI(QMainWindow):
         if not output_file.lower().endswith('.tex'):
             output_file += '.tex'
             
-        try:
-            # Show processing
-            self.setEnabled(False)
-            self.progress_bar.setValue(10)
-            self.statusBar.showMessage("Creating customized TEX file...")
-            
-            # Read the original LaTeX file
-            with open(self.input_file, 'r', encoding='utf-8') as file:
-                content = file.read()
-                
-            # Extract document preamble and ending
-            doc_start = content.find('\\begin{document}')
-            doc_end = content.find('\\end{document}')
-            
-            if doc_start == -1 or doc_end == -1:
-                raise ValueError("Could not find document begin/end tags")
-                
-            preamble = content[:doc_start + len('\\begin{document}')]
-            ending = content[doc_end:]
-            doc_content = content[doc_start + len('\\begin{document}'):doc_end]
-            
-            self.progress_bar.setValue(30)
-            
-            # Filter the document content based on selected components
-            result = []
-            patterns = []
-            
-            # Create regex patterns for each selected component
-            for component in selected_components:
-                # If it's a subsection, get the parent section and subsection names
-                if " - " in component:
-                    section, subsection = component.split(" - ", 1)
-                    # For subsections, keep the line containing the subsection
-                    pattern = r'\\(subsection|subsubsection){' + re.escape(subsection) + r'}'
-                    patterns.append((section, pattern))
-                else:
-                    # For main sections, keep the entire section including subsections
-                    pattern = r'\\(section|chapter){' + re.escape(component) + r'}'
-                    patterns.append((None, pattern))
-            
-            # Process document by lines
-            lines = doc_content.split('\n')
-            include_line = False
-            current_section = None
-            modified_content = []
-            
-            for line in lines:
-                # Check for section headers
-                for section_type in ['chapter', 'section', 'subsection', 'subsubsection']:
-                    if f'\\{section_type}{{' in line:
-                        section_match = re.search(r'\\' + section_type + r'{([^}]*)}', line)
-                        if section_match:
-                            section_title = section_match.group(1).strip()
-                            
-                            if section_type in ['chapter', 'section']:
-                                current_section = section_title
-                                # Check if this section is selected
-                                include_line = any(parent is None and re.search(pattern, line) 
-                                                  for parent, pattern in patterns)
-                            else:  # subsection or subsubsection
-                                if current_section:
-                                    # Check if this subsection is selected
-                                    include_line = any((parent == current_section and re.search(pattern, line))
-                                                      for parent, pattern in patterns)
-                                else:
-                                    # No parent section, check by subsection name only
-                                    include_line = any(parent is None and re.search(pattern, line)
-                                                      for parent, pattern in patterns)
-                
-                if include_line:
-                    modified_content.append(line)
-            
-            self.progress_bar.setValue(70)
-            
-            # Combine preamble, modified content, and ending
-            final_content = preamble + '\n' + '\n'.join(modified_content) + '\n' + ending
+        self.start_tex_export(output_file, selected_components)
+    
+    def export_tex_project(self):
+        """Export the customized TEX file with only the assets it references"""
+        if not self.input_file:
+            QMessageBox.warning(self, "Warning", "Please select a LaTeX file first")
+            return
             
-            # Write the new TEX file
-            with open(output_file, 'w', encoding='utf-8') as output:
-                output.write(final_content)
-                
-            self.progress_bar.setValue(100)
-            self.statusBar.showMessage(f"TEX file saved: {os.path.basename(output_file)}")
+        selected_components = [cb.text() for cb in self.component_checkboxes if cb.isChecked()]
+        
+        if not selected_components:
+            QMessageBox.warning(self, "Warning", "Please select at least one component")
+            return
+        
+        # A .zip name writes an archive, anything else a project folder
+        output_path, _ = QFileDialog.getSaveFileName(
+            self, "Export TEX Project As", "", "ZIP Archive (*.zip);;Project Folder (*)")
+        
+        if not output_path:
+            return
+        
+        if os.path.isfile(output_path) and not output_path.lower().endswith('.zip'):
+            QMessageBox.warning(self, "Warning", "Please choose a folder name or a .zip file")
+            return
             
+        self.start_tex_export(output_path, selected_components, bundle=True)
+    
+    def start_tex_export(self, output_file, selected_components, bundle=False):
+        """Run a TEX export in the background"""
+        self.statusBar.showMessage("Creating customized TEX file...")
+        
+        # Filter and write the file off the GUI thread
+        thread = TexExportThread(self.input_file, output_file, selected_components, bundle,
+                                 order=self.component_order())
+        thread.trace_ready.connect(self.store_trace)
+        kind = "Project" if bundle else "TEX"
+        self.job_queue.submit(f"{kind}: {os.path.basename(output_file)}", thread, BATCH,
+                              self.tex_export_completed)
+    
+    def tex_export_completed(self, job, success, message):
+        """Handle TEX export completion"""
+        if job.cancel_requested:
+            self.statusBar.showMessage("TEX export cancelled")
+            return
+        
+        if success:
+            self.statusBar.showMessage(self.with_trace_summary(
+                f"TEX file saved: {os.path.basename(message)}"))
             QMessageBox.information(self, "Success", 
-                                   f"Customized TEX file generated successfully:\n{output_file}")
-            
-        except Exception as e:
-            QMessageBox.critical(self, "Error", f"Error creating TEX file: {str(e)}")
-            self.statusBar.showMessage("Error creating TEX file")
-        finally:
-            self.setEnabled(True)
-            self.progress_bar.setValue(0)
+                                   f"Customized TEX file generated successfully:\n{message}")
+            return
+        
+        QMessageBox.critical(self, "Error", f"Error creating TEX file: {message}")
+        self.statusBar.showMessage("Error creating TEX file")
+    
+    def job_added(self, job):
+        """Show a newly queued job in the jobs panel"""
+        item = QTreeWidgetItem([job.title, job.status_text()])
+        self.jobs_list.insertTopLevelItem(0, item)
+        self.job_items[job.id] = (job, item)
+        
+        # Keep the panel short: drop the oldest finished jobs
+        finished = [job_id for job_id, (other, _) in self.job_items.items() if not other.active]
+        for job_id in finished[:max(0, len(self.job_items) - MAX_LISTED_JOBS)]:
+            _, old_item = self.job_items.pop(job_id)
+            self.jobs_list.takeTopLevelItem(self.jobs_list.indexOfTopLevelItem(old_item))
+    
+    def job_changed(self, job):
+        """Refresh a job's row and the overall progress bar"""
+        if job.id in self.job_items:
+            self.job_items[job.id][1].setText(1, job.status_text())
+        self.progress_bar.setValue(self.job_queue.overall_progress())
+        self.update_cancel_button()
+    
+    def selected_jobs(self):
+        items = self.jobs_list.selectedItems()
+        return [job for job, item in self.job_items.values() if item in items and job.active]
+    
+    def update_cancel_button(self):
+        self.cancel_job_button.setEnabled(bool(self.selected_jobs()))
+    
+    def cancel_selected_jobs(self):
+        """Cancel the jobs selected in the jobs panel"""
+        for job in self.selected_jobs():
+            self.job_queue.cancel(job)
     
     def closeEvent(self, event):
         """Clean up temporary files when closing the application"""
+        # Running builds stop at their next stage; queued ones never start
+        self.job_queue.cancel_all()
+        if self.job_queue.running:
+            self.statusBar.showMessage("Stopping running jobs...")
+            QApplication.processEvents()
+        self.job_queue.wait()
+        if self.pdf_viewer is not None:
+            self.pdf_viewer.close()
+        for thread in list(self.search_threads):
+            thread.requestInterruption()
+            thread.wait()
         self.cleanup_temp_files()
+        get_workspace().close()
         event.accept()
\ No newline at end of file
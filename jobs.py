@@ -0,0 +1,142 @@
+import heapq
+import itertools
+
+from PyQt5.QtCore import QObject, pyqtSignal
+
+# Lower runs first: an interactive preview jumps ahead of PDF exports, which
+# go before batch work (fast-variant builds, TEX and project exports)
+PREVIEW = 0
+EXPORT = 1
+BATCH = 2
+PRIORITY_NAMES = {PREVIEW: "Preview", EXPORT: "Export", BATCH: "Batch"}
+
+# Builds allowed to run at the same time
+MAX_RUNNING = 2
+
+
+class Job:
+    """One queued build; wraps a thread with progress_update/finished_signal signals"""
+
+    def __init__(self, job_id, title, thread, priority):
+        self.id = job_id
+        self.title = title
+        self.thread = thread
+        self.priority = priority
+        self.state = 'queued'
+        self.progress = 0
+        self.message = ''
+        self.cancel_requested = False
+        # Why the watchdog stopped the job's engine ('timeout', 'cpu', ...), if it did
+        self.termination = None
+
+    @property
+    def active(self):
+        return self.state in ('queued', 'running')
+
+    def status_text(self):
+        if self.state == 'running':
+            return "Cancelling..." if self.cancel_requested else f"Running {self.progress}%"
+        if self.state == 'terminated':
+            return "Timed out" if self.termination == 'timeout' else f"Stopped ({self.termination})"
+        return {'queued': "Queued", 'done': "Done", 'failed': "Failed",
+                'cancelled': "Cancelled"}[self.state]
+
+
+class JobQueue(QObject):
+    """Runs build threads by priority with a limit on how many run at once"""
+    job_added = pyqtSignal(object)
+    job_changed = pyqtSignal(object)
+    job_finished = pyqtSignal(object)
+
+    def __init__(self, max_running=MAX_RUNNING, parent=None):
+        super().__init__(parent)
+        self.max_running = max_running
+        self.pending = []
+        self.running = []
+        self.counter = itertools.count(1)
+
+    def submit(self, title, thread, priority=EXPORT, on_finished=None):
+        """Queue a thread; it is started once a slot is free
+
+        on_finished(job, success, message) is connected before the thread can
+        start, so the result of a build that fails at once is not lost.
+        """
+        job = Job(next(self.counter), title, thread, priority)
+        thread.progress_update.connect(lambda value: self._progress(job, value))
+        thread.finished_signal.connect(lambda success, message: self._completed(job, success, message))
+        if on_finished is not None:
+            thread.finished_signal.connect(lambda success, message: on_finished(job, success, message))
+        # QThread.finished fires after run() has returned, so the slot is really free
+        thread.finished.connect(lambda: self._thread_done(job))
+        heapq.heappush(self.pending, (priority, job.id, job))
+        self.job_added.emit(job)
+        self._start_next()
+        return job
+
+    def cancel(self, job):
+        """Drop a queued job, or ask a running one to stop at its next stage"""
+        if job.state == 'queued':
+            job.state = 'cancelled'
+            self.pending = [entry for entry in self.pending if entry[2] is not job]
+            heapq.heapify(self.pending)
+            self.job_changed.emit(job)
+            self.job_finished.emit(job)
+        elif job.state == 'running' and not job.cancel_requested:
+            job.cancel_requested = True
+            job.thread.requestInterruption()
+            self.job_changed.emit(job)
+
+    def cancel_all(self):
+        for job in [entry[2] for entry in self.pending] + self.running:
+            self.cancel(job)
+
+    def wait(self):
+        """Block until running jobs have stopped (used when closing, after cancel_all())
+
+        Cancelled builds stop within seconds (the engine watchdog kills their
+        processes), and a QThread must not be destroyed while it runs.
+        """
+        for job in list(self.running):
+            job.thread.wait()
+
+    def active_jobs(self):
+        return self.running + [entry[2] for entry in sorted(self.pending)]
+
+    def overall_progress(self):
+        """Average progress of the running jobs, 0 when idle"""
+        if not self.running:
+            return 0
+        return sum(job.progress for job in self.running) // len(self.running)
+
+    def _start_next(self):
+        while self.pending and len(self.running) < self.max_running:
+            _, _, job = heapq.heappop(self.pending)
+            job.state = 'running'
+            self.running.append(job)
+            job.thread.start()
+            self.job_changed.emit(job)
+
+    def _progress(self, job, value):
+        job.progress = value
+        self.job_changed.emit(job)
+
+    def _completed(self, job, success, message):
+        job.message = message
+        termination = getattr(job.thread, 'termination', None)
+        if job.cancel_requested:
+            job.state = 'cancelled'
+        elif termination is not None:
+            job.state = 'terminated'
+            job.termination = termination.reason
+        else:
+            job.state = 'done' if success else 'failed'
+
+    def _thread_done(self, job):
+        if job in self.running:
+            self.running.remove(job)
+        if job.state == 'running':
+            # The thread ended without reporting a result
+            job.state = 'cancelled' if job.cancel_requested else 'failed'
+        self.job_changed.emit(job)
+        self.job_finished.emit(job)
+        self._start_next()
@@ -1,336 +1,390 @@
 import os
 import re
-import subprocess
+import time
 import shutil
+import sqlite3
 from PyQt5.QtCore import QThread, pyqtSignal
-import pdflatex
+
+from assets import shadow_job_files, stage_assets, texinputs_environment, write_bundle
+from bibliography import process_bibliography
+from build_history import ProgressTicker, predict_seconds, record_build, selection_key
+from engine_runner import EngineTerminated, Limits, run_engine
+from page_estimate import LOG_OUTPUT_PATTERN, learn_build_log, learn_page_count
+from preamble_pruning import PrunedPreamble
+from preview_figures import stage_preview_figures
+from section_index import SectionIndex
+from tracing import Tracer
+from workspace import TmpfsFull, WorkspaceQuotaExceeded, get_workspace
+
+DOCUMENTCLASS_PATTERN = re.compile(r'\\documentclass\s*(?:\[([^\]]*)\])?\s*{')
+
+
+def set_class_option(content, option, enabled=True):
+    """Add option to (or remove it from) the options of \\documentclass"""
+    match = DOCUMENTCLASS_PATTERN.search(content)
+    if match is None:
+        return content
+    options = [item.strip() for item in (match.group(1) or '').split(',') if item.strip()]
+    if (option in options) == enabled:
+        return content
+    options = options + [option] if enabled else [item for item in options if item != option]
+    replacement = f"\\documentclass[{','.join(options)}]{{" if options else "\\documentclass{"
+    return content[:match.start()] + replacement + content[match.end():]
+
+
+def place_file(src, dst):
+    """Move src to dst atomically, so dst is never seen half-written"""
+    try:
+        os.replace(src, dst)
+        return
+    except OSError:
+        pass
+    
+    # Different filesystems: copy next to dst first, then rename over it
+    import tempfile
+    handle, partial = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(dst)),
+                                       prefix='.' + os.path.basename(dst), suffix='.part')
+    os.close(handle)
+    try:
+        shutil.copyfile(src, partial)
+        # mkstemp creates the file private; keep the permissions the engine gave it
+        shutil.copymode(src, partial)
+        os.replace(partial, dst)
+    except Exception:
+        if os.path.exists(partial):
+            os.remove(partial)
+        raise
+
+class BuildCancelled(RuntimeError):
+    """Raised inside a build thread once its cancellation was requested"""
+
 
 class LaTeXProcessingThread(QThread):
+    # Kind of build in the build history (preview builds are recorded as 'preview')
+    HISTORY_KIND = 'pdf'
     progress_update = pyqtSignal(int)
     finished_signal = pyqtSignal(bool, str)
+    # Emitted with the build's Tracer once it finishes, successfully or not
+    trace_ready = pyqtSignal(object)
     
-    def __init__(self, input_file, output_file, selected_components, pdflatex_path=None):
+    def __init__(self, input_file, output_file, selected_components, pdflatex_path=None, limits=None,
+                 order=None, prune_preamble=None, preview=False, draft_figures=False):
         super().__init__()
         self.input_file = input_file
         self.output_file = output_file
         self.selected_components = selected_components
+        # Component keys in the order the sections should appear (None: document order)
+        self.order = order
         self.pdflatex_path = pdflatex_path if pdflatex_path else 'pdflatex'
+        # Relative asset paths in the document resolve against its own directory
+        self.source_dir = os.path.dirname(os.path.abspath(input_file))
+        # The document's history and page statistics are kept under this path
+        self.document = os.path.abspath(input_file)
+        self.tracer = Tracer()
+        # Timeouts and resource limits for every engine process of this build
+        self.limits = limits or Limits.from_environment()
+        # Set when the watchdog stopped an engine process (EngineTerminated)
+        self.termination = None
+        # Leave out \usepackage lines the selection does not need (LRC_PRUNE_PREAMBLE=1)
+        if prune_preamble is None:
+            prune_preamble = os.environ.get('LRC_PRUNE_PREAMBLE', '0') not in ('', '0')
+        self.prune_preamble = prune_preamble
+        # Preview profile: only the last pdflatex pass writes a PDF, and with
+        # draft_figures the class's draft option shows figures as placeholders
+        self.preview = preview
+        self.draft_figures = draft_figures
+        # Page count of the output, and a note when the build history found
+        # the build markedly slower than earlier ones
+        self.pages = None
+        self.regression = None
+    
+    def check_cancelled(self):
+        """Stop between stages when the job queue asked this build to cancel"""
+        if self.isInterruptionRequested():
+            raise BuildCancelled("Build cancelled")
         
     def run(self):
+        # Progress follows the duration earlier builds of this selection took
+        ticker = ProgressTicker(self.progress_update.emit, predict_seconds(*self.history_key()))
+        ticker.start()
+        started = time.perf_counter()
         try:
             # Read the LaTeX file
-            with open(self.input_file, 'r', encoding='utf-8') as file:
-                content = file.read()
-                
-            # Progress update
-            self.progress_update.emit(10)
+            with self.tracer.span("read"):
+                with open(self.input_file, 'r', encoding='utf-8') as file:
+                    content = file.read()
             
-            # Create a new LaTeX file with only selected components
-            modified_content = self.process_latex_content(content)
+            success, message = True, self.build(content)
             
-            # Progress update
-            self.progress_update.emit(30)
-            
-            # Write the modified content to a temporary file
-            temp_file = self.output_file.replace('.pdf', '_temp.tex')
-            with open(temp_file, 'w', encoding='utf-8') as file:
-                file.write(modified_content)
-                
-            # Progress update
-            self.progress_update.emit(50)
-            
-            # Compile the LaTeX file to PDF
-            self.compile_latex(temp_file)
-            
-            # Progress update
-            self.progress_update.emit(100)
-            
-            # Signal completion
-            self.finished_signal.emit(True, "PDF generated successfully!")
+        except EngineTerminated as e:
+            if e.reason != 'cancelled':
+                self.termination = e
+            success, message = False, f"Build stopped: {str(e)}"
             
         except Exception as e:
-            self.finished_signal.emit(False, f"Error: {str(e)}")
-    
-    import re
-
-    def process_latex_content(self, content):
-        # Identify document begin and end
-        doc_start = content.find('\\begin{document}')
-        doc_end = content.find('\\end{document}')
-        
-        if doc_start == -1 or doc_end == -1:
-            raise ValueError("Could not find document begin/end tags")
-        
-        # Get the preamble (everything before \begin{document})
-        preamble = content[:doc_start + len('\\begin{document}')]
-        
-        # Get the document content (everything between \begin{document} and \end{document})
-        doc_content = content[doc_start + len('\\begin{document}'):doc_end]
-        
-        # Debug selected components
-        print(f"DEBUG: Selected components: {self.selected_components}")
-        
-        processed_content = ""
-        
-        # Split into fragments based on section or subsection headers
-        sections = re.split(r'(\\section{[^}]*}|\\subsection{[^}]*})', doc_content)
-        
-        # Always include the first fragment (which may include your header, page style, or other settings)
-        if sections:
-            processed_content += sections[0]
-            print(f"DEBUG: Including pre-section content")
+            success, message = False, f"Error: {str(e)}"
+            
+        finally:
+            ticker.stop()
         
-        current_section = None
-        section_selected = False
-        include_content = False
+        if success:
+            self.progress_update.emit(100)
+        if not self.isInterruptionRequested():
+            self.record_history(success, time.perf_counter() - started)
         
-        # First pass: identify which sections are selected
-        selected_sections = set()
-        for comp in self.selected_components:
-            if " - " not in comp:  # It's a main section
-                selected_sections.add(comp)
+        # Signal completion
+        self.trace_ready.emit(self.tracer)
+        self.finished_signal.emit(success, message)
+    
+    def history_key(self):
+        """(document, selection, kind) this build is recorded under in the build history"""
+        kind = 'preview' if self.preview else self.HISTORY_KIND
+        return (self.document, selection_key(self.selected_components, self.order), kind)
+    
+    def record_history(self, success, seconds):
+        """Add this build to the build history; sets self.regression if it was unusually slow"""
+        pdf_file = os.path.splitext(self.output_file)[0] + '.pdf'
+        try:
+            size = os.path.getsize(pdf_file) if success and os.path.exists(pdf_file) else None
+            self.regression = record_build(*self.history_key(), success, seconds, self.tracer,
+                                           components=len(self.selected_components), pages=self.pages,
+                                           size=size)
+        except (OSError, sqlite3.Error) as e:
+            print(f"Could not record build history: {str(e)}")
+        if self.regression:
+            print(f"Build slower than usual: {self.regression}")
+    
+    def build(self, content):
+        """Produce the PDF from the document source; returns the success message"""
+        # Create a new LaTeX file with only selected components
+        modified_content = self.process_latex_content(content)
+        # The draft class option hides colours and images; previews may ask for it
+        modified_content = set_class_option(modified_content, 'draft', self.draft_figures)
+        self.check_cancelled()
         
-        # Process remaining fragments in pairs (header, content)
-        for i in range(1, len(sections)):
-            fragment = sections[i]
-            # Check if this fragment is a section/subsection header
-            if fragment.startswith('\\section{') or fragment.startswith('\\subsection{'):
-                # Extract the title using regex
-                title_match = re.search(r'\\(?:sub)?section{([^}]*)}', fragment)
-                if not title_match:
-                    continue  # Skip if header format is unexpected
-                    
-                title = title_match.group(1).strip()
-                
-                if fragment.startswith('\\section{'):
-                    current_section = title
-                    section_selected = (current_section in selected_sections)
-                    include_content = section_selected
-                    print(f"DEBUG: Section '{title}' found, selected={section_selected}, include={include_content}")
-                
-                elif fragment.startswith('\\subsection{'):
-                    # If parent section is not selected, automatically skip this subsection
-                    if not section_selected or current_section is None:
-                        include_content = False
-                        print(f"DEBUG: Subsection '{title}' skipped because parent section not selected")
-                    else:
-                        # Only include if parent section is selected AND either:
-                        # 1. No specific subsections were selected for this parent (meaning include all)
-                        # 2. This specific subsection was selected
-                        subsection_key = f"{current_section} - {title}"
-                        
-                        # Check if any subsections of this section were specifically selected
-                        has_selected_subsections = any(comp.startswith(f"{current_section} - ") for comp in self.selected_components)
-                        
-                        if has_selected_subsections:
-                            # Only include specifically selected subsections
-                            include_content = (subsection_key in self.selected_components)
-                        else:
-                            # Include all subsections for this selected section
-                            include_content = True
-                        
-                        print(f"DEBUG: Subsection '{subsection_key}', has_selected_subs={has_selected_subsections}, include={include_content}")
-                
-                # Append the header if content is to be included
-                if include_content:
-                    processed_content += fragment
-                    print(f"DEBUG: Including header: {fragment}")
-            else:
-                # For content fragments, include them if the flag is True
-                if include_content:
-                    processed_content += fragment
-                    print(f"DEBUG: Including content fragment ({len(fragment)} chars)")
+        # Compile the filtered source straight from memory
+        if self.prune_preamble:
+            return self.compile_pruned(modified_content)
+        self.compile_latex(modified_content)
+        return "PDF generated successfully!"
+    
+    def compile_pruned(self, content):
+        """Compile content without its unused packages, or in full if that fails"""
+        with self.tracer.span("prune preamble"):
+            pruned = PrunedPreamble(content, self.source_dir)
+        if not pruned.removed:
+            self.compile_latex(content)
+            return "PDF generated successfully!"
         
-        # Reconstruct the full document by adding the ending tag
-        final_content = preamble + processed_content + '\\end{document}'
-        return final_content
+        try:
+            self.compile_latex(pruned.content)
+        except (BuildCancelled, EngineTerminated):
+            raise
+        except RuntimeError:
+            print(f"Build without {', '.join(pruned.removed)} failed; retrying with the full preamble")
+            self.compile_latex(content)
+            pruned.record(success=False)
+            return "PDF generated successfully! (with the full preamble)"
+        pruned.record(success=True)
+        return f"PDF generated successfully! (skipped {len(pruned.removed)} unused packages)"
+    
+    def process_latex_content(self, content):
+        # Slice the document at the offsets of the selected sections
+        with self.tracer.span("parse"):
+            index = SectionIndex(content)
+        with self.tracer.span("filter"):
+            return index.render(self.selected_components, self.order)
 
     
-    def compile_latex(self, tex_file):
+    def run_pdflatex(self, working_dir, env, name, draftmode=False):
+        """Run one pdflatex pass in working_dir, traced as its own stage"""
+        self.check_cancelled()
+        # -draftmode resolves references without reading images or writing a PDF
+        options = ['-interaction=nonstopmode', '-draftmode'] if draftmode else ['-interaction=nonstopmode']
+        workspace = get_workspace()
+        # No single file may outgrow the scratch quota either
+        limits = Limits(self.limits.timeout, self.limits.cpu, self.limits.memory, workspace.quota)
+        with self.tracer.span(name, children=True):
+            try:
+                result = run_engine(
+                    [self.pdflatex_path, *options, 'document.tex'],
+                    working_dir, env, limits, self.isInterruptionRequested, name
+                )
+            except EngineTerminated as e:
+                if e.reason == 'cancelled':
+                    raise BuildCancelled("Build cancelled")
+                raise
+            workspace.check_usage(working_dir)
+            result.check_returncode()
+    
+    def compile_latex(self, content, output_pdf=None, aux_file=None):
+        """Compile content to output_pdf (default: next to output_file); aux_file keeps the .aux"""
         try:
-            # Get the directory and filename
-            tex_dir = os.path.dirname(tex_file)
-            tex_filename = os.path.basename(tex_file)
-            
-            # Fix: Remove _temp from output filename if present
-            base_output_file = self.output_file.replace('_temp.pdf', '.pdf')
-            output_pdf = os.path.splitext(base_output_file)[0] + '.pdf'
+            self.compile_in_workspace(content, output_pdf, aux_file, build=True)
+        except TmpfsFull as e:
+            print(f"{str(e)}; compiling on disk")
+            self.compile_in_workspace(content, output_pdf, aux_file, build=False)
+    
+    def compile_in_workspace(self, content, output_pdf, aux_file, build):
+        """compile_latex() in a scratch dir; build=True puts it on tmpfs when enabled"""
+        workspace = get_workspace()
+        try:
+            if output_pdf is None:
+                output_pdf = os.path.splitext(self.output_file)[0] + '.pdf'
             
-            # Create a safer temporary directory without spaces or special characters
-            import tempfile
-            temp_working_dir = tempfile.mkdtemp(prefix="latex_")
+            # Working directory inside the session workspace (on tmpfs when
+            # memory allows), so it is removed even if the app crashes
+            temp_working_dir = workspace.make_dir("latex_", build=build)
             safe_tex_file = os.path.join(temp_working_dir, "document.tex")
             
-            # Copy the tex file to the safe location
-            with open(tex_file, 'r', encoding='utf-8') as src:
-                content = src.read()
-            with open(safe_tex_file, 'w', encoding='utf-8') as dst:
-                dst.write(content)
+            # The filtered source is written exactly once, where the engine runs
+            with self.tracer.span("write"):
+                with open(safe_tex_file, 'w', encoding='utf-8') as dst:
+                    dst.write(content)
+            
+            # Link the figures, inputs and bibliographies the document references
+            # into the working directory, and let TeX search the source directory
+            # for anything referenced indirectly
+            with self.tracer.span("stage assets"):
+                assets = stage_assets(content, self.source_dir, temp_working_dir)
+                shadow_job_files(self.source_dir, temp_working_dir)
+                env = texinputs_environment(self.source_dir)
             
-            print(f"Working in temporary directory: {temp_working_dir}")
+            # Previews embed downsampled copies of the raster figures; the
+            # working directory is searched first so they win over the originals
+            if self.preview:
+                with self.tracer.span("preview figures"):
+                    _, reused = stage_preview_figures(assets, self.source_dir, temp_working_dir)
+                    self.tracer.count("preview figure cache", reused)
             
             # Method 2: Use subprocess directly (more reliable)
             try:
-                # Run pdflatex in the safe directory
-                print("Running pdflatex...")
-                result = subprocess.run(
-                    [self.pdflatex_path, '-interaction=nonstopmode', 'document.tex'],
-                    cwd=temp_working_dir,
-                    check=True, 
-                    stdout=subprocess.PIPE, 
-                    stderr=subprocess.PIPE
-                )
-                print("First pdflatex run completed")
+                # Run pdflatex in the safe directory; previews write the PDF on the last pass only
+                self.run_pdflatex(temp_working_dir, env, "pdflatex pass 1", draftmode=self.preview)
                 
-                # Run again for references
-                subprocess.run(
-                    [self.pdflatex_path, '-interaction=nonstopmode', 'document.tex'],
-                    cwd=temp_working_dir,
-                    check=True, 
-                    stdout=subprocess.PIPE, 
-                    stderr=subprocess.PIPE
-                )
-                print("Second pdflatex run completed")
+                # Resolve citations; bibtex/biber only run when the citation
+                # data or the .bib files changed since a previous build
+                with self.tracer.span("bibliography", children=True):
+                    bibliography = process_bibliography(
+                        temp_working_dir, env, self.pdflatex_path, source_dir=self.source_dir,
+                        limits=self.limits, cancelled=self.isInterruptionRequested
+                    )
+                if bibliography == 'cached':
+                    self.tracer.count("bibliography cache")
+                
+                # Run again for references (twice once a bibliography was added)
+                passes = 2 if bibliography else 1
+                for n in range(passes):
+                    self.run_pdflatex(temp_working_dir, env, f"pdflatex pass {n + 2}",
+                                      draftmode=self.preview and n < passes - 1)
                 
                 # Check if PDF was created in temp directory
                 temp_pdf = os.path.join(temp_working_dir, "document.pdf")
-                print(f"Looking for PDF at: {temp_pdf}")
                 
                 if os.path.exists(temp_pdf) and os.path.getsize(temp_pdf) > 0:
-                    print(f"PDF found ({os.path.getsize(temp_pdf)} bytes), copying to: {output_pdf}")
-                    # Copy to the desired output location
-                    if os.path.exists(output_pdf):
-                        os.remove(output_pdf)
-                    shutil.copy2(temp_pdf, output_pdf)
-                    print("PDF successfully copied")
+                    with self.tracer.span("copy"):
+                        place_file(temp_pdf, output_pdf)
+                        if aux_file:
+                            place_file(os.path.join(temp_working_dir, "document.aux"), aux_file)
+                    self.learn_page_size(content, os.path.join(temp_working_dir, "document.log"))
                     return
                 else:
                     print(f"PDF not found in temp directory: {os.listdir(temp_working_dir)}")
                     raise RuntimeError(f"PDF not created in temp directory")
                     
+            except (BuildCancelled, EngineTerminated, WorkspaceQuotaExceeded):
+                raise
             except Exception as e:
                 print(f"LaTeX compilation error: {str(e)}")
                 raise RuntimeError(f"LaTeX compilation failed: {str(e)}")
                 
+        except (BuildCancelled, EngineTerminated, WorkspaceQuotaExceeded):
+            raise
         except Exception as e:
             import traceback
             traceback.print_exc()
             raise RuntimeError(f"LaTeX compilation failed: {str(e)}")
         finally:
             # Clean up temp directory
-            try:
-                if 'temp_working_dir' in locals() and os.path.exists(temp_working_dir):
-                    shutil.rmtree(temp_working_dir, ignore_errors=True)
-                    print(f"Cleaned up temporary directory")
-            except:
-                pass
+            if 'temp_working_dir' in locals():
+                with self.tracer.span("cleanup"):
+                    workspace.release(temp_working_dir)
     
-    def process_latex_file(self, input_file, output_file, selected_components):
+    def learn_page_size(self, content, log_file):
+        """Feed the page count and size from the log to the page estimator"""
+        if not os.path.exists(log_file):
+            return
+        try:
+            with open(log_file, 'r', encoding='latin-1') as f:
+                log_text = f.read()
+            match = LOG_OUTPUT_PATTERN.search(log_text)
+            if match:
+                self.pages = int(match.group(1))
+            learn_build_log(self.document, content, log_text)
+        except (OSError, ValueError) as e:
+            print(f"Could not record page statistics: {str(e)}")
+    
+    def learn_page_count(self, content, pages, size):
+        """Feed a page count reported elsewhere (a build worker) to the page estimator"""
+        self.pages = pages
+        try:
+            learn_page_count(self.document, content, pages, size)
+        except (OSError, ValueError) as e:
+            print(f"Could not record page statistics: {str(e)}")
+
+
+class TexExportThread(QThread):
+    progress_update = pyqtSignal(int)
+    finished_signal = pyqtSignal(bool, str)
+    trace_ready = pyqtSignal(object)
+
+    def __init__(self, input_file, output_file, selected_components, bundle=False, order=None):
+        super().__init__()
+        self.input_file = input_file
+        self.output_file = output_file
+        self.selected_components = selected_components
+        self.order = order
+        # Write a self-contained directory or .zip with only the referenced assets
+        self.bundle = bundle
+        self.tracer = Tracer()
+
+    def run(self):
         try:
             # Read the original LaTeX file
-            with open(input_file, 'r', encoding='utf-8') as f:
-                content = f.read()
-            
-            # Remove draft option from documentclass to enable colors and images
-            content = content.replace('\\documentclass[draft]{article}', '\\documentclass{article}')
-            
-            # Extract preamble (everything before \begin{document})
-            doc_start = content.find('\\begin{document}')
-            if doc_start == -1:
-                return False, "Could not find \\begin{document} tag"
-            
-            preamble = content[:doc_start]
-            
-            # Extract document content
-            doc_end = content.find('\\end{document}')
-            if doc_end == -1:
-                return False, "Could not find \\end{document} tag"
-            
-            document_body = content[doc_start:doc_end]
-            
-            # Find content before any sections (this contains important style elements)
-            first_section_pos = float('inf')
-            section_types = ['\\chapter{', '\\section{', '\\subsection{']
-            for section_type in section_types:
-                pos = document_body.find(section_type)
-                if pos != -1 and pos < first_section_pos:
-                    first_section_pos = pos
-            
-            if first_section_pos == float('inf'):
-                # No sections found, keep all content
-                filtered_content = document_body
+            with self.tracer.span("read"):
+                with open(self.input_file, 'r', encoding='utf-8') as file:
+                    content = file.read()
+
+            self.progress_update.emit(30)
+
+            # Same slicing engine as the PDF path, so both produce identical bodies
+            with self.tracer.span("parse"):
+                index = SectionIndex(content)
+            with self.tracer.span("filter"):
+                final_content = index.render(self.selected_components, self.order)
+
+            if self.isInterruptionRequested():
+                raise BuildCancelled("Export cancelled")
+
+            self.progress_update.emit(70)
+
+            if self.bundle:
+                source_dir = os.path.dirname(os.path.abspath(self.input_file))
+                tex_name = os.path.basename(self.input_file)
+                with self.tracer.span("bundle"):
+                    missing = write_bundle(final_content, source_dir, self.output_file, tex_name)
+                for name in missing:
+                    print(f"Referenced file not found, not bundled: {name}")
             else:
-                # Extract pre-section content (crucial for formatting)
-                pre_section_content = document_body[:first_section_pos]
-                
-                # Extract all sections and filter based on selected components
-                sections = []
-                remaining_content = document_body[first_section_pos:]
-                
-                # Identify all sections in the document
-                current_pos = 0
-                while current_pos < len(remaining_content):
-                    # Find the next section start
-                    next_section_pos = float('inf')
-                    next_section_type = None
-                    
-                    for section_type in section_types:
-                        pos = remaining_content.find(section_type, current_pos)
-                        if pos != -1 and pos < next_section_pos:
-                            next_section_pos = pos
-                            next_section_type = section_type
-                    
-                    if next_section_pos == float('inf'):
-                        # No more sections
-                        break
-                    
-                    # Find the section title
-                    title_start = next_section_pos + len(next_section_type)
-                    title_end = remaining_content.find('}', title_start)
-                    if title_end == -1:
-                        break
-                    
-                    section_title = remaining_content[title_start:title_end]
-                    
-                    # Find the end of this section (start of next section or end of document)
-                    section_end = float('inf')
-                    for section_type in section_types:
-                        pos = remaining_content.find(section_type, title_end)
-                        if pos != -1 and pos < section_end:
-                            section_end = pos
-                    
-                    if section_end == float('inf'):
-                        # Last section, goes to the end
-                        section_content = remaining_content[next_section_pos:]
-                        current_pos = len(remaining_content)
-                    else:
-                        section_content = remaining_content[next_section_pos:section_end]
-                        current_pos = section_end
-                    
-                    sections.append((section_title, section_content))
-                
-                # Filter sections based on selected components
-                selected_sections = [content for title, content in sections if title in selected_components]
-                
-                # Combine everything with proper ordering
-                filtered_content = pre_section_content + ''.join(selected_sections)
-            
-            # Construct the final document
-            final_content = preamble + filtered_content + '\\end{document}'
-            
-            # Create custom directory with simple path
-            temp_dir = tempfile.mkdtemp(prefix="latex_")
-            print(f"Working in temporary directory: {temp_dir}")
-            temp_tex_file = os.path.join(temp_dir, "document.tex")
-            
-            with open(temp_tex_file, 'w', encoding='utf-8') as f:
-                f.write(final_content)
-            
-            # Compile the LaTeX file
-            success = self.compile_latex(temp_tex_file)
-            return success, output_file
-            
+                # Write the new TEX file
+                with self.tracer.span("write"):
+                    with open(self.output_file, 'w', encoding='utf-8') as output:
+                        output.write(final_content)
+
+            self.progress_update.emit(100)
+            self.trace_ready.emit(self.tracer)
+            self.finished_signal.emit(True, self.output_file)
+
         except Exception as e:
-            import traceback
-            traceback.print_exc()
-            return False, f"Error processing LaTeX: {str(e)}"
+            self.trace_ready.emit(self.tracer)
+            self.finished_signal.emit(False, f"Error: {str(e)}")
@@ -1,15 +1,19 @@
+import time
+STARTED = time.perf_counter()
+
 import sys
 from PyQt5.QtWidgets import QApplication
 from gui import LatexReportCustomizerGUI
-from utils import check_latex_installation
 
-if __name__ == "__main__":
-    app = QApplication(sys.argv)
-    
-    # Check if LaTeX is installed properly
-    latex_installed, latex_path = check_latex_installation()
+def create_application(argv):
+    """Create the application and show the main window as early as possible"""
+    app = QApplication(argv)
     
-    # Launch the main application
-    window = LatexReportCustomizerGUI(latex_installed, latex_path)
+    # LaTeX is probed in the background once the window has been painted
+    window = LatexReportCustomizerGUI(started=STARTED)
     window.show()
+    return app, window
+
+if __name__ == "__main__":
+    app, window = create_application(sys.argv)
     sys.exit(app.exec_())
@@ -0,0 +1,227 @@
+import os
+import re
+import json
+import hashlib
+import threading
+
+from assets import (GRAPHICS_EXTENSIONS, GRAPHICS_PATTERN, GRAPHICSPATH_PATTERN, INPUT_PATTERN,
+                    TEX_EXTENSIONS, resolve_reference)
+from build_cache import cache_dir
+
+# Fallbacks until a build of the document has been seen
+DEFAULT_CHARS_PER_PAGE = 3000
+DEFAULT_BYTES_PER_PAGE = 20000
+FIGURE_PAGES = 0.3
+
+LOG_OUTPUT_PATTERN = re.compile(r'Output written on .*?\((\d+) pages?, (\d+) bytes\)')
+
+
+class Amount:
+    """Estimated pages and bytes, added and subtracted together"""
+    __slots__ = ('pages', 'bytes')
+
+    def __init__(self, pages=0.0, size=0.0):
+        self.pages = pages
+        self.bytes = size
+
+    def __add__(self, other):
+        return Amount(self.pages + other.pages, self.bytes + other.bytes)
+
+    def __sub__(self, other):
+        return Amount(self.pages - other.pages, self.bytes - other.bytes)
+
+
+ZERO = Amount()
+
+
+def _learned_path(input_file):
+    name = hashlib.sha256(os.path.abspath(input_file).encode('utf-8')).hexdigest()[:32]
+    return os.path.join(cache_dir('estimates'), name + '.json')
+
+
+def load_learned(input_file):
+    """Return what earlier builds taught about the document's page layout"""
+    try:
+        with open(_learned_path(input_file), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _update_learned(input_file, **values):
+    path = _learned_path(input_file)
+    learned = load_learned(input_file)
+    learned.update(values)
+    partial = f"{path}.{os.getpid()}.{threading.get_ident()}.part"
+    with open(partial, 'w', encoding='utf-8') as f:
+        json.dump(learned, f)
+    os.replace(partial, path)
+
+
+def learn_build_log(input_file, content, log_text):
+    """Calibrate characters and bytes per page from a finished build's log"""
+    match = LOG_OUTPUT_PATTERN.search(log_text)
+    if match:
+        learn_page_count(input_file, content, int(match.group(1)), int(match.group(2)))
+
+
+def learn_page_count(input_file, content, pages, size):
+    """Calibrate characters and bytes per page from a build of pages pages and size bytes"""
+    body_start = content.find('\\begin{document}')
+    body_end = content.find('\\end{document}')
+    if pages == 0 or body_start == -1 or body_end == -1:
+        return
+    _update_learned(input_file, chars_per_page=(body_end - body_start) / pages,
+                    bytes_per_page=size / pages)
+
+
+def learn_page_map(input_file, page_map, pdf_bytes):
+    """Record how many pages every section took in a full compile (fast variants)"""
+    starts = [first for first, _ in page_map.units] + [page_map.total + 1]
+    spans = {}
+    for number, span in enumerate(page_map.index.spans, 1):
+        # Pages until the next section starts; sections sharing a page split it as 1 + 0
+        spans[span.key] = spans.get(span.key, 0) + starts[number + 1] - starts[number]
+    _update_learned(input_file, spans=spans, front=starts[1] - 1,
+                    bytes_per_page=pdf_bytes / max(1, page_map.total))
+
+
+class PageEstimate:
+    """Estimated pages and PDF size of a selection, updated in O(depth) per toggle
+
+    Each span's own pages come from an earlier full compile when known, and
+    otherwise from its source size and figure count. The selection's total
+    is kept as a running sum over the outline: every span tracks the amount
+    its selected children contribute, and every top-level section tracks
+    whether any of its descendants is selected, mirroring included_spans().
+    """
+
+    def __init__(self, index, source_dir, learned=None):
+        self.index = index
+        learned = learned or {}
+        learned_spans = learned.get('spans', {})
+        content = index.content
+
+        chars_per_page = learned.get('chars_per_page', DEFAULT_CHARS_PER_PAGE)
+        bytes_per_page = learned.get('bytes_per_page')
+
+        preamble = content[:index.body_start]
+        search_dirs = ['']
+        for match in GRAPHICSPATH_PATTERN.finditer(preamble):
+            search_dirs.extend(re.findall(r'{([^}]*)}', match.group(1)))
+
+        spans = index.spans
+        self.weights = []
+        learned_keys = set()
+        for span in spans:
+            if span.key in learned_spans:
+                # Spans sharing a key are always selected together; the first carries the pages
+                pages = learned_spans[span.key] if span.key not in learned_keys else 0.0
+                learned_keys.add(span.key)
+                figure_bytes = 0
+            else:
+                chars = span.end - span.start
+                for match in INPUT_PATTERN.finditer(content, span.start, span.end):
+                    relative = resolve_reference(source_dir, match.group(1).strip(), TEX_EXTENSIONS)
+                    if relative:
+                        chars += os.path.getsize(os.path.join(source_dir, relative))
+                figures = 0
+                figure_bytes = 0
+                for match in GRAPHICS_PATTERN.finditer(content, span.start, span.end):
+                    figures += 1
+                    relative = resolve_reference(source_dir, match.group(1).strip(),
+                                                 GRAPHICS_EXTENSIONS, search_dirs)
+                    if relative:
+                        figure_bytes += os.path.getsize(os.path.join(source_dir, relative))
+                pages = chars / chars_per_page + figures * FIGURE_PAGES
+            if bytes_per_page:
+                size = pages * bytes_per_page
+            else:
+                size = pages * DEFAULT_BYTES_PER_PAGE + figure_bytes
+            self.weights.append(Amount(pages, size))
+
+        front_pages = learned.get('front', (index.pre_section_end - index.body_start) / chars_per_page)
+        self.front = Amount(front_pages, front_pages * (bytes_per_page or DEFAULT_BYTES_PER_PAGE))
+
+        # Outline bookkeeping, by span position
+        position = {id(span): number for number, span in enumerate(spans)}
+        self.parent = [position[id(span.parent)] if span.parent is not None else None for span in spans]
+        self.top = []
+        for number, parent in enumerate(self.parent):
+            self.top.append(number if parent is None else self.top[parent])
+        self.by_key = {}
+        for number, span in enumerate(spans):
+            self.by_key.setdefault(span.key, []).append(number)
+
+        # Subtree totals, children before parents since spans are in document order
+        self.subtree = list(self.weights)
+        for number in range(len(spans) - 1, -1, -1):
+            parent = self.parent[number]
+            if parent is not None:
+                self.subtree[parent] = self.subtree[parent] + self.subtree[number]
+
+        self.set_selection([span.key for span in spans])
+
+    def set_selection(self, selected_components):
+        """Start over from a complete selection (O(n))"""
+        selected = set(selected_components)
+        count = len(self.weights)
+        self.selected = [span.key in selected for span in self.index.spans]
+        self.children_sum = [ZERO] * count
+        self.selected_below = [0] * count
+        for number in range(count - 1, -1, -1):
+            parent = self.parent[number]
+            if parent is None:
+                continue
+            if self.selected[number]:
+                self.selected_below[self.top[number]] += 1
+                self.children_sum[parent] = (self.children_sum[parent] + self.weights[number]
+                                             + self.children_sum[number])
+        self.contribution = [self._contribution(number) if parent is None else ZERO
+                             for number, parent in enumerate(self.parent)]
+        self.total = self.front
+        for amount in self.contribution:
+            self.total = self.total + amount
+
+    def toggle(self, key, checked):
+        """Update the estimate after one component was checked or unchecked"""
+        for number in self.by_key.get(key, ()):
+            if self.selected[number] == checked:
+                continue
+            self.selected[number] = checked
+            parent = self.parent[number]
+            if parent is not None:
+                self.selected_below[self.top[number]] += 1 if checked else -1
+                delta = self.weights[number] + self.children_sum[number]
+                # Only included ancestors pass the change further up
+                while parent is not None:
+                    if checked:
+                        self.children_sum[parent] = self.children_sum[parent] + delta
+                    else:
+                        self.children_sum[parent] = self.children_sum[parent] - delta
+                    if not self.selected[parent]:
+                        break
+                    parent = self.parent[parent]
+
+            top = self.top[number]
+            new = self._contribution(top)
+            self.total = self.total - self.contribution[top] + new
+            self.contribution[top] = new
+
+    def _contribution(self, top):
+        if not self.selected[top]:
+            return ZERO
+        if self.selected_below[top]:
+            # Sections with selected subsections keep only those
+            return self.weights[top] + self.children_sum[top]
+        return self.subtree[top]
+
+    def describe(self):
+        """Short text for the GUI, e.g. '≈ 12 pages · 340 KB'"""
+        pages = max(1, round(self.total.pages))
+        size = max(0.0, self.total.bytes)
+        if size >= 2 ** 20:
+            size_text = f"{size / 2 ** 20:.1f} MB"
+        else:
+            size_text = f"{size / 2 ** 10:.0f} KB"
+        return f"≈ {pages} page{'s' if pages != 1 else ''} · {size_text}"
@@ -0,0 +1,356 @@
+"""In-app PDF preview that rasterizes lazily with poppler's pdftoppm
+
+Only the tiles of the pages in view are rendered, at the current zoom, on a
+background thread. A low-resolution image of each visible page is rendered
+first and stretched until the sharp tiles arrive. Rendered images are kept
+in an LRU bounded by LRC_VIEWER_MEMORY bytes (default 128M).
+"""
+import os
+import re
+import shutil
+import threading
+from collections import OrderedDict
+
+from PyQt5.QtWidgets import QWidget, QVBoxLayout, QHBoxLayout, QLabel, QPushButton, QScrollArea
+from PyQt5.QtCore import Qt, QRect, QSize, QThread, pyqtSignal
+from PyQt5.QtGui import QColor, QImage, QPainter
+
+from engine_runner import EngineTerminated, run_engine
+from workspace import get_workspace, parse_size
+
+DEFAULT_MEMORY = '128M'
+# Tiles are square, in device pixels
+TILE_SIZE = 512
+THUMBNAIL_DPI = 18
+# 100% shows a page at its printed size on a 96 dpi screen
+SCREEN_DPI = 96
+ZOOM_LEVELS = [25, 50, 75, 100, 125, 150, 200, 300, 400]
+PAGE_GAP = 12
+
+PAGE_SIZE_PATTERN = re.compile(r'^Page\s+(\d+) size:\s+([\d.]+) x ([\d.]+) pts', re.MULTILINE)
+PAGES_PATTERN = re.compile(r'^Pages:\s+(\d+)', re.MULTILINE)
+SINGLE_SIZE_PATTERN = re.compile(r'^Page size:\s+([\d.]+) x ([\d.]+) pts', re.MULTILINE)
+
+
+def rasterizer_available():
+    return shutil.which('pdftoppm') is not None and shutil.which('pdfinfo') is not None
+
+
+def page_sizes(pdf_file):
+    """Return [(width, height)] in points for every page, using pdfinfo"""
+    directory = os.path.dirname(os.path.abspath(pdf_file))
+    result = run_engine(['pdfinfo', pdf_file], directory, name='pdfinfo')
+    output = result.stdout.decode('utf-8', errors='replace')
+    match = PAGES_PATTERN.search(output)
+    if result.returncode != 0 or not match:
+        raise RuntimeError(f"pdfinfo could not read {os.path.basename(pdf_file)}:\n{output[-1000:]}")
+    count = int(match.group(1))
+
+    # Per-page sizes are only printed when a page range is given
+    result = run_engine(['pdfinfo', '-f', '1', '-l', str(count), pdf_file], directory, name='pdfinfo')
+    output = result.stdout.decode('utf-8', errors='replace')
+    sizes = {int(number): (float(width), float(height))
+             for number, width, height in PAGE_SIZE_PATTERN.findall(output)}
+    single = SINGLE_SIZE_PATTERN.search(output)
+    default = (float(single.group(1)), float(single.group(2))) if single else (612.0, 792.0)
+    return [sizes.get(number, default) for number in range(1, count + 1)]
+
+
+class TileCache:
+    """LRU of rendered images, bounded by their total size in bytes"""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.bytes = 0
+
+    def get(self, key):
+        image = self.entries.get(key)
+        if image is not None:
+            self.entries.move_to_end(key)
+        return image
+
+    def put(self, key, image):
+        if key in self.entries:
+            self.bytes -= self.entries.pop(key).sizeInBytes()
+        self.entries[key] = image
+        self.bytes += image.sizeInBytes()
+        while self.bytes > self.max_bytes and len(self.entries) > 1:
+            _, old = self.entries.popitem(last=False)
+            self.bytes -= old.sizeInBytes()
+
+    def clear(self):
+        self.entries.clear()
+        self.bytes = 0
+
+
+class RasterThread(QThread):
+    """Renders requested tiles one at a time; newer requests replace older ones
+
+    A key is (page, dpi, column, row) for a tile, or (page, THUMBNAIL_DPI,
+    None, None) for a whole low-resolution page.
+    """
+    tile_ready = pyqtSignal(object, object)
+
+    def __init__(self, pdf_file, sizes):
+        super().__init__()
+        self.pdf_file = os.path.abspath(pdf_file)
+        self.sizes = sizes
+        self.condition = threading.Condition()
+        self.wanted = []
+        self.current = None
+        self.stopping = False
+        self.work_dir = get_workspace().make_dir("viewer_")
+
+    def request(self, keys):
+        """Render these keys next, in order, dropping what was asked before"""
+        with self.condition:
+            self.wanted = [key for key in keys if key != self.current]
+            self.condition.notify()
+
+    def stop(self):
+        with self.condition:
+            self.stopping = True
+            self.wanted = []
+            self.condition.notify()
+        self.requestInterruption()
+        self.wait()
+        get_workspace().release(self.work_dir)
+
+    def run(self):
+        while True:
+            with self.condition:
+                while not self.wanted and not self.stopping:
+                    self.condition.wait()
+                if self.stopping:
+                    return
+                self.current = key = self.wanted.pop(0)
+            try:
+                image = self.render(key)
+            except (OSError, RuntimeError, EngineTerminated) as e:
+                print(f"Could not render page {key[0] + 1}: {str(e)}")
+                image = None
+            with self.condition:
+                self.current = None
+            if image is not None:
+                self.tile_ready.emit(key, image)
+
+    def render(self, key):
+        page, dpi, column, row = key
+        output_root = os.path.join(self.work_dir, 'tile')
+        args = ['pdftoppm', '-f', str(page + 1), '-l', str(page + 1), '-r', str(dpi)]
+        if column is not None:
+            width, height = page_pixels(self.sizes[page], dpi)
+            x, y = column * TILE_SIZE, row * TILE_SIZE
+            args += ['-x', str(x), '-y', str(y),
+                     '-W', str(min(TILE_SIZE, width - x)), '-H', str(min(TILE_SIZE, height - y))]
+        args += ['-png', '-singlefile', self.pdf_file, output_root]
+        result = run_engine(args, self.work_dir, cancelled=self.isInterruptionRequested, name='pdftoppm')
+        path = output_root + '.png'
+        if result.returncode != 0 or not os.path.exists(path):
+            raise RuntimeError(result.stdout.decode('utf-8', errors='replace')[-500:])
+        image = QImage(path)
+        os.remove(path)
+        return None if image.isNull() else image
+
+
+def page_pixels(size, dpi):
+    """Pixel size of a page (in points) rendered at dpi"""
+    width, height = size
+    return max(1, round(width * dpi / 72)), max(1, round(height * dpi / 72))
+
+
+class PageCanvas(QWidget):
+    """All pages stacked vertically; paints what is cached and requests the rest"""
+
+    def __init__(self, viewer):
+        super().__init__()
+        self.viewer = viewer
+        self.page_rects = []
+
+    def layout_pages(self):
+        """Position the pages for the current zoom and resize the canvas"""
+        scale = self.viewer.zoom / 100 * SCREEN_DPI / 72
+        self.page_rects = []
+        y = PAGE_GAP
+        widest = 0
+        for width, height in self.viewer.sizes:
+            rect = QRect(PAGE_GAP, y, round(width * scale), round(height * scale))
+            self.page_rects.append(rect)
+            y += rect.height() + PAGE_GAP
+            widest = max(widest, rect.width())
+        self.setFixedSize(QSize(widest + 2 * PAGE_GAP, y))
+
+    def paintEvent(self, event):
+        viewer = self.viewer
+        if viewer.raster is None:
+            return
+        painter = QPainter(self)
+        painter.fillRect(event.rect(), QColor('#808080'))
+        # Everything in view is painted (the painter clips to event.rect()), so the
+        # request below always covers the whole view, not just the repainted tile
+        visible = self.visibleRegion().boundingRect()
+        ratio = self.devicePixelRatioF()
+        dpi = round(viewer.zoom / 100 * SCREEN_DPI * ratio)
+        thumbnails = []
+        tiles = []
+
+        first = self.first_page_at(visible.top())
+        for page in range(first, len(self.page_rects)):
+            rect = self.page_rects[page]
+            if rect.top() > visible.bottom():
+                break
+            painter.fillRect(rect, Qt.white)
+            thumbnail_key = (page, THUMBNAIL_DPI, None, None)
+            thumbnail = viewer.cache.get(thumbnail_key)
+            if thumbnail is not None:
+                painter.drawImage(rect, thumbnail)
+            elif dpi > THUMBNAIL_DPI:
+                thumbnails.append(thumbnail_key)
+
+            # Device-pixel tiles covering the visible part of the page
+            width, height = page_pixels(viewer.sizes[page], dpi)
+            part = rect.intersected(visible)
+            if part.isEmpty():
+                continue
+            columns = range(int((part.left() - rect.left()) * ratio) // TILE_SIZE,
+                            min(int((part.right() + 1 - rect.left()) * ratio) // TILE_SIZE + 1,
+                                (width - 1) // TILE_SIZE + 1))
+            rows = range(int((part.top() - rect.top()) * ratio) // TILE_SIZE,
+                         min(int((part.bottom() + 1 - rect.top()) * ratio) // TILE_SIZE + 1,
+                             (height - 1) // TILE_SIZE + 1))
+            for row in rows:
+                for column in columns:
+                    key = (page, dpi, column, row)
+                    tile = viewer.cache.get(key)
+                    if tile is None:
+                        tiles.append(key)
+                        continue
+                    target = QRect(rect.left() + round(column * TILE_SIZE / ratio),
+                                   rect.top() + round(row * TILE_SIZE / ratio),
+                                   round(tile.width() / ratio), round(tile.height() / ratio))
+                    painter.drawImage(target, tile)
+        painter.end()
+
+        # Thumbnails first, so every visible page shows something quickly
+        viewer.raster.request(thumbnails + tiles)
+
+    def first_page_at(self, y):
+        low, high = 0, len(self.page_rects)
+        while low < high:
+            middle = (low + high) // 2
+            if self.page_rects[middle].bottom() < y:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def tile_rect(self, key):
+        page, dpi, column, row = key
+        rect = self.page_rects[page]
+        if column is None:
+            return rect
+        ratio = self.devicePixelRatioF()
+        return QRect(rect.left() + int(column * TILE_SIZE / ratio), rect.top() + int(row * TILE_SIZE / ratio),
+                     int(TILE_SIZE / ratio) + 2, int(TILE_SIZE / ratio) + 2)
+
+
+class PdfViewer(QWidget):
+    """Preview window for a generated PDF"""
+
+    def __init__(self, parent=None):
+        super().__init__(parent, Qt.Window)
+        self.setWindowTitle("PDF Preview")
+        self.resize(800, 900)
+        self.sizes = []
+        self.zoom = 100
+        self.raster = None
+        self.pdf_file = None
+        self.cache = TileCache(parse_size(os.environ.get('LRC_VIEWER_MEMORY', DEFAULT_MEMORY)))
+
+        layout = QVBoxLayout(self)
+        toolbar = QHBoxLayout()
+        self.zoom_out_button = QPushButton("−")
+        self.zoom_out_button.clicked.connect(lambda: self.step_zoom(-1))
+        self.zoom_in_button = QPushButton("+")
+        self.zoom_in_button.clicked.connect(lambda: self.step_zoom(1))
+        self.zoom_label = QLabel()
+        self.page_label = QLabel()
+        toolbar.addWidget(self.zoom_out_button)
+        toolbar.addWidget(self.zoom_label)
+        toolbar.addWidget(self.zoom_in_button)
+        toolbar.addStretch()
+        toolbar.addWidget(self.page_label)
+        layout.addLayout(toolbar)
+
+        self.scroll_area = QScrollArea()
+        self.scroll_area.setAlignment(Qt.AlignHCenter)
+        self.canvas = PageCanvas(self)
+        self.scroll_area.setWidget(self.canvas)
+        self.scroll_area.verticalScrollBar().valueChanged.connect(self.update_page_label)
+        layout.addWidget(self.scroll_area)
+
+    def open_pdf(self, pdf_file):
+        """Show pdf_file, dropping whatever was rendered for the previous one"""
+        sizes = page_sizes(pdf_file)
+        self.stop_raster()
+        self.cache.clear()
+        self.pdf_file = pdf_file
+        self.sizes = sizes
+        self.raster = RasterThread(pdf_file, sizes)
+        self.raster.tile_ready.connect(self.tile_ready)
+        self.raster.start()
+        self.setWindowTitle(f"PDF Preview - {os.path.basename(pdf_file)}")
+        self.set_zoom(self.zoom)
+        self.scroll_area.verticalScrollBar().setValue(0)
+
+    def set_zoom(self, zoom):
+        # Keep the same point of the document at the top of the view
+        bar = self.scroll_area.verticalScrollBar()
+        fraction = bar.value() / max(1, self.canvas.height())
+        self.zoom = zoom
+        self.zoom_label.setText(f"{zoom}%")
+        self.zoom_out_button.setEnabled(zoom > ZOOM_LEVELS[0])
+        self.zoom_in_button.setEnabled(zoom < ZOOM_LEVELS[-1])
+        self.canvas.layout_pages()
+        bar.setValue(round(fraction * self.canvas.height()))
+        self.canvas.update()
+        self.update_page_label()
+
+    def step_zoom(self, step):
+        position = min(range(len(ZOOM_LEVELS)), key=lambda i: abs(ZOOM_LEVELS[i] - self.zoom))
+        position = max(0, min(len(ZOOM_LEVELS) - 1, position + step))
+        self.set_zoom(ZOOM_LEVELS[position])
+
+    def tile_ready(self, key, image):
+        if self.sender() is not self.raster:
+            # Queued by the thread of a previously opened PDF
+            return
+        self.cache.put(key, image)
+        self.canvas.update(self.canvas.tile_rect(key))
+
+    def update_page_label(self):
+        if not self.sizes:
+            self.page_label.setText("")
+            return
+        page = self.canvas.first_page_at(self.scroll_area.verticalScrollBar().value())
+        self.page_label.setText(f"Page {min(page, len(self.sizes) - 1) + 1} of {len(self.sizes)}")
+
+    def keyPressEvent(self, event):
+        if event.modifiers() & Qt.ControlModifier and event.key() in (Qt.Key_Plus, Qt.Key_Equal):
+            self.step_zoom(1)
+        elif event.modifiers() & Qt.ControlModifier and event.key() == Qt.Key_Minus:
+            self.step_zoom(-1)
+        else:
+            super().keyPressEvent(event)
+
+    def stop_raster(self):
+        if self.raster is not None:
+            self.raster.tile_ready.disconnect(self.tile_ready)
+            self.raster.stop()
+            self.raster = None
+
+    def closeEvent(self, event):
+        self.stop_raster()
+        self.cache.clear()
+        super().closeEvent(event)
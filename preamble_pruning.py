@@ -0,0 +1,174 @@
+import os
+import re
+import json
+import hashlib
+import threading
+
+from assets import COMMENT_PATTERN, INPUT_PATTERN, TEX_EXTENSIONS, resolve_reference, strip_comments
+from build_cache import cache_dir
+from section_index import BEGIN_DOCUMENT
+
+# What a package provides that a document would have to use for the package
+# to matter: (commands, environments). Only packages listed here are ever
+# pruned, so anything with global effects (fonts, geometry, hyperref, babel,
+# amsmath, ...) is always kept.
+PACKAGE_PROVIDES = {
+    'tikz': (('tikz', 'tikzset', 'usetikzlibrary', 'tikzstyle', 'draw', 'node', 'path', 'fill',
+              'filldraw', 'shade', 'shadedraw', 'clip', 'coordinate', 'foreach', 'pgfmathsetmacro',
+              'pgfdeclarelayer', 'pgfsetlayers'),
+             ('tikzpicture', 'scope', 'pgfonlayer')),
+    'pgfplots': (('pgfplotsset', 'addplot', 'addlegendentry', 'usepgfplotslibrary', 'pgfplotstabletypeset'),
+                 ('axis', 'semilogxaxis', 'semilogyaxis', 'loglogaxis', 'polaraxis', 'groupplot')),
+    'listings': (('lstset', 'lstinline', 'lstinputlisting', 'lstdefinestyle', 'lstdefinelanguage',
+                  'lstnewenvironment', 'lstlistoflistings'),
+                 ('lstlisting',)),
+    'minted': (('mint', 'mintinline', 'inputminted', 'setminted', 'setmintedinline', 'newminted',
+                'usemintedstyle', 'listoflistings'),
+               ('minted', 'listing')),
+    'fancyvrb': (('fvset', 'VerbatimInput', 'BVerbatimInput', 'LVerbatimInput', 'DefineVerbatimEnvironment',
+                  'DefineShortVerb', 'UndefineShortVerb', 'RecustomVerbatimEnvironment'),
+                 ('Verbatim', 'BVerbatim', 'LVerbatim', 'SaveVerbatim')),
+    'booktabs': (('toprule', 'midrule', 'bottomrule', 'cmidrule', 'addlinespace', 'specialrule'), ()),
+    'longtable': (('endhead', 'endfirsthead', 'endfoot', 'endlastfoot', 'LTleft', 'LTright', 'LTpre',
+                   'LTpost', 'LTcapwidth'),
+                  ('longtable',)),
+    'tabularx': (('tabularxcolumn',), ('tabularx',)),
+    'tabulary': ((), ('tabulary',)),
+    'multirow': (('multirow', 'multirowsetup'), ()),
+    'makecell': (('makecell', 'thead', 'makegapedcells', 'diaghead', 'Xhline', 'Xcline'), ()),
+    'graphicx': (('includegraphics', 'graphicspath', 'DeclareGraphicsExtensions', 'DeclareGraphicsRule',
+                  'rotatebox', 'scalebox', 'resizebox', 'reflectbox'), ()),
+    'subcaption': (('subcaption', 'subcaptionbox', 'subref', 'captionsetup'), ('subfigure', 'subtable')),
+    'wrapfig': (('wrapfigure',), ('wrapfigure', 'wraptable')),
+    'pdfpages': (('includepdf', 'includepdfmerge', 'includepdfset'), ()),
+    'algorithm': (('listofalgorithms', 'floatname'), ('algorithm',)),
+    'algorithmic': (('STATE', 'IF', 'ENDIF', 'FOR', 'ENDFOR', 'WHILE', 'ENDWHILE', 'REQUIRE', 'ENSURE',
+                     'RETURN'),
+                    ('algorithmic',)),
+    'algpseudocode': (('State', 'If', 'EndIf', 'For', 'EndFor', 'While', 'EndWhile', 'Procedure',
+                       'Function', 'Require', 'Ensure', 'Return', 'algrenewcommand', 'algnewcommand'),
+                      ('algorithmic',)),
+    'verbatim': (('verbatiminput',), ('comment',)),
+    'url': (('url', 'urlstyle', 'path', 'DeclareUrlCommand'), ()),
+    'lipsum': (('lipsum', 'setlipsum'), ()),
+    'pifont': (('ding', 'dingline', 'dingfill', 'Pisymbol', 'Pifill', 'Piline'), ('dingautolist', 'Pilist')),
+}
+
+USEPACKAGE_PATTERN = re.compile(r'\\(?:usepackage|RequirePackage)\s*(\[[^\]]*\])?\s*{([^}]*)}[ \t]*\n?')
+COMMAND_PATTERN = re.compile(r'\\([A-Za-z@]+)')
+ENVIRONMENT_PATTERN = re.compile(r'\\begin\s*{([^}]*)}')
+
+
+def _names(group):
+    return [name.strip() for name in group.split(',') if name.strip()]
+
+
+def _input_texts(content, source_dir):
+    """Yield the text of every file content pulls in with \\input and friends"""
+    pending = [content]
+    visited = set()
+    while pending:
+        for match in INPUT_PATTERN.finditer(strip_comments(pending.pop())):
+            relative = resolve_reference(source_dir, match.group(1).strip(), TEX_EXTENSIONS)
+            if relative is None or relative in visited:
+                continue
+            visited.add(relative)
+            with open(os.path.join(source_dir, relative), 'r', encoding='utf-8', errors='replace') as f:
+                text = f.read()
+            pending.append(text)
+            yield text
+
+
+class PrunedPreamble:
+    """A document with the \\usepackage lines its text does not need removed
+
+    A package counts as unused when none of the commands or environments it
+    provides (PACKAGE_PROVIDES) appear anywhere in the document, the rest of
+    the preamble and the files it inputs included. Outcomes are recorded per
+    preamble. A pruned build that fails is always repeated with the full
+    preamble, since one selection may need a package another did without.
+    If that works, the suspects are never pruned from the preamble again:
+    the removed packages not yet known to be safe (removed from a successful
+    build), or all of them when each one is.
+    """
+
+    def __init__(self, content, source_dir=None):
+        self.original = content
+        doc_start = content.find(BEGIN_DOCUMENT)
+        preamble = content[:doc_start] if doc_start != -1 else ''
+        self.key = hashlib.sha256(preamble.encode('utf-8')).hexdigest()[:32]
+        unsafe = set(load_history(self.key).get('unsafe', ()))
+
+        # Everything but the package lines themselves counts as use
+        text = USEPACKAGE_PATTERN.sub('\n', preamble) + content[len(preamble):]
+        if source_dir is not None:
+            text = '\n'.join([text, *_input_texts(text, source_dir)])
+        text = strip_comments(text)
+        commands = set(COMMAND_PATTERN.findall(text))
+        environments = set(name.strip() for name in ENVIRONMENT_PATTERN.findall(text))
+
+        self.removed = []
+        pieces = []
+        position = 0
+        for match in USEPACKAGE_PATTERN.finditer(_blank_comments(preamble)):
+            packages = _names(match.group(2))
+            kept = []
+            for package in packages:
+                provides = PACKAGE_PROVIDES.get(package)
+                if (provides is None or package in unsafe
+                        or commands.intersection(provides[0]) or environments.intersection(provides[1])):
+                    kept.append(package)
+                else:
+                    self.removed.append(package)
+            if len(kept) == len(packages):
+                continue
+            pieces.append(content[position:match.start()])
+            if kept:
+                pieces.append(f"\\usepackage{match.group(1) or ''}{{{','.join(kept)}}}\n")
+            position = match.end()
+        pieces.append(content[position:])
+        self.content = ''.join(pieces)
+
+    def record(self, success):
+        """Remember the outcome of a build of self.content"""
+        if not self.removed:
+            return
+        # Reread, so concurrent builds of the same document add to each other's outcomes
+        history = load_history(self.key)
+        safe = set(history.get('safe', ()))
+        unsafe = set(history.get('unsafe', ()))
+        if success:
+            safe.update(self.removed)
+        else:
+            # Which of them was needed is unknown; suspect the ones never
+            # pruned successfully first, and all of them if there are none
+            suspects = set(self.removed) - safe
+            unsafe.update(suspects or self.removed)
+        safe.difference_update(unsafe)
+        save_history(self.key, {'safe': sorted(safe), 'unsafe': sorted(unsafe)})
+
+
+def _blank_comments(text):
+    """Blank out comments without moving the text after them"""
+    return COMMENT_PATTERN.sub(lambda match: ' ' * len(match.group(0)), text)
+
+
+def _history_path(key):
+    return os.path.join(cache_dir('preambles'), key + '.json')
+
+
+def load_history(key):
+    """Return the packages earlier builds found safe and unsafe to prune from a preamble"""
+    try:
+        with open(_history_path(key), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_history(key, history):
+    path = _history_path(key)
+    partial = f"{path}.{os.getpid()}.{threading.get_ident()}.part"
+    with open(partial, 'w', encoding='utf-8') as f:
+        json.dump(history, f)
+    os.replace(partial, path)
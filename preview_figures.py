@@ -0,0 +1,167 @@
+"""Downsampled copies of a document's raster figures for preview builds
+
+pdflatex reads and embeds every figure in full on each compile, so a preview
+of an image-heavy report spends most of its time on pixels nobody will zoom
+into. Preview builds link reduced copies into the working directory instead
+of the originals. The copies are cached by the original's SHA-256 and the
+target resolution, made in parallel the first time they are needed, and
+evicted least recently used first once the cache passes its size limit.
+Their resolution metadata is scaled with them, so figures included at
+their natural size keep that size. Final builds always use the originals.
+"""
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from assets import symlink_file
+from build_cache import cache_dir, hash_file, touch, trim_cache
+
+# Formats pdflatex embeds pixel by pixel; PDF and EPS figures stay as they are
+RASTER_FORMATS = {'.png': 'PNG', '.jpg': 'JPEG', '.jpeg': 'JPEG'}
+
+# Target resolution (LRC_PREVIEW_DPI overrides it), and the longest side of
+# a page it applies to (inches)
+DEFAULT_PREVIEW_DPI = 100
+PAGE_INCHES = 11
+# pdflatex's resolution for images that do not record one
+DEFAULT_DPI = 72
+# Copies least recently used are deleted past this size
+PREVIEW_CACHE_BYTES = 512 << 20
+
+# Digests by (path, mtime, size); cleared when it grows past this
+MAX_DIGESTS = 4096
+_digests = {}
+_digests_lock = threading.Lock()
+
+
+def _digest(path):
+    stat = os.stat(path)
+    key = (path, stat.st_mtime_ns, stat.st_size)
+    with _digests_lock:
+        digest = _digests.get(key)
+    if digest is None:
+        digest = hash_file(path).hexdigest()
+        with _digests_lock:
+            if len(_digests) >= MAX_DIGESTS:
+                _digests.clear()
+            _digests[key] = digest
+    return digest
+
+
+_preview_dpi = None
+
+
+def preview_dpi():
+    """The target resolution, read from LRC_PREVIEW_DPI on first use"""
+    global _preview_dpi
+    if _preview_dpi is None:
+        text = os.environ.get('LRC_PREVIEW_DPI')
+        _preview_dpi = DEFAULT_PREVIEW_DPI
+        if text:
+            try:
+                _preview_dpi = int(text)
+            except ValueError:
+                _preview_dpi = 0
+            if _preview_dpi <= 0:
+                print(f"Ignoring invalid LRC_PREVIEW_DPI={text!r}, using {DEFAULT_PREVIEW_DPI}")
+                _preview_dpi = DEFAULT_PREVIEW_DPI
+    return _preview_dpi
+
+
+def downsample(src, dst, image_format, dpi=None):
+    """Write a copy of src no larger than a page at dpi to dst
+
+    Returns False, writing nothing, when src is already small enough.
+    """
+    from PIL import Image
+    limit = (dpi or preview_dpi()) * PAGE_INCHES
+    with Image.open(src) as image:
+        width, height = image.size
+        if max(width, height) <= limit:
+            return False
+        source_dpi = image.info.get('dpi') or (DEFAULT_DPI, DEFAULT_DPI)
+        if image.mode == 'P':
+            image = image.convert('RGBA' if 'transparency' in image.info else 'RGB')
+        elif image.mode not in ('1', 'L', 'LA', 'RGB', 'RGBA', 'CMYK'):
+            image = image.convert('RGB')
+        # A whole target resolution, since JPEG records it as an integer
+        scale = max(1, int(source_dpi[0] * limit / max(width, height))) / source_dpi[0]
+        # thumbnail() decodes JPEGs at reduced size and keeps the aspect ratio
+        image.thumbnail((max(1, round(width * scale)), max(1, round(height * scale))))
+        options = {'dpi': (source_dpi[0] * image.size[0] / width, source_dpi[1] * image.size[1] / height)}
+        if image_format == 'JPEG':
+            options['quality'] = 85
+            if image.mode in ('LA', 'RGBA'):
+                image = image.convert('RGB')
+        else:
+            options['compress_level'] = 1
+        partial = f"{dst}.{os.getpid()}.{threading.get_ident()}.part"
+        try:
+            image.save(partial, image_format, **options)
+        except Exception:
+            if os.path.exists(partial):
+                os.remove(partial)
+            raise
+    os.replace(partial, dst)
+    return True
+
+
+def stage_preview_figures(assets, source_dir, work_dir, dpi=None):
+    """Replace the staged raster figures in work_dir with downsampled copies
+
+    assets is the AssetSet returned by stage_assets(). Returns the number of
+    figures replaced and how many of those copies were already cached.
+    """
+    # Pillow is optional (and only loaded here, to keep startup light)
+    try:
+        from PIL import Image
+    except ImportError:
+        return 0, 0
+    cache = cache_dir('preview-figures')
+    dpi = dpi or preview_dpi()
+
+    figures = []
+    for relative in assets.files:
+        extension = os.path.splitext(relative)[1].lower()
+        if extension not in RASTER_FORMATS:
+            continue
+        source = os.path.join(source_dir, relative)
+        try:
+            name = f"{_digest(source)}-{dpi}"
+        except OSError:
+            continue
+        figures.append((relative, source, os.path.join(cache, name + extension),
+                        os.path.join(cache, name + '.keep'), RASTER_FORMATS[extension]))
+
+    def prepare(figure):
+        relative, source, copy, keep, image_format = figure
+        try:
+            if not downsample(source, copy, image_format, dpi):
+                # Small enough already; remember that instead of decoding it again
+                open(keep, 'w').close()
+        except (OSError, ValueError, Image.DecompressionBombError) as e:
+            print(f"Could not downsample {relative}: {str(e)}")
+
+    # Pillow releases the GIL while decoding and resizing
+    missing = [figure for figure in figures if not os.path.exists(figure[2]) and not os.path.exists(figure[3])]
+    reused = sum(1 for figure in figures if os.path.exists(figure[2]))
+    if len(missing) > 1:
+        with ThreadPoolExecutor(max_workers=min(len(missing), os.cpu_count() or 2)) as pool:
+            list(pool.map(prepare, missing))
+    elif missing:
+        prepare(missing[0])
+
+    replaced = 0
+    for relative, _, copy, keep, _ in figures:
+        touch(keep)
+        if os.path.exists(copy):
+            touch(copy)
+            target = os.path.join(work_dir, relative)
+            if os.path.lexists(target):
+                os.remove(target)
+            symlink_file(copy, target)
+            replaced += 1
+    if missing:
+        # Only new copies can grow the cache; the ones this build links stay
+        trim_cache(cache, PREVIEW_CACHE_BYTES, keep={figure[2] for figure in figures})
+    return replaced, reused
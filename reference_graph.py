@@ -0,0 +1,160 @@
+import re
+import bisect
+
+from assets import COMMENT_PATTERN
+
+# \label and \bibitem define names; \ref-style commands and citations use them
+REFERENCE_PATTERN = re.compile(
+    r'\\(label|bibitem|(?:eq|page|auto|name|v|c|C|cpage|Cpage)?ref|(?:no)?cite[a-zA-Z]*)\*?'
+    r'\s*(?:\[[^\]]*\]\s*){0,2}{([^}]*)}'
+)
+DEFINING_COMMANDS = ('label', 'bibitem')
+
+
+def _commented(content, position):
+    line_start = content.rfind('\n', 0, position) + 1
+    return COMMENT_PATTERN.search(content, line_start, position) is not None
+
+
+class ReferenceGraph:
+    """Which sections reference labels and citations defined in which others
+
+    The document is scanned once. Afterwards the graph tracks a selection
+    the way PageEstimate does: toggling a component only revisits its
+    top-level section and the references of the spans whose inclusion
+    changed, and broken holds, for every excluded span, how many references
+    from included text point into it.
+    """
+
+    def __init__(self, index):
+        self.index = index
+        spans = index.spans
+        content = index.content
+        starts = [span.start for span in spans]
+        count = len(spans)
+        # Span number of each defined name; text before the first heading is always kept
+        definitions = {}
+        uses = []
+        for match in REFERENCE_PATTERN.finditer(content, index.body_start, index.body_end):
+            if _commented(content, match.start()):
+                continue
+            # Front matter is -1
+            number = bisect.bisect_right(starts, match.start()) - 1
+            command = match.group(1)
+            names = [name.strip() for name in match.group(2).split(',') if name.strip()]
+            if command in DEFINING_COMMANDS:
+                for name in names:
+                    definitions.setdefault(name, number)
+            else:
+                for name in names:
+                    uses.append((number, command, name))
+
+        # References between different spans; names defined elsewhere (.bib, \input files) are left out
+        self.uses = [[] for _ in range(count)]
+        self.used_by = [[] for _ in range(count)]
+        self.front_uses = []
+        for number, command, name in uses:
+            target = definitions.get(name, -1)
+            if target == -1 or target == number:
+                continue
+            if number == -1:
+                self.front_uses.append(target)
+            else:
+                self.uses[number].append(target)
+            self.used_by[target].append((number, command, name))
+
+        # Outline bookkeeping, by span position
+        position = {id(span): number for number, span in enumerate(spans)}
+        self.parent = [position[id(span.parent)] if span.parent is not None else None for span in spans]
+        self.top = []
+        for number, parent in enumerate(self.parent):
+            self.top.append(number if parent is None else self.top[parent])
+        self.subtree_end = list(range(1, count + 1))
+        for number in range(count - 1, -1, -1):
+            top = self.top[number]
+            self.subtree_end[top] = max(self.subtree_end[top], number + 1)
+        self.by_key = {}
+        for number, span in enumerate(spans):
+            self.by_key.setdefault(span.key, []).append(number)
+
+        self.set_selection([span.key for span in spans])
+
+    def set_selection(self, selected_components):
+        """Start over from a complete selection (O(n + references))"""
+        selected = set(selected_components)
+        self.selected = [span.key in selected for span in self.index.spans]
+        self.included = [False] * len(self.selected)
+        self.broken = {}
+        for target in self.front_uses:
+            self.broken[target] = self.broken.get(target, 0) + 1
+        for number, parent in enumerate(self.parent):
+            if parent is None:
+                self._update_subtree(number)
+
+    def toggle(self, key, checked):
+        """Update after one component was checked or unchecked"""
+        tops = []
+        for number in self.by_key.get(key, ()):
+            self.selected[number] = checked
+            if self.top[number] not in tops:
+                tops.append(self.top[number])
+        for top in tops:
+            self._update_subtree(top)
+
+    def _update_subtree(self, top):
+        # Same rules as SectionIndex.included_spans, for one top-level section
+        end = self.subtree_end[top]
+        restricted = any(self.selected[number] for number in range(top + 1, end))
+        for number in range(top, end):
+            parent = self.parent[number]
+            if parent is None:
+                include = self.selected[number]
+            elif not self.included[parent]:
+                include = False
+            elif restricted:
+                include = self.selected[number]
+            else:
+                include = True
+            if include != self.included[number]:
+                self._set_included(number, include)
+
+    def _set_included(self, number, include):
+        self.included[number] = include
+        broken = self.broken
+        if include:
+            broken.pop(number, None)
+            for target in self.uses[number]:
+                if not self.included[target]:
+                    broken[target] = broken.get(target, 0) + 1
+        else:
+            for target in self.uses[number]:
+                if not self.included[target]:
+                    broken[target] -= 1
+                    if not broken[target]:
+                        del broken[target]
+            users = sum(1 for user, _, _ in self.used_by[number] if user == -1 or self.included[user])
+            if users:
+                broken[number] = users
+
+    def broken_count(self):
+        """Number of references from the selection to excluded text"""
+        return sum(self.broken.values())
+
+    def missing_components(self):
+        """Keys of the excluded components that the selection references"""
+        spans = self.index.spans
+        return list(dict.fromkeys(spans[number].key for number in sorted(self.broken)))
+
+    def describe_broken(self, limit=10):
+        """Lines like '\\ref{sec:b} in Alpha → Beta' for the first broken references"""
+        spans = self.index.spans
+        lines = []
+        for target in sorted(self.broken):
+            for user, command, name in self.used_by[target]:
+                if user != -1 and not self.included[user]:
+                    continue
+                source = spans[user].key if user != -1 else "front matter"
+                lines.append(f"\\{command}{{{name}}} in {source} → {spans[target].key}")
+                if len(lines) == limit:
+                    return lines
+        return lines
@@ -0,0 +1,95 @@
+import re
+import bisect
+
+from PyQt5.QtCore import QThread, pyqtSignal
+
+# Words of the text; control sequences are matched too so they can be skipped
+TOKEN_PATTERN = re.compile(r'\\[a-z@]+|\w+')
+QUERY_PATTERN = re.compile(r'\w+')
+
+# Query terms shorter than this only match whole words
+MIN_PREFIX = 2
+
+
+def tokenize(text):
+    """Return the set of lower-cased words in a piece of LaTeX, without command names"""
+    # Deduplicate before filtering: sections repeat most of their words
+    tokens = set(TOKEN_PATTERN.findall(text.lower()))
+    return {token for token in tokens if token[0] != '\\'}
+
+
+class SearchIndex:
+    """Inverted index from words to the section spans that contain them
+
+    Each span's words are cached by the span's text, so rebuilding the index
+    after the file changed only tokenizes the sections that were edited.
+    """
+
+    def __init__(self, index, previous=None, cancelled=None):
+        self.keys = [span.key for span in index.spans]
+        content = index.content
+        reusable = previous.span_tokens if previous is not None else {}
+        self.span_tokens = {}
+        self.reused = 0
+
+        postings = {}
+        for number, span in enumerate(index.spans):
+            if cancelled is not None and cancelled():
+                raise RuntimeError("Search indexing cancelled")
+            text = content[span.start:span.end]
+            fingerprint = (hash(text), len(text))
+            tokens = reusable.get(fingerprint)
+            if tokens is None:
+                tokens = frozenset(tokenize(text))
+            else:
+                self.reused += 1
+            self.span_tokens[fingerprint] = tokens
+            for token in tokens:
+                postings.setdefault(token, []).append(number)
+
+        self.postings = postings
+        self.vocabulary = sorted(postings)
+
+    def search(self, query):
+        """Return the positions of the spans containing every term of query
+
+        Terms match as word prefixes, so "pric" finds "pricing" and "prices".
+        """
+        result = None
+        for term in QUERY_PATTERN.findall(query.lower()):
+            matches = set()
+            if len(term) < MIN_PREFIX:
+                matches.update(self.postings.get(term, ()))
+            else:
+                position = bisect.bisect_left(self.vocabulary, term)
+                while position < len(self.vocabulary) and self.vocabulary[position].startswith(term):
+                    matches.update(self.postings[self.vocabulary[position]])
+                    position += 1
+            result = matches if result is None else result & matches
+            if not result:
+                return []
+        return sorted(result) if result else []
+
+    def matching_keys(self, query):
+        """Return the component keys of the matching spans, in document order"""
+        return list(dict.fromkeys(self.keys[number] for number in self.search(query)))
+
+
+class SearchIndexThread(QThread):
+    """Builds a SearchIndex off the GUI thread"""
+    index_ready = pyqtSignal(object)
+
+    def __init__(self, section_index, previous=None):
+        super().__init__()
+        self.section_index = section_index
+        self.previous = previous
+
+    def run(self):
+        try:
+            search_index = SearchIndex(self.section_index, self.previous, self.isInterruptionRequested)
+        except Exception as e:
+            if self.isInterruptionRequested():
+                return
+            print(f"Error building search index: {str(e)}")
+            return
+        self.index_ready.emit(search_index)
@@ -0,0 +1,166 @@
+import re
+
+# Section commands recognised as components, in the same form the GUI lists them
+SECTION_PATTERN = re.compile(r'\\(chapter|section|subsection|subsubsection){([^}]*)}')
+SECTION_LEVELS = {'chapter': 0, 'section': 0, 'subsection': 1, 'subsubsection': 2}
+
+BEGIN_DOCUMENT = '\\begin{document}'
+END_DOCUMENT = '\\end{document}'
+
+
+class SectionSpan:
+    """A section header and the body text that follows it up to the next header"""
+    __slots__ = ('kind', 'title', 'key', 'level', 'start', 'end', 'parent', 'children')
+
+    def __init__(self, kind, title, key, level, start, end, parent):
+        self.kind = kind
+        self.title = title
+        self.key = key
+        self.level = level
+        self.start = start
+        self.end = end
+        self.parent = parent
+        self.children = []
+
+    def __repr__(self):
+        return f"SectionSpan({self.key!r}, {self.start}-{self.end})"
+
+
+class SectionIndex:
+    """Offset index of the sections in a LaTeX document
+
+    The document is scanned once; filtering a selection afterwards only slices
+    the original string at the recorded offsets.
+    """
+
+    def __init__(self, content):
+        self.content = content
+
+        doc_start = content.find(BEGIN_DOCUMENT)
+        doc_end = content.find(END_DOCUMENT)
+
+        if doc_start == -1 or doc_end == -1:
+            raise ValueError("Could not find document begin/end tags")
+
+        self.body_start = doc_start + len(BEGIN_DOCUMENT)
+        self.body_end = doc_end
+        self.spans = []
+        # Top-level sections; deeper ones hang off their parent's children
+        self.roots = []
+
+        current_section = None
+        parents = []
+        for match in SECTION_PATTERN.finditer(content, self.body_start, self.body_end):
+            kind = match.group(1)
+            title = match.group(2).strip()
+            level = SECTION_LEVELS[kind]
+
+            # Components are keyed the way the GUI labels its checkboxes
+            if level == 0:
+                current_section = title
+                key = title
+            elif current_section:
+                key = f"{current_section} - {title}"
+            else:
+                key = title
+
+            # Nearest preceding header of a higher level owns this one
+            while parents and parents[-1].level >= level:
+                parents.pop()
+            parent = parents[-1] if parents else None
+
+            if self.spans:
+                self.spans[-1].end = match.start()
+
+            span = SectionSpan(kind, title, key, level, match.start(), self.body_end, parent)
+            self.spans.append(span)
+            parents.append(span)
+            (parent.children if parent is not None else self.roots).append(span)
+
+        # Text between \begin{document} and the first header is always kept
+        self.pre_section_end = self.spans[0].start if self.spans else self.body_end
+
+    def included_spans(self, selected_components):
+        """Return the spans kept for the given selection, in document order"""
+        selected = set(selected_components)
+
+        # Sections with explicitly selected subsections only keep those subsections
+        restricted = set()
+        for span in self.spans:
+            if span.parent is not None and span.key in selected:
+                restricted.add(id(self._top_level(span)))
+
+        included = {}
+        result = []
+        for span in self.spans:
+            if span.parent is None:
+                include = span.key in selected
+            elif not included[id(span.parent)]:
+                include = False
+            elif id(self._top_level(span)) in restricted:
+                include = span.key in selected
+            else:
+                include = True
+
+            included[id(span)] = include
+            if include:
+                result.append(span)
+        return result
+
+    def ordered_spans(self, order):
+        """Return all spans with sibling sections rearranged by order (a list of keys)
+
+        A section moves together with its subsections. Sections whose keys are
+        not in order follow their listed siblings in document order.
+        """
+        rank = {}
+        for number, key in enumerate(order):
+            rank.setdefault(key, number)
+        missing = len(rank)
+
+        def arranged(siblings):
+            # Reversed, so the stack below pops them first to last
+            return sorted(siblings, key=lambda span: rank.get(span.key, missing))[::-1]
+
+        result = []
+        pending = arranged(self.roots)
+        while pending:
+            span = pending.pop()
+            result.append(span)
+            pending.extend(arranged(span.children))
+        return result
+
+    def render(self, selected_components, order=None):
+        """Return the full document with only the selected components in its body
+
+        With order (a list of component keys), sibling sections appear in that
+        order; the document is still assembled from the original spans.
+        """
+        content = self.content
+        pieces = [content[:self.pre_section_end]]
+
+        spans = self.included_spans(selected_components)
+        if order is not None:
+            included = {id(span) for span in spans}
+            spans = [span for span in self.ordered_spans(order) if id(span) in included]
+
+        # Coalesce neighbouring spans so contiguous selections are copied once
+        run_start = run_end = None
+        for span in spans:
+            if span.start == run_end:
+                run_end = span.end
+                continue
+            if run_start is not None:
+                pieces.append(content[run_start:run_end])
+            run_start, run_end = span.start, span.end
+        if run_start is not None:
+            pieces.append(content[run_start:run_end])
+
+        pieces.append(content[self.body_end:])
+        return ''.join(pieces)
+
+    @staticmethod
+    def _top_level(span):
+        while span.parent is not None:
+            span = span.parent
+        return span
@@ -0,0 +1,40 @@
+"""Shared set-up for the tests: an isolated cache and the fake pdflatex"""
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks import fake_pdflatex
+from latex_processor import LaTeXProcessingThread
+
+
+class IsolatedCacheTestCase(unittest.TestCase):
+    """Runs with the cache, scratch space and build history in a temporary directory"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix="lrc_test_")
+        self.addCleanup(shutil.rmtree, self.directory, True)
+        saved = dict(os.environ)
+        self.addCleanup(os.environ.update, saved)
+        self.addCleanup(os.environ.clear)
+        os.environ['XDG_CACHE_HOME'] = os.path.join(self.directory, 'cache')
+        os.environ['LRC_HISTORY_DB'] = os.path.join(self.directory, 'history.sqlite3')
+        self.engine = fake_pdflatex.install(os.path.join(self.directory, 'bin'))
+
+
+def build(input_file, output_pdf, selected, engine, **kwargs):
+    """Run a build synchronously; returns (success, message)"""
+    results = []
+    thread = LaTeXProcessingThread(input_file, output_pdf, selected, engine, **kwargs)
+    thread.finished_signal.connect(lambda success, message: results.append((success, message)))
+    thread.run()
+    return results[0]
+
+
+def read_trail(pdf):
+    """The files the fake engine read, as recorded at the end of its PDF"""
+    with open(pdf, 'r', encoding='utf-8', errors='replace') as f:
+        return dict(line[2:].split(' ', 1) for line in f.read().splitlines() if line.startswith('% '))
@@ -0,0 +1,61 @@
+"""A shared compile daemon builds other users' documents from checked copies"""
+import os
+import sys
+import unittest
+
+from tests.helpers import IsolatedCacheTestCase
+
+from compile_daemon import snapshot_source
+
+DOCUMENT = r"""\documentclass{article}
+\begin{document}
+\section{Figures}
+\includegraphics{figures/plot.png}
+\input{%s}
+\end{document}
+"""
+
+
+@unittest.skipIf(sys.platform == 'win32', "the daemon runs on Unix sockets")
+class SnapshotTest(IsolatedCacheTestCase):
+    def setUp(self):
+        super().setUp()
+        self.source = os.path.join(self.directory, 'source')
+        self.snapshot = os.path.join(self.directory, 'snapshot')
+        os.makedirs(os.path.join(self.source, 'figures'))
+        os.makedirs(self.snapshot)
+        with open(os.path.join(self.source, 'figures', 'plot.png'), 'wb') as f:
+            f.write(b'plot')
+        self.secret = os.path.join(self.directory, 'secret.tex')
+        with open(self.secret, 'w', encoding='utf-8') as f:
+            f.write('the daemon user only\n')
+
+    def write_document(self, inputs):
+        input_file = os.path.join(self.source, 'report.tex')
+        with open(input_file, 'w', encoding='utf-8') as f:
+            f.write(DOCUMENT % inputs)
+        return input_file
+
+    def test_referenced_files_are_copied(self):
+        with open(os.path.join(self.source, 'chapter.tex'), 'w', encoding='utf-8') as f:
+            f.write('chapter text\n')
+        copy = snapshot_source(self.write_document('chapter'), os.getuid(), self.snapshot)
+        self.assertEqual(os.path.dirname(copy), self.snapshot)
+        for relative in ('chapter.tex', os.path.join('figures', 'plot.png')):
+            path = os.path.join(self.snapshot, relative)
+            self.assertTrue(os.path.isfile(path) and not os.path.islink(path), relative)
+
+    def test_symlink_out_of_the_source_directory_is_refused(self):
+        os.symlink(self.secret, os.path.join(self.source, 'planted.tex'))
+        with self.assertRaises(PermissionError):
+            snapshot_source(self.write_document('planted'), os.getuid(), self.snapshot)
+        self.assertFalse(os.path.exists(os.path.join(self.snapshot, 'planted.tex')))
+
+    def test_symlinked_directory_out_of_the_source_directory_is_refused(self):
+        os.symlink(self.directory, os.path.join(self.source, 'up'))
+        with self.assertRaises(PermissionError):
+            snapshot_source(self.write_document('up/secret'), os.getuid(), self.snapshot)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+"""A pruned build that fails is repeated with the full preamble"""
+import os
+import sys
+import unittest
+
+from tests.helpers import IsolatedCacheTestCase, build
+from preamble_pruning import PrunedPreamble, load_history
+
+DOCUMENT = r"""\documentclass{article}
+\usepackage{tikz}
+\begin{document}
+\section{Plain}
+plain text
+\section{Colour}
+\textcolor{red}{coloured text}
+\end{document}
+"""
+
+# \textcolor comes in through tikz (which loads xcolor) but is not one of the
+# commands tikz is known by, so pruning cannot tell it is needed
+ENGINE = r"""import os, sys
+sys.path.insert(0, {root!r})
+from benchmarks import fake_pdflatex
+with open(sys.argv[-1], encoding='utf-8') as f:
+    content = f.read()
+if '\\textcolor' in content and '{{tikz}}' not in content:
+    print("! Undefined control sequence.")
+    sys.exit(1)
+sys.exit(fake_pdflatex.main(sys.argv[1:]))
+"""
+
+
+class PruningTest(IsolatedCacheTestCase):
+    def setUp(self):
+        super().setUp()
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        script = os.path.join(self.directory, 'engine.py')
+        with open(script, 'w', encoding='utf-8') as f:
+            f.write(ENGINE.format(root=root))
+        self.engine = os.path.join(self.directory, 'bin', 'xcolor-pdflatex')
+        with open(self.engine, 'w') as f:
+            f.write(f'#!/bin/sh\nexec "{sys.executable}" "{script}" "$@"\n')
+        os.chmod(self.engine, 0o755)
+
+        self.input_file = os.path.join(self.directory, 'report.tex')
+        with open(self.input_file, 'w', encoding='utf-8') as f:
+            f.write(DOCUMENT)
+
+    def build(self, section):
+        return build(self.input_file, os.path.join(self.directory, 'out.pdf'), [section], self.engine,
+                     prune_preamble=True)
+
+    @unittest.skipIf(sys.platform == 'win32', "uses a shell script engine")
+    def test_selection_needing_a_package_pruned_before_falls_back(self):
+        success, message = self.build('Plain')
+        self.assertTrue(success, message)
+        self.assertIn("skipped 1 unused packages", message)
+        key = PrunedPreamble(DOCUMENT).key
+        self.assertEqual(load_history(key).get('safe'), ['tikz'])
+
+        # tikz was pruned successfully before, but this selection needs it
+        success, message = self.build('Colour')
+        self.assertTrue(success, message)
+        self.assertIn("with the full preamble", message)
+        self.assertEqual(load_history(key).get('unsafe'), ['tikz'])
+
+        success, message = self.build('Plain')
+        self.assertTrue(success, message)
+        self.assertNotIn("skipped", message)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,37 @@
+"""Builds must read the filtered source and their own auxiliary files"""
+import os
+import unittest
+
+from tests.helpers import IsolatedCacheTestCase, build, read_trail
+
+DOCUMENT = r"""\documentclass{article}
+\begin{document}
+\section{Kept}
+kept text
+\section{Dropped}
+dropped text
+\end{document}
+"""
+
+
+class StagingTest(IsolatedCacheTestCase):
+    def test_source_files_named_like_the_job_are_not_read(self):
+        source = os.path.join(self.directory, 'source')
+        os.makedirs(source)
+        with open(os.path.join(source, 'document.tex'), 'w', encoding='utf-8') as f:
+            f.write(DOCUMENT)
+        with open(os.path.join(source, 'document.aux'), 'w', encoding='utf-8') as f:
+            f.write('\\relax % stale\n')
+
+        for preview in (False, True):
+            output = os.path.join(self.directory, f'out-{preview}.pdf')
+            success, message = build(os.path.join(source, 'document.tex'), output, ['Kept'],
+                                     self.engine, preview=preview)
+            self.assertTrue(success, message)
+            trail = read_trail(output)
+            self.assertNotEqual(os.path.dirname(trail['input']), source)
+            self.assertNotEqual(os.path.dirname(trail['aux']), source)
+
+
+if __name__ == '__main__':
+    unittest.main()
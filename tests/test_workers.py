@@ -0,0 +1,43 @@
+"""Remote builds record the page count like local ones"""
+import os
+import sys
+import unittest
+
+from tests.helpers import IsolatedCacheTestCase
+from benchmarks.workers import start_worker
+from build_workers import RemoteBuildThread, WorkerPool
+from page_estimate import load_learned
+
+DOCUMENT = r"""\documentclass{article}
+\begin{document}
+\section{Only}
+text
+\end{document}
+"""
+
+
+class RemoteBuildTest(IsolatedCacheTestCase):
+    def setUp(self):
+        super().setUp()
+        self.input_file = os.path.join(self.directory, 'report.tex')
+        with open(self.input_file, 'w', encoding='utf-8') as f:
+            f.write(DOCUMENT)
+        env = dict(os.environ, PYTHONUNBUFFERED='1')
+        env.pop('LRC_WORKER_TOKEN', None)
+        process, address = start_worker(self.engine, 1, os.path.join(self.directory, 'blobs'), env)
+        self.addCleanup(process.stdout.close)
+        self.addCleanup(process.wait, 10)
+        self.addCleanup(process.terminate)
+        self.pool = WorkerPool([address])
+
+    @unittest.skipIf(sys.platform == 'win32', "uses a shell script engine")
+    def test_remote_build_records_page_count(self):
+        results = []
+        thread = RemoteBuildThread(self.input_file, os.path.join(self.directory, 'out.pdf'), ['Only'],
+                                   self.engine, pool=self.pool)
+        thread.finished_signal.connect(lambda success, message: results.append((success, message)))
+        thread.run()
+        success, message = results[0]
+        self.assertTrue(success, message)
+        self.assertEqual(thread.pages, 1)
+        self.assertIn('chars_per_page', load_learned(self.input_file))
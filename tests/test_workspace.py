@@ -0,0 +1,66 @@
+"""Builds that outgrow tmpfs move to disk; builds that outgrow the quota fail"""
+import os
+import sys
+import unittest
+
+import workspace
+from tests.helpers import IsolatedCacheTestCase, build
+from workspace import Workspace
+
+DOCUMENT = r"""\documentclass{article}
+\begin{document}
+\section{Only}
+text
+\end{document}
+"""
+
+# Writes a scratch file of LRC_TEST_BULK bytes next to the document on every pass
+ENGINE = r"""import os, sys
+sys.path.insert(0, {root!r})
+from benchmarks import fake_pdflatex
+with open('document.bulk', 'wb') as f:
+    f.write(bytes(int(os.environ['LRC_TEST_BULK'])))
+sys.exit(fake_pdflatex.main(sys.argv[1:]))
+"""
+
+QUOTA = 8 * 2 ** 20
+
+
+class QuotaTest(IsolatedCacheTestCase):
+    def setUp(self):
+        super().setUp()
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        script = os.path.join(self.directory, 'engine.py')
+        with open(script, 'w', encoding='utf-8') as f:
+            f.write(ENGINE.format(root=root))
+        self.engine = os.path.join(self.directory, 'bin', 'bulk-pdflatex')
+        with open(self.engine, 'w') as f:
+            f.write(f'#!/bin/sh\nexec "{sys.executable}" "{script}" "$@"\n')
+        os.chmod(self.engine, 0o755)
+
+        self.input_file = os.path.join(self.directory, 'report.tex')
+        with open(self.input_file, 'w', encoding='utf-8') as f:
+            f.write(DOCUMENT)
+
+        self.workspace = Workspace(os.path.join(self.directory, 'scratch'), quota=QUOTA, use_tmpfs=True)
+        self.addCleanup(self.workspace.close)
+        saved, workspace._workspace = workspace._workspace, self.workspace
+        self.addCleanup(setattr, workspace, '_workspace', saved)
+
+    def build(self, size):
+        os.environ['LRC_TEST_BULK'] = str(size)
+        return build(self.input_file, os.path.join(self.directory, 'out.pdf'), ['Only'], self.engine)
+
+    @unittest.skipIf(sys.platform == 'win32', "uses a shell script engine")
+    def test_build_outgrowing_tmpfs_is_repeated_on_disk(self):
+        if self.workspace.tmpfs_dir is None:
+            self.skipTest("no usable tmpfs")
+        success, message = self.build(QUOTA // 2)
+        self.assertTrue(success, message)
+        self.assertEqual(self.workspace.build_dir, self.workspace.session_dirs[0])
+
+    @unittest.skipIf(sys.platform == 'win32', "uses a shell script engine")
+    def test_build_outgrowing_the_quota_fails(self):
+        success, message = self.build(QUOTA * 2)
+        self.assertFalse(success)
+        self.assertLess(self.workspace.usage(), QUOTA)
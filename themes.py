@@ -0,0 +1,172 @@
+from PyQt5.QtCore import Qt
+from PyQt5.QtGui import QColor, QPalette
+from PyQt5.QtWidgets import QApplication
+
+# Colours of each theme; the stylesheet and palettes are both built from these
+THEMES = {
+    'light': {
+        'window': '#ffffff', 'text': '#333333',
+        'group': '#fafafa', 'border': '#e1e1e1', 'title': '#444444',
+        'accent': '#4a86e8', 'accent_hover': '#3a76d8', 'accent_pressed': '#2a66c8',
+        'disabled': '#cccccc', 'disabled_text': '#888888',
+        'secondary': '#3498db', 'secondary_hover': '#2980b9', 'secondary_pressed': '#1c6da3',
+        'primary': '#27ae60', 'primary_hover': '#219955', 'primary_pressed': '#1e8449',
+        'panel': '#f5f5f5', 'panel_text': '#444444', 'selected': '#e8e8e8',
+        'scroll_track': '#f5f5f5', 'scroll_handle': '#cccccc', 'match': '#fff3b0',
+    },
+    'dark': {
+        'window': '#2d2d2d', 'text': '#e0e0e0',
+        'group': '#333333', 'border': '#444444', 'title': '#ffffff',
+        'accent': '#0c61c9', 'accent_hover': '#1471d9', 'accent_pressed': '#0a51a9',
+        'disabled': '#555555', 'disabled_text': '#888888',
+        'secondary': '#666666', 'secondary_hover': '#777777', 'secondary_pressed': '#555555',
+        'primary': '#278c54', 'primary_hover': '#22774a', 'primary_pressed': '#1d6940',
+        'panel': '#333333', 'panel_text': '#bbbbbb', 'selected': '#444444',
+        'scroll_track': '#444444', 'scroll_handle': '#666666', 'match': '#5c5322',
+    },
+}
+
+# Rules that are the same in every theme
+BASE_STYLESHEET = """
+QGroupBox {
+    font-weight: bold;
+    font-size: 11pt;
+    border-radius: 6px;
+    margin-top: 1.5ex;
+    padding: 8px;
+}
+QGroupBox::title {
+    subcontrol-origin: margin;
+    subcontrol-position: top left;
+    padding: 0 5px;
+}
+QPushButton {
+    color: white;
+    border: none;
+    border-radius: 4px;
+    font-weight: bold;
+    min-height: 28px;
+    padding: 4px 16px;
+}
+QPushButton[primary="true"] {
+    padding: 8px;
+    font-size: 16px;
+    letter-spacing: 1px;
+}
+QCheckBox {
+    spacing: 8px;
+    font-size: 10.5pt;
+    padding: 2px 0;
+}
+QCheckBox::indicator {
+    width: 16px;
+    height: 16px;
+}
+QScrollArea {
+    border: none;
+    background-color: transparent;
+}
+QScrollBar:vertical {
+    border: none;
+    width: 10px;
+    margin: 0;
+}
+QScrollBar::handle:vertical {
+    min-height: 20px;
+    border-radius: 5px;
+}
+QProgressBar {
+    border-radius: 4px;
+    text-align: center;
+}
+QProgressBar::chunk {
+    border-radius: 3px;
+}
+"""
+
+# Colour rules, scoped to the main window's "theme" property
+THEMED_TEMPLATE = """
+{scope} QGroupBox {{ border: 1px solid {border}; background-color: {group}; }}
+{scope} QGroupBox::title {{ color: {title}; }}
+{scope} QPushButton {{ background-color: {accent}; }}
+{scope} QPushButton:hover {{ background-color: {accent_hover}; }}
+{scope} QPushButton:pressed {{ background-color: {accent_pressed}; }}
+{scope} QPushButton:disabled {{ background-color: {disabled}; color: {disabled_text}; }}
+{scope} QPushButton[secondary="true"] {{ background-color: {secondary}; }}
+{scope} QPushButton[secondary="true"]:hover {{ background-color: {secondary_hover}; }}
+{scope} QPushButton[secondary="true"]:pressed {{ background-color: {secondary_pressed}; }}
+{scope} QPushButton[primary="true"] {{ background-color: {primary}; }}
+{scope} QPushButton[primary="true"]:hover {{ background-color: {primary_hover}; }}
+{scope} QPushButton[primary="true"]:pressed {{ background-color: {primary_pressed}; }}
+{scope} QPushButton[primary="true"]:disabled {{ background-color: {disabled}; }}
+{scope} QCheckBox[match="true"] {{ background-color: {match}; }}
+{scope} QScrollBar:vertical {{ background: {scroll_track}; }}
+{scope} QScrollBar::handle:vertical {{ background: {scroll_handle}; }}
+{scope} QProgressBar {{ border: 1px solid {border}; background-color: {panel}; }}
+{scope} QProgressBar::chunk {{ background-color: {accent}; }}
+{scope} QStatusBar {{ background-color: {panel}; color: {panel_text}; }}
+{scope} QMenuBar {{ background-color: {panel}; color: {text}; }}
+{scope} QMenuBar::item {{ background-color: {panel}; color: {text}; }}
+{scope} QMenuBar::item:selected {{ background-color: {selected}; }}
+"""
+
+# Menus are top-level popups, so they cannot be scoped under the main window
+MENU_TEMPLATE = """
+QMenu[theme="{name}"] {{ background-color: {panel}; color: {text}; border: 1px solid {border}; }}
+QMenu[theme="{name}"]::item:selected {{ background-color: {selected}; color: {text}; }}
+"""
+
+# Everything is computed once at import; switching themes only picks from these
+STYLESHEET = BASE_STYLESHEET + ''.join(
+    THEMED_TEMPLATE.format(scope=f'QMainWindow[theme="{name}"]', **colors) +
+    MENU_TEMPLATE.format(name=name, **colors)
+    for name, colors in THEMES.items()
+)
+
+_palettes = {}
+
+
+def palette(name):
+    """Return the (cached) palette for a theme"""
+    if name not in _palettes:
+        colors = THEMES[name]
+        pal = QPalette()
+        for role, key in ((QPalette.Window, 'window'), (QPalette.WindowText, 'text'),
+                          (QPalette.Base, 'window'), (QPalette.AlternateBase, 'group'),
+                          (QPalette.Text, 'text'), (QPalette.Button, 'panel'),
+                          (QPalette.ButtonText, 'text'), (QPalette.ToolTipBase, 'panel'),
+                          (QPalette.ToolTipText, 'text'), (QPalette.Highlight, 'accent')):
+            pal.setColor(role, QColor(colors[key]))
+        pal.setColor(QPalette.HighlightedText, QColor('#ffffff'))
+        for role in (QPalette.WindowText, QPalette.Text, QPalette.ButtonText):
+            pal.setColor(QPalette.Disabled, role, QColor(colors['disabled_text']))
+        _palettes[name] = pal
+    return _palettes[name]
+
+
+def install(app):
+    """Set the application-wide stylesheet once
+
+    Palette propagation through stylesheet-styled widgets lets a theme switch
+    recolour plain widgets such as the component checkboxes without
+    re-polishing them.
+    """
+    QApplication.setAttribute(Qt.AA_UseStyleSheetPropagationInWidgetStyles, True)
+    app.setStyleSheet(STYLESHEET)
+
+
+def apply_theme(window, themed_widgets, name):
+    """Switch window to a theme
+
+    Only themed_widgets (the window's fixed chrome: group boxes, buttons, bars
+    and menus) are re-polished, so the cost does not grow with the number of
+    components in the document.
+    """
+    QApplication.instance().setPalette(palette(name))
+    window.setProperty('theme', name)
+    for widget in themed_widgets:
+        widget.setProperty('theme', name)
+        style = widget.style()
+        style.unpolish(widget)
+        style.polish(widget)
+        widget.update()
@@ -0,0 +1,165 @@
+import os
+import sys
+import json
+import time
+import threading
+
+# ru_maxrss is reported in kilobytes on Linux and in bytes on macOS
+MAXRSS_SCALE = 1 if sys.platform == 'darwin' else 1024
+
+
+# Spans measuring child processes that are open in each thread
+_open_spans = threading.local()
+
+
+def record_child_usage(cpu, maxrss):
+    """Attribute a reaped child process's CPU seconds and peak RSS to the open spans of this thread"""
+    for span in getattr(_open_spans, 'stack', ()):
+        span.child_cpu += cpu
+        span.child_maxrss = max(span.child_maxrss, maxrss)
+
+
+class _NullSpan:
+    """Span used when tracing is disabled; entering and leaving it does nothing"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+NULL_SPAN = _NullSpan()
+
+
+class Span:
+    """One timed stage of a build"""
+    __slots__ = ('tracer', 'name', 'children', 'start', 'end', 'thread_id',
+                 'child_cpu', 'child_maxrss')
+
+    def __init__(self, tracer, name, children):
+        self.tracer = tracer
+        self.name = name
+        self.children = children
+        self.child_cpu = None
+        self.child_maxrss = None
+
+    def __enter__(self):
+        # Engine processes report their usage when reaped (run_engine, POSIX only)
+        if self.children and hasattr(os, 'wait4'):
+            self.child_cpu = 0.0
+            self.child_maxrss = 0
+            if not hasattr(_open_spans, 'stack'):
+                _open_spans.stack = []
+            _open_spans.stack.append(self)
+        self.thread_id = threading.get_ident()
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.end = time.perf_counter_ns()
+        if self.child_cpu is not None:
+            _open_spans.stack.remove(self)
+        self.tracer.spans.append(self)
+        return False
+
+    @property
+    def duration(self):
+        return (self.end - self.start) / 1e9
+
+
+class Tracer:
+    """Collects timing spans for the stages of a build
+
+    A disabled tracer hands out a shared no-op span, so instrumented code
+    costs a single method call per stage.
+    """
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.spans = []
+        self.origin = time.perf_counter_ns()
+        # Named event counts, such as cache hits
+        self.counters = {}
+
+    def span(self, name, children=False):
+        """Time a stage; children=True also records the CPU time and peak RSS of processes it ran"""
+        if not self.enabled:
+            return NULL_SPAN
+        return Span(self, name, children)
+
+    def count(self, name, amount=1):
+        """Count an event of the build, e.g. a cache hit"""
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    def totals(self):
+        """Return [(name, seconds, child cpu seconds or None)] summed per stage name"""
+        totals = {}
+        for span in self.spans:
+            seconds, cpu = totals.get(span.name, (0.0, None))
+            if span.child_cpu is not None:
+                cpu = (cpu or 0.0) + span.child_cpu
+            totals[span.name] = (seconds + span.duration, cpu)
+        return [(name, seconds, cpu) for name, (seconds, cpu) in totals.items()]
+
+    def summary(self, limit=4):
+        """Return a one-line summary of the slowest stages"""
+        stages = sorted(self.totals(), key=lambda stage: stage[1], reverse=True)[:limit]
+        return " · ".join(f"{name} {_format_seconds(seconds)}" for name, seconds, _ in stages)
+
+    def table(self):
+        """Return a plain-text table of every stage, in the order they ran"""
+        lines = [f"{'stage':<22}{'time':>10}{'child cpu':>11}{'child rss':>11}"]
+        for span in self.spans:
+            cpu = _format_seconds(span.child_cpu) if span.child_cpu is not None else '-'
+            rss = f"{span.child_maxrss / 2 ** 20:.0f} MiB" if span.child_maxrss else '-'
+            lines.append(f"{span.name:<22}{_format_seconds(span.duration):>10}{cpu:>11}{rss:>11}")
+        return "\n".join(lines)
+
+    def chrome_trace(self):
+        """Return the spans as a Chrome/Perfetto trace event document"""
+        pid = os.getpid()
+        events = []
+        for span in self.spans:
+            args = {}
+            if span.child_cpu is not None:
+                args['child_cpu_s'] = round(span.child_cpu, 6)
+                args['child_maxrss_bytes'] = span.child_maxrss
+            events.append({
+                'name': span.name,
+                'ph': 'X',
+                'ts': (span.start - self.origin) / 1000,
+                'dur': (span.end - span.start) / 1000,
+                'pid': pid,
+                'tid': span.thread_id,
+                'args': args,
+            })
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+    def records(self):
+        """Return the spans as plain lists, e.g. to send them to another process"""
+        return [[span.name, span.start - self.origin, span.end - self.origin, span.thread_id,
+                 span.child_cpu, span.child_maxrss] for span in self.spans]
+
+    @classmethod
+    def from_records(cls, records):
+        """Rebuild a tracer from records()"""
+        tracer = cls()
+        tracer.origin = 0
+        for name, start, end, thread_id, child_cpu, child_maxrss in records:
+            span = Span(tracer, name, child_cpu is not None)
+            span.start, span.end, span.thread_id = start, end, thread_id
+            span.child_cpu, span.child_maxrss = child_cpu, child_maxrss
+            tracer.spans.append(span)
+        return tracer
+
+    def export_chrome_trace(self, path):
+        """Write the trace to path; open it in chrome://tracing or ui.perfetto.dev"""
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.chrome_trace(), f)
+
+
+def _format_seconds(seconds):
+    if seconds < 1:
+        return f"{seconds * 1000:.0f} ms"
+    return f"{seconds:.2f} s"
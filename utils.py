@@ -2,6 +2,7 @@ import os
 import sys
 import shutil
 import subprocess
+from PyQt5.QtCore import QThread, pyqtSignal
 from PyQt5.QtWidgets import QMessageBox
 import tempfile
 
@@ -66,6 +67,14 @@ def check_latex_installation():
     
     return False, None
 
+class LatexProbeThread(QThread):
+    """Run check_latex_installation without blocking the GUI"""
+    probe_finished = pyqtSignal(bool, str)
+    
+    def run(self):
+        installed, path = check_latex_installation()
+        self.probe_finished.emit(installed, path or "")
+
 def show_latex_installation_dialog():
     """Show a dialog with instructions for installing LaTeX"""
     msg = QMessageBox()
@@ -98,8 +107,9 @@ def show_latex_installation_dialog():
 def create_temp_pdf():
     """Create a temporary file for PDF generation with improved reliability"""
     try:
-        # Create a temporary directory without spaces
-        temp_dir = tempfile.mkdtemp(prefix="latextemp_")
+        # Create a temporary directory without spaces, owned by the session workspace
+        from workspace import get_workspace
+        temp_dir = get_workspace().make_dir("latextemp_")
         
         # Use a simple filename without special characters
         temp_file = os.path.join(temp_dir, "preview.pdf")
@@ -0,0 +1,431 @@
+"""Fast variants: compile the full document once, then cut each variant out of it
+
+    python variants.py report.tex variants.json -o out/
+
+variants.json maps output file names to the components they include, e.g.
+{"client-a.pdf": ["Introduction", "Results"], "client-b.pdf": ["Results"]}.
+
+The master is compiled with page markers at every section heading, so the
+.aux file records which pages each section occupies. A variant is then
+assembled from those pages with qpdf (or pdfpages when qpdf is not
+installed). Pages keep the numbering, references and table of
+contents of the full document. A section that starts or ends mid-page
+shares that page with its neighbour; when such a boundary separates
+included from excluded text, that variant is compiled in full instead.
+
+Runs are incremental: each variant's inputs are fingerprinted and recorded
+in the output directory after it is built, so a later run only rebuilds
+variants whose inputs changed (or that an interrupted run did not reach).
+With --full every variant is compiled on its own, and its fingerprint
+covers just the preamble, the selected sections and the files they use.
+Fast variants are cut from the full document, so any edit rebuilds them.
+
+With --workers host:port,... the variants are compiled in full on remote
+build workers (see build_workers.py), as many at a time as they have slots.
+"""
+import os
+import re
+import sys
+import json
+import shutil
+import hashlib
+import argparse
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from assets import collect_assets, link_file
+from build_cache import InputDigests
+from build_workers import RemoteBuildThread, WorkerPool, parse_address
+from engine_runner import run_engine
+from latex_processor import LaTeXProcessingThread, place_file, set_class_option
+from page_estimate import learn_page_map
+from reference_graph import ReferenceGraph
+from section_index import BEGIN_DOCUMENT, SECTION_PATTERN, SectionIndex
+from workspace import get_workspace
+
+# Writes \lrcpage{<marker>}{<physical page>} to the .aux at shipout, plus the
+# total page count after the last page (LaTeX 2020-10 or newer)
+PAGE_MARKER_PREAMBLE = r"""
+\makeatletter
+\providecommand\lrcpage[2]{}
+\ifdefined\ReadonlyShipoutCounter
+  \def\lrc@page{\the\ReadonlyShipoutCounter}
+\else
+  \def\lrc@page{\the\c@page}
+\fi
+\newcommand\lrcpagemark[1]{\write\@auxout{\string\lrcpage{#1}{\lrc@page}}}
+\ifdefined\AddToHook
+  \AddToHook{enddocument/afterlastpage}{\immediate\write\@auxout{\string\lrcpage{total}{\lrc@page}}}
+\fi
+\makeatother
+"""
+MARKER_PATTERN = re.compile(r'\\lrcpage{([^}]*)}{(\d+)}')
+
+# Compiled masters kept per session
+MAX_MASTERS = 4
+
+# Fingerprints of the variants built so far, kept in the output directory
+STATE_FILE = '.variants-state.json'
+
+PDFPAGES_TEMPLATE = r"""\documentclass{article}
+\usepackage{pdfpages}
+\begin{document}
+\includepdf[pages={%s},fitpaper]{master.pdf}
+\end{document}
+"""
+
+
+def inject_page_markers(index):
+    """Return the document with page markers around every section heading
+
+    Marker e<i> closes unit i (0 is the text before the first heading) and
+    b<i> opens unit i, just before its heading (after it for chapters, which
+    always start a new page).
+    """
+    content = index.content
+    doc_start = index.body_start - len(BEGIN_DOCUMENT)
+    pieces = [content[:doc_start], PAGE_MARKER_PREAMBLE]
+    position = doc_start
+    for number, span in enumerate(index.spans, 1):
+        pieces.append(content[position:span.start])
+        pieces.append(f'\\lrcpagemark{{e{number - 1}}}')
+        if content.startswith('\\chapter', span.start):
+            # A chapter opens a new page, so its marker goes after the heading
+            heading_end = SECTION_PATTERN.match(content, span.start).end()
+            pieces.append(content[span.start:heading_end])
+            pieces.append(f'\\lrcpagemark{{b{number}}}')
+            position = heading_end
+        else:
+            # Before the heading, so a heading left at the foot of a page counts
+            # as sharing that page rather than falling outside both units
+            pieces.append(f'\\lrcpagemark{{b{number}}}')
+            position = span.start
+    pieces.append(content[position:index.body_end])
+    pieces.append(f'\\lrcpagemark{{e{len(index.spans)}}}')
+    pieces.append(content[index.body_end:])
+    return ''.join(pieces)
+
+
+def read_page_markers(aux_text):
+    """Return {marker: page} from the master's .aux file"""
+    return {name: int(page) for name, page in MARKER_PATTERN.findall(aux_text)}
+
+
+class PageMap:
+    """Page ranges of the front matter and of every section span of a document"""
+
+    def __init__(self, index, markers):
+        self.index = index
+        try:
+            self.units = [(1, markers['e0'])] + [
+                (markers[f'b{number}'], markers[f'e{number}'])
+                for number in range(1, len(index.spans) + 1)
+            ]
+        except KeyError:
+            raise ValueError("Page markers missing from the .aux file")
+
+        last = self.units[-1][1]
+        self.total = markers.get('total', last)
+        previous = 1
+        for first, end in self.units:
+            if first < previous or end < first:
+                raise ValueError("Page markers out of order")
+            previous = first
+        if self.total < last:
+            raise ValueError("Page markers beyond the last page")
+
+    def page_ranges(self, selected_components):
+        """Return [(first, last)] pages of a selection, or None if it cannot be cut out"""
+        included = {id(span) for span in self.index.included_spans(selected_components)}
+        # Front matter and trailing pages (e.g. floats flushed at the end) are always kept
+        flags = [True] + [id(span) in included for span in self.index.spans]
+        units = list(self.units)
+        if self.total > units[-1][1]:
+            units.append((units[-1][1] + 1, self.total))
+            flags.append(True)
+
+        for k in range(len(units) - 1):
+            if flags[k] != flags[k + 1] and units[k][1] >= units[k + 1][0]:
+                return None
+
+        ranges = []
+        for (first, last), keep in zip(units, flags):
+            if not keep:
+                continue
+            if ranges and first <= ranges[-1][1] + 1:
+                ranges[-1] = (ranges[-1][0], max(ranges[-1][1], last))
+            else:
+                ranges.append((first, last))
+        return ranges
+
+
+def page_spec(ranges):
+    return ','.join(f'{first}-{last}' if first != last else str(first) for first, last in ranges)
+
+
+def slice_pdf(master_pdf, ranges, output_pdf, pdflatex_path=None, env=None, limits=None, cancelled=None):
+    """Write the given page ranges of master_pdf to output_pdf; returns the tool used"""
+    workspace = get_workspace()
+    work_dir = workspace.make_dir("slice_", build=True)
+    try:
+        qpdf = shutil.which('qpdf')
+        if qpdf:
+            tool = 'qpdf'
+            result_pdf = os.path.join(work_dir, 'variant.pdf')
+            result = run_engine([qpdf, '--empty', '--pages', master_pdf, page_spec(ranges), '--', result_pdf],
+                                work_dir, env, limits, cancelled, tool)
+            # qpdf exits with 3 when it only had warnings
+            failed = result.returncode not in (0, 3)
+        else:
+            tool = 'pdfpages'
+            link_file(master_pdf, os.path.join(work_dir, 'master.pdf'))
+            with open(os.path.join(work_dir, 'variant.tex'), 'w', encoding='utf-8') as f:
+                f.write(PDFPAGES_TEMPLATE % page_spec(ranges))
+            result_pdf = os.path.join(work_dir, 'variant.pdf')
+            result = run_engine([pdflatex_path or 'pdflatex', '-interaction=nonstopmode', 'variant.tex'],
+                                work_dir, env, limits, cancelled, tool)
+            failed = result.returncode != 0
+
+        if failed or not os.path.exists(result_pdf):
+            output = result.stdout.decode('utf-8', errors='replace')
+            raise RuntimeError(f"{tool} could not assemble the variant:\n{output[-2000:]}")
+        place_file(result_pdf, output_pdf)
+        return tool
+    finally:
+        workspace.release(work_dir)
+
+
+class MasterBuild:
+    """A compiled full document with its page map"""
+
+    def __init__(self, directory, pdf, page_map):
+        self.directory = directory
+        self.pdf = pdf
+        self.page_map = page_map
+
+
+_masters = OrderedDict()
+_masters_lock = threading.Lock()
+# source directory -> InputDigests, so unchanged files are not re-read
+_input_digests = {}
+
+
+def master_key(content, source_dir, pdflatex_path):
+    """Identify a master by its source, the files it uses and the engine"""
+    digest = hashlib.sha256(content.encode('utf-8'))
+    digest.update(str(pdflatex_path).encode('utf-8'))
+    with _masters_lock:
+        digests = _input_digests.setdefault(source_dir, InputDigests(source_dir))
+    assets = collect_assets(content, source_dir)
+    for relative in assets.files + assets.bibliographies:
+        digest.update(f"\0{relative}\0{digests.digest(relative)}".encode('utf-8'))
+    return digest.hexdigest()
+
+
+class FastVariantThread(LaTeXProcessingThread):
+    """PDF build that cuts the selection out of a (cached) full compile"""
+    HISTORY_KIND = 'fast'
+
+    def build(self, content):
+        # Placeholders keep the figures' size, so the master's page map still holds
+        content = set_class_option(content, 'draft', self.draft_figures)
+        if self.order is not None:
+            # Reordered pages would keep the full document's numbering; compile instead
+            index = SectionIndex(content)
+            if index.ordered_spans(self.order) != index.spans:
+                print("Sections are reordered, compiling in full")
+                return super().build(content)
+        try:
+            master = self.master_build(content)
+        except ValueError as e:
+            print(f"Fast variants unavailable ({str(e)}), compiling in full")
+            return super().build(content)
+
+        with self.tracer.span("select pages"):
+            ranges = master.page_map.page_ranges(self.selected_components)
+        if ranges is None:
+            print("Selected sections share pages with excluded ones, compiling in full")
+            super().build(content)
+            return "PDF generated successfully (compiled in full: sections share pages)"
+        self.pages = sum(last - first + 1 for first, last in ranges)
+
+        output_pdf = os.path.splitext(self.output_file)[0] + '.pdf'
+        with self.tracer.span("slice", children=True):
+            slice_pdf(master.pdf, ranges, output_pdf, self.pdflatex_path,
+                      limits=self.limits, cancelled=self.isInterruptionRequested)
+        return "PDF generated successfully!"
+
+    def master_build(self, content):
+        """Return the compiled master for content, compiling it on first use"""
+        with self.tracer.span("fingerprint"):
+            key = master_key(content, self.source_dir, self.pdflatex_path)
+        with _masters_lock:
+            master = _masters.get(key)
+            if master is not None:
+                _masters.move_to_end(key)
+                self.tracer.count("master cache")
+                return master
+
+        with self.tracer.span("parse"):
+            index = SectionIndex(content)
+        workspace = get_workspace()
+        directory = workspace.make_dir("master_")
+        try:
+            pdf = os.path.join(directory, 'master.pdf')
+            aux = os.path.join(directory, 'master.aux')
+            self.compile_latex(inject_page_markers(index), output_pdf=pdf, aux_file=aux)
+            with open(aux, 'r', encoding='utf-8', errors='replace') as f:
+                page_map = PageMap(index, read_page_markers(f.read()))
+        except Exception:
+            workspace.release(directory)
+            raise
+
+        try:
+            learn_page_map(self.input_file, page_map, os.path.getsize(pdf))
+        except (OSError, ValueError) as e:
+            print(f"Could not record section page counts: {str(e)}")
+
+        master = MasterBuild(directory, pdf, page_map)
+        with _masters_lock:
+            _masters[key] = master
+            while len(_masters) > MAX_MASTERS:
+                _, old = _masters.popitem(last=False)
+                workspace.release(old.directory)
+        return master
+
+
+def variant_fingerprint(index, selected_components, digests, pdflatex_path, fast):
+    """Hash everything a variant's PDF is built from"""
+    if fast:
+        # Pages are cut from the full document, so every section counts
+        document = index.content
+    else:
+        document = index.render(selected_components)
+    digest = hashlib.sha256(document.encode('utf-8'))
+    digest.update(json.dumps([sorted(selected_components), str(pdflatex_path), fast]).encode('utf-8'))
+    assets = collect_assets(document, digests.source_dir)
+    for relative in assets.files + assets.bibliographies:
+        digest.update(f"\0{relative}\0{digests.digest(relative)}".encode('utf-8'))
+    return digest.hexdigest()
+
+
+def load_state(output_dir):
+    try:
+        with open(os.path.join(output_dir, STATE_FILE), 'r', encoding='utf-8') as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        state = {}
+    state.setdefault('variants', {})
+    state.setdefault('files', {})
+    return state
+
+
+def save_state(output_dir, state):
+    """Write the state atomically; called after every variant as a checkpoint"""
+    path = os.path.join(output_dir, STATE_FILE)
+    partial = f"{path}.{os.getpid()}.part"
+    with open(partial, 'w', encoding='utf-8') as f:
+        json.dump(state, f, indent=1)
+    os.replace(partial, path)
+
+
+def up_to_date(record, fingerprint, output_pdf):
+    """True if the recorded build matches fingerprint and its PDF is still there"""
+    if not record or record.get('fingerprint') != fingerprint:
+        return False
+    try:
+        return os.path.getsize(output_pdf) == record.get('size')
+    except OSError:
+        return False
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build many PDF variants from one compile")
+    parser.add_argument('input', help="master LaTeX file")
+    parser.add_argument('variants', help="JSON file mapping output names to component lists")
+    parser.add_argument('-o', '--output-dir', default='.')
+    parser.add_argument('--engine', help="pdflatex executable")
+    parser.add_argument('--full', action='store_true',
+                        help="compile every variant on its own instead of cutting it from the full document")
+    parser.add_argument('--force', action='store_true', help="rebuild variants even if they are up to date")
+    parser.add_argument('--workers', help="compile on these build workers (host:port,...); implies --full")
+    args = parser.parse_args(argv)
+    pool = None
+    if args.workers:
+        pool = WorkerPool([parse_address(item) for item in args.workers.split(',') if item.strip()],
+                          os.environ.get('LRC_WORKER_TOKEN') or None)
+        args.full = True
+
+    with open(args.variants, 'r', encoding='utf-8') as f:
+        variants = json.load(f)
+    with open(args.input, 'r', encoding='utf-8') as f:
+        index = SectionIndex(f.read())
+    os.makedirs(args.output_dir, exist_ok=True)
+
+    state = load_state(args.output_dir)
+    digests = InputDigests(os.path.dirname(os.path.abspath(args.input)), state['files'])
+    # Variants no longer in the manifest are forgotten
+    state['variants'] = {name: record for name, record in state['variants'].items() if name in variants}
+    build_class = LaTeXProcessingThread if args.full else FastVariantThread
+    references = ReferenceGraph(index)
+
+    built = skipped = failures = 0
+    pending = []
+    for name, components in variants.items():
+        output_file = os.path.join(args.output_dir, name)
+        output_pdf = os.path.splitext(output_file)[0] + '.pdf'
+        fingerprint = variant_fingerprint(index, components, digests, args.engine, not args.full)
+        if not args.force and up_to_date(state['variants'].get(name), fingerprint, output_pdf):
+            print(f"{name}: up to date")
+            skipped += 1
+            continue
+
+        references.set_selection(components)
+        for line in references.describe_broken(limit=3):
+            print(f"{name}: warning: {line} is excluded")
+        pending.append((name, components, output_file, output_pdf, fingerprint))
+
+    def build_variant(name, components, output_file):
+        results = []
+        if pool is not None:
+            thread = RemoteBuildThread(args.input, output_file, components, args.engine, pool=pool)
+        else:
+            thread = build_class(args.input, output_file, components, args.engine)
+        thread.finished_signal.connect(lambda success, message: results.append((success, message)))
+        thread.run()
+        success, message = results[0] if results else (False, "no result")
+        if thread.regression:
+            message += f" (slower than usual: {thread.regression})"
+        return success, message, thread.tracer
+
+    def record(name, output_pdf, fingerprint, success, message, tracer):
+        nonlocal built, failures
+        print(f"{name}: {message} ({tracer.summary(2)})")
+        if success:
+            built += 1
+            state['variants'][name] = {'fingerprint': fingerprint, 'size': os.path.getsize(output_pdf)}
+        else:
+            failures += 1
+            state['variants'].pop(name, None)
+        save_state(args.output_dir, state)
+
+    if pool is not None and pool.probe():
+        # Results are recorded here, on the main thread, as builds finish
+        with ThreadPoolExecutor(max_workers=max(1, pool.total_slots())) as executor:
+            futures = {executor.submit(build_variant, name, components, output_file):
+                       (name, output_pdf, fingerprint)
+                       for name, components, output_file, output_pdf, fingerprint in pending}
+            for future in as_completed(futures):
+                record(*futures[future], *future.result())
+    else:
+        for name, components, output_file, output_pdf, fingerprint in pending:
+            record(name, output_pdf, fingerprint, *build_variant(name, components, output_file))
+
+    save_state(args.output_dir, state)
+    print(f"{built} built, {skipped} up to date, {failures} failed")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
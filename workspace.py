@@ -0,0 +1,254 @@
+import os
+import sys
+import time
+import atexit
+import shutil
+import tempfile
+import threading
+
+APP_DIR = "latex-report-customizer"
+SESSION_PREFIX = "session-"
+OWNER_FILE = "owner"
+
+# Defaults, overridable with LRC_SCRATCH_QUOTA / LRC_SCRATCH_DIR / LRC_SCRATCH_TMPFS
+DEFAULT_QUOTA = 2 * 1024 ** 3
+# Sessions whose owner cannot be checked (Windows, no owner file) are stale after a day
+STALE_AGE = 24 * 60 * 60
+# Build dirs only go to tmpfs when this much memory would still be free
+TMPFS_HEADROOM = 1024 ** 3
+TMPFS_ROOT = '/dev/shm'
+# Share of the quota build dirs on tmpfs may hold; a build growing past it moves to disk
+TMPFS_SHARE = 0.25
+
+
+class WorkspaceQuotaExceeded(RuntimeError):
+    """Raised when scratch space usage would exceed the configured quota"""
+
+
+class TmpfsFull(WorkspaceQuotaExceeded):
+    """Raised when a build dir on tmpfs outgrew its share of the quota"""
+
+
+def parse_size(text):
+    """Parse a byte count such as '500M' or '2G'"""
+    text = text.strip().upper()
+    units = {'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
+    if text and text[-1] in units:
+        return int(float(text[:-1]) * units[text[-1]])
+    return int(text)
+
+
+def directory_size(path):
+    """Total size of the regular files below path; symlinked assets are not counted"""
+    total = 0
+    try:
+        entries = list(os.scandir(path))
+    except OSError:
+        return 0
+    for entry in entries:
+        try:
+            if entry.is_dir(follow_symlinks=False):
+                total += directory_size(entry.path)
+            elif entry.is_file(follow_symlinks=False):
+                total += entry.stat(follow_symlinks=False).st_size
+        except OSError:
+            pass
+    return total
+
+
+def available_memory():
+    """Bytes of memory available without swapping, or None if unknown"""
+    try:
+        with open('/proc/meminfo', 'r') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def _user_dir(name):
+    """Per-user name for a directory in a location every user shares, such as /tmp"""
+    if hasattr(os, 'getuid'):
+        return f"{name}-{os.getuid()}"
+    return name
+
+
+def _make_private_root(root):
+    """Create root readable by this user only, refusing a directory another user owns"""
+    os.makedirs(root, mode=0o700, exist_ok=True)
+    if hasattr(os, 'getuid') and os.stat(root).st_uid != os.getuid():
+        raise PermissionError(f"Scratch directory {root} belongs to another user")
+
+
+def _pid_alive(pid):
+    """True/False on POSIX; None where liveness cannot be checked safely"""
+    if sys.platform == 'win32':
+        # os.kill(pid, 0) would send CTRL_C_EVENT on Windows
+        return None
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    except OSError:
+        return False
+    return True
+
+
+class Workspace:
+    """Owns all scratch directories of one application session
+
+    Every temporary directory is created inside a per-session directory, so
+    whatever a crashed session leaves behind can be found and removed by the
+    next one, and the total can be checked against a byte quota.
+    """
+
+    def __init__(self, root=None, quota=None, use_tmpfs=None):
+        env = os.environ
+        root = root or env.get('LRC_SCRATCH_DIR') or os.path.join(tempfile.gettempdir(), _user_dir(APP_DIR))
+        if quota is None:
+            quota = parse_size(env['LRC_SCRATCH_QUOTA']) if env.get('LRC_SCRATCH_QUOTA') else DEFAULT_QUOTA
+        if use_tmpfs is None:
+            use_tmpfs = env.get('LRC_SCRATCH_TMPFS', '1') != '0'
+
+        self.quota = quota
+        self.roots = [root]
+        self.session_dirs = [self._create_session(root)]
+        self.build_dir = self.session_dirs[0]
+        self.tmpfs_dir = None
+
+        # Build dirs are small and short-lived; keep them in RAM when it is plentiful
+        if use_tmpfs and self._tmpfs_usable():
+            tmpfs_root = os.path.join(TMPFS_ROOT, _user_dir(APP_DIR))
+            try:
+                self.build_dir = self.tmpfs_dir = self._create_session(tmpfs_root)
+                self.roots.append(tmpfs_root)
+                self.session_dirs.append(self.build_dir)
+            except OSError:
+                pass
+
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def _create_session(self, root):
+        _make_private_root(root)
+        path = tempfile.mkdtemp(prefix=f"{SESSION_PREFIX}{os.getpid()}-", dir=root)
+        with open(os.path.join(path, OWNER_FILE), 'w') as f:
+            f.write(str(os.getpid()))
+        return path
+
+    def _tmpfs_usable(self):
+        if not os.path.isdir(TMPFS_ROOT) or not os.access(TMPFS_ROOT, os.W_OK):
+            return False
+        memory = available_memory()
+        return memory is not None and memory > self.quota + TMPFS_HEADROOM
+
+    def usage(self):
+        """Bytes currently used by this session's scratch directories"""
+        return sum(directory_size(path) for path in self.session_dirs)
+
+    def make_dir(self, prefix="scratch_", build=False):
+        """Create a new scratch directory; build=True places it on tmpfs when enabled"""
+        with self._lock:
+            used = self.usage()
+            if used >= self.quota:
+                raise WorkspaceQuotaExceeded(
+                    f"Scratch space quota exceeded ({used} of {self.quota} bytes in use)"
+                )
+            parent = self.build_dir if build else self.session_dirs[0]
+            return tempfile.mkdtemp(prefix=prefix, dir=parent)
+
+    def check_usage(self, path):
+        """Raise if scratch space is over quota now that path (a scratch dir) has grown
+
+        TmpfsFull means path is on tmpfs and tmpfs holds more than its share;
+        later builds then go to disk.
+        """
+        used = self.usage()
+        if used > self.quota:
+            raise WorkspaceQuotaExceeded(f"Scratch space quota exceeded ({used} of {self.quota} bytes in use)")
+        if self.tmpfs_dir is not None and os.path.abspath(path).startswith(self.tmpfs_dir + os.sep):
+            used = directory_size(self.tmpfs_dir)
+            if used > self.quota * TMPFS_SHARE:
+                self.build_dir = self.session_dirs[0]
+                raise TmpfsFull(f"Build files outgrew tmpfs ({used} bytes)")
+
+    def release(self, path):
+        """Delete a scratch directory (or file) created by this workspace"""
+        if not path or not self.owns(path):
+            return
+        if os.path.isdir(path) and not os.path.islink(path):
+            shutil.rmtree(path, ignore_errors=True)
+        elif os.path.lexists(path):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def owns(self, path):
+        """True if path lies inside one of this session's directories"""
+        path = os.path.abspath(path)
+        return any(path.startswith(session + os.sep) for session in self.session_dirs)
+
+    def cleanup_stale(self):
+        """Remove session directories left behind by sessions that are gone
+
+        Returns the number of bytes reclaimed.
+        """
+        reclaimed = 0
+        now = time.time()
+        for root in self.roots:
+            try:
+                entries = list(os.scandir(root))
+            except OSError:
+                continue
+            for entry in entries:
+                if not entry.name.startswith(SESSION_PREFIX) or entry.path in self.session_dirs:
+                    continue
+                if self._is_stale(entry.path, now):
+                    reclaimed += directory_size(entry.path)
+                    shutil.rmtree(entry.path, ignore_errors=True)
+        return reclaimed
+
+    def _is_stale(self, path, now):
+        try:
+            with open(os.path.join(path, OWNER_FILE), 'r') as f:
+                pid = int(f.read().strip())
+        except (OSError, ValueError):
+            pid = None
+
+        # Without an owner (yet: a session that is starting writes it just
+        # after creating its directory) only the age tells
+        alive = _pid_alive(pid) if pid else None
+        if alive is None:
+            try:
+                return now - os.path.getmtime(path) > STALE_AGE
+            except OSError:
+                return False
+        return not alive
+
+    def close(self):
+        """Remove everything this session created"""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+        for path in self.session_dirs:
+            shutil.rmtree(path, ignore_errors=True)
+
+
+_workspace = None
+_workspace_lock = threading.Lock()
+
+
+def get_workspace():
+    """Return the process-wide workspace, creating it on first use"""
+    global _workspace
+    with _workspace_lock:
+        if _workspace is None:
+            _workspace = Workspace()
+            atexit.register(_workspace.close)
+        return _workspace